@@ -3,6 +3,10 @@ ASGI config for palmaraie_bst project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+The server-sent events stream (``/api/evenements/``) is an async view: serve
+it through this application (e.g. ``uvicorn palmaraie_bst.asgi:application``)
+so open streams do not each hold a worker.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/5.1/howto/deployment/asgi/
 """
@@ -13,6 +13,8 @@ https://docs.djangoproject.com/en/5.1/ref/settings/
 import os
 from pathlib import Path
 
+from corsheaders.defaults import default_headers
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -47,11 +49,14 @@ INSTALLED_APPS = [
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
+    'palmier.compression.CompressionMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'palmier.profilage.ProfilageMiddleware',
+    'palmier.routers.ReplicaPinningMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -80,13 +85,26 @@ WSGI_APPLICATION = 'palmaraie_bst.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
+# palmier.backends.sqlite3 : SQLite en WAL avec pragmas réglés (voir le module)
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
+        'ENGINE': 'palmier.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
     }
 }
 
+# Réplica en lecture optionnel pour les statistiques (ex. : REPLICA_SQLITE=replica.sqlite3)
+if os.getenv('REPLICA_SQLITE'):
+    DATABASES['replica'] = {
+        'ENGINE': 'palmier.backends.sqlite3',
+        'NAME': BASE_DIR / os.getenv('REPLICA_SQLITE'),
+        'TEST': {'MIRROR': 'default'},
+    }
+
+DATABASE_ROUTERS = ['palmier.routers.ReplicaRouter']
+
+REPLICA_LAG_TOLERANCE = int(os.getenv('REPLICA_LAG_TOLERANCE', 5))
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -130,6 +148,19 @@ STATICFILES_DIRS = []  # On retire le dossier frontend/build/static pour le mome
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Rapports en arrière-plan
+RAPPORTS_WORKERS = 2
+RAPPORTS_DUREE_MAX_MINUTES = 60
+
+# Synchronisation incrémentale (?since=)
+SYNCHRO_RETENTION_JOURS = 30
+
+# Durée de vie des clés Idempotency-Key
+IDEMPOTENCE_TTL_HEURES = 24
+
+# Compression gzip/brotli des réponses de l'API à partir de cette taille (octets)
+COMPRESSION_TAILLE_MIN = 1024
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
 
@@ -137,6 +168,8 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 # CORS settings
 CORS_ALLOW_ALL_ORIGINS = True  # À configurer en production
+CORS_ALLOW_HEADERS = (*default_headers, 'idempotency-key', 'x-profile')
+CORS_EXPOSE_HEADERS = ['Idempotent-Replayed', 'X-Profile-Report']
 
 # REST Framework settings
 REST_FRAMEWORK = {
@@ -1,3 +1,88 @@
 from django.contrib import admin
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+from .models import Plantation, Operation, Production, Vente, MouvementCaisse, TacheRapport, Client
 
-# Register your models here.
+
+class ComptageEstimePaginator(Paginator):
+    """
+    Sur PostgreSQL, une liste non filtrée utilise l'estimation du planificateur
+    (``pg_class.reltuples``) au lieu d'un ``COUNT(*)`` sur toute la table.
+    """
+
+    @cached_property
+    def count(self):
+        query = self.object_list.query
+        connexion = connections[self.object_list.db]
+        if connexion.vendor == 'postgresql' and not query.where:
+            with connexion.cursor() as cursor:
+                cursor.execute(
+                    'SELECT reltuples::bigint FROM pg_class WHERE relname = %s',
+                    [self.object_list.model._meta.db_table]
+                )
+                ligne = cursor.fetchone()
+            if ligne and ligne[0] > 0:
+                return ligne[0]
+        return super().count
+
+
+class PalmierAdmin(admin.ModelAdmin):
+    paginator = ComptageEstimePaginator
+    show_full_result_count = False
+
+
+@admin.register(Plantation)
+class PlantationAdmin(PalmierAdmin):
+    list_display = ('nom', 'superficie', 'nombre_arbres', 'localisation', 'date_plantation')
+    search_fields = ('nom',)
+
+
+@admin.register(Operation)
+class OperationAdmin(PalmierAdmin):
+    list_display = ('type_operation', 'plantation', 'date', 'cout')
+    list_select_related = ('plantation',)
+    list_filter = ('type_operation',)
+    autocomplete_fields = ('plantation',)
+    date_hierarchy = 'date'
+
+
+@admin.register(Production)
+class ProductionAdmin(PalmierAdmin):
+    list_display = ('plantation', 'date_recolte', 'qualite', 'quantite', 'poids_total', 'stock_disponible')
+    list_select_related = ('plantation',)
+    list_filter = ('qualite',)
+    autocomplete_fields = ('plantation',)
+    date_hierarchy = 'date_recolte'
+
+
+@admin.register(Client)
+class ClientAdmin(PalmierAdmin):
+    list_display = ('nom', 'nombre_achats', 'quantite_totale', 'chiffre_affaires', 'dernier_achat')
+    search_fields = ('nom',)
+    readonly_fields = ('chiffre_affaires', 'quantite_totale', 'nombre_achats', 'dernier_achat')
+
+
+@admin.register(Vente)
+class VenteAdmin(PalmierAdmin):
+    list_display = ('client', 'production', 'date_vente', 'quantite', 'prix_unitaire', 'montant_total')
+    list_select_related = ('client', 'production__plantation')
+    search_fields = ('client__nom',)
+    autocomplete_fields = ('client',)
+    # Saisie de l'identifiant : pas de <select> sur toutes les productions
+    raw_id_fields = ('production',)
+    date_hierarchy = 'date_vente'
+
+
+@admin.register(MouvementCaisse)
+class MouvementCaisseAdmin(PalmierAdmin):
+    list_display = ('date', 'type_mouvement', 'montant', 'description')
+    list_filter = ('type_mouvement',)
+    date_hierarchy = 'date'
+
+
+@admin.register(TacheRapport)
+class TacheRapportAdmin(PalmierAdmin):
+    list_display = ('type_rapport', 'statut', 'date_creation', 'date_fin')
+    list_filter = ('statut',)
+    readonly_fields = ('date_creation', 'date_debut', 'date_fin')
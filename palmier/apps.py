@@ -4,3 +4,10 @@ from django.apps import AppConfig
 class PalmierConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'palmier'
+
+    def ready(self):
+        from django.core.signals import request_started
+
+        from . import signals, taches  # noqa: F401
+        # Pas de requête SQL dans ready() : la reprise des tâches attend la première requête
+        request_started.connect(taches.reprendre, dispatch_uid=taches.REPRISE)
@@ -0,0 +1,50 @@
+"""
+Backend SQLite réglé pour un déploiement mono-serveur.
+
+Les pragmas sont appliqués à chaque nouvelle connexion :
+
+- ``journal_mode=WAL`` : les lectures ne bloquent plus les écritures ;
+- ``synchronous=NORMAL`` : plus de fsync à chaque commit, seulement aux
+  checkpoints (sûr en WAL, seule une coupure système peut perdre les
+  dernières transactions) ;
+- ``busy_timeout`` : un worker attend le verrou au lieu d'échouer avec
+  « database is locked » ;
+- ``cache_size`` / ``mmap_size`` : pages chaudes en mémoire.
+
+Chaque pragma peut être surchargé via ``OPTIONS['pragmas']``.
+"""
+from django.db.backends.sqlite3 import base
+
+PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 5000,       # ms
+    'cache_size': -64000,       # Ko (valeur négative), soit 64 Mo
+    'mmap_size': 268435456,     # 256 Mo
+    'temp_store': 'MEMORY',
+}
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Positionné par palmier.transactions.transaction_stock
+        self.begin_immediate = False
+
+    def get_connection_params(self):
+        kwargs = super().get_connection_params()
+        kwargs.pop('pragmas', None)
+        return kwargs
+
+    def get_new_connection(self, conn_params):
+        conn = super().get_new_connection(conn_params)
+        pragmas = {**PRAGMAS, **self.settings_dict['OPTIONS'].get('pragmas', {})}
+        for nom, valeur in pragmas.items():
+            conn.execute(f'PRAGMA {nom} = {valeur}')
+        return conn
+
+    def _start_transaction_under_autocommit(self):
+        # BEGIN IMMEDIATE prend le verrou d'écriture dès le début : deux
+        # transactions différées qui passent en écriture en même temps
+        # échoueraient sinon avec « database is locked » sans attendre.
+        self.cursor().execute('BEGIN IMMEDIATE' if self.begin_immediate else 'BEGIN')
@@ -0,0 +1,131 @@
+"""
+Compression des réponses de l'API (gzip ou brotli, selon ``Accept-Encoding``).
+
+Seules les réponses textuelles (JSON, CSV...) sous ``COMPRESSION_PREFIXES``
+(``/api/``) sont compressées, à partir de ``COMPRESSION_TAILLE_MIN`` octets :
+en deçà, l'en-tête gzip et le temps CPU coûtent plus qu'ils ne font gagner.
+Les réponses en flux (exports CSV, rapport annuel) sont compressées morceau
+par morceau, sans être mises en mémoire ; le flux SSE des événements et les
+fichiers déjà compressés (xlsx) sont laissés tels quels.
+
+Niveaux réglés pour du contenu dynamique : sur une page de ventes, brotli 11
+gagne encore 20 % d'octets sur brotli 4 mais coûte une centaine de fois plus
+de CPU (80 ms contre moins d'1 ms) ; gzip 6 est le niveau par défaut de zlib.
+Mesures par point de l'API : ``manage.py bench_compression``.
+"""
+import zlib
+
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+
+try:
+    import brotli
+except ImportError:  # brotli est optionnel : gzip seul
+    brotli = None
+
+TYPES_COMPRESSIBLES = ('application/json', 'text/csv', 'text/plain', 'text/html', 'application/javascript')
+
+
+def prefixes():
+    return getattr(settings, 'COMPRESSION_PREFIXES', ('/api/',))
+
+
+def taille_min():
+    return getattr(settings, 'COMPRESSION_TAILLE_MIN', 1024)
+
+
+def niveau_brotli():
+    return getattr(settings, 'COMPRESSION_NIVEAU_BROTLI', 4)
+
+
+def niveau_gzip():
+    return getattr(settings, 'COMPRESSION_NIVEAU_GZIP', 6)
+
+
+def negocier(accept_encoding):
+    """``br``, ``gzip`` ou ``None`` d'après ``Accept-Encoding`` (valeurs ``q=0`` exclues)."""
+    acceptes = set()
+    for valeur in accept_encoding.split(','):
+        codage, _, parametres = valeur.strip().partition(';')
+        try:
+            q = float(parametres.strip()[2:]) if parametres.strip().startswith('q=') else 1.0
+        except ValueError:
+            q = 1.0
+        if q > 0:
+            acceptes.add(codage.strip().lower())
+    if brotli is not None and 'br' in acceptes:
+        return 'br'
+    if 'gzip' in acceptes:
+        return 'gzip'
+    return None
+
+
+def compresseur(codage):
+    """Objet ``process(morceau)`` / ``finir()`` du codage demandé."""
+    if codage == 'br':
+        objet = brotli.Compressor(quality=niveau_brotli(), mode=brotli.MODE_TEXT)
+        return objet.process, objet.finish
+    # wbits=31 : en-tête et somme de contrôle gzip
+    objet = zlib.compressobj(niveau_gzip(), zlib.DEFLATED, 31)
+    return objet.compress, objet.flush
+
+
+def compresser(contenu, codage):
+    process, finir = compresseur(codage)
+    return process(contenu) + finir()
+
+
+def compresser_flux(morceaux, codage):
+    process, finir = compresseur(codage)
+    for morceau in morceaux:
+        sortie = process(morceau)
+        if sortie:
+            yield sortie
+    yield finir()
+
+
+def compressible(request, response):
+    if response.has_header('Content-Encoding') or response.status_code in (204, 304):
+        return False
+    if not request.path.startswith(tuple(prefixes())):
+        return False
+    if response.streaming and response.is_async:
+        # Flux d'événements : chaque message doit partir aussitôt
+        return False
+    type_contenu = response.get('Content-Type', '').split(';')[0].strip()
+    return type_contenu in TYPES_COMPRESSIBLES
+
+
+class CompressionMiddleware:
+    """À placer en tête de ``MIDDLEWARE`` (juste après WhiteNoise, qui compresse déjà ses fichiers)."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if not compressible(request, response):
+            return response
+        if not response.streaming and len(response.content) < taille_min():
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        codage = negocier(request.headers.get('Accept-Encoding', ''))
+        if codage is None:
+            return response
+
+        if response.streaming:
+            response.streaming_content = compresser_flux(response.streaming_content, codage)
+            del response.headers['Content-Length']
+        else:
+            contenu = compresser(response.content, codage)
+            if len(contenu) >= len(response.content):
+                return response
+            response.content = contenu
+            response.headers['Content-Length'] = str(len(contenu))
+
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response.headers['ETag'] = 'W/' + etag
+        response.headers['Content-Encoding'] = codage
+        return response
@@ -0,0 +1,172 @@
+"""
+Distributions (percentiles et histogrammes) sur les productions et les ventes.
+
+Les colonnes utiles sont lues en flux par ``values_list().iterator()`` —
+sans instancier de modèles, valeurs converties en flottants et lignes
+incomplètes écartées dans la requête — et versées au fil de la lecture
+dans des tableaux NumPy (``np.fromiter``) : seul un lot de tuples existe
+à la fois côté Python, le reste tient en quelques octets par ligne, même
+sur des millions de récoltes. Les percentiles et histogrammes de chaque groupe (plantation,
+qualité ou mois) sont calculés en une passe sur les tableaux triés.
+"""
+import numpy as np
+from django.db.models import Case, ExpressionWrapper, F, FloatField, Func, IntegerField, Value, When
+from django.db.models.functions import Cast
+
+from .models import Plantation, Production
+
+TAILLE_LOT = 50_000
+QUANTILES = {'p10': 0.1, 'p50': 0.5, 'p90': 0.9}
+CLASSES_DEFAUT = 20
+CLASSES_MAX = 100
+GROUPES = ('plantation', 'qualite', 'mois')
+ETENDUE_COMPTAGE = 10_000_000
+
+
+def en_flottant(champ):
+    return Cast(champ, FloatField())
+
+
+class CleMois(Func):
+    """Mois ``AAAAMM`` entier, calculé par les fonctions natives de la base."""
+    template = 'CAST(EXTRACT(YEAR FROM %(expressions)s) * 100 + EXTRACT(MONTH FROM %(expressions)s) AS INTEGER)'
+    output_field = IntegerField()
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        # Extract* passe par des fonctions Python sur SQLite : strftime reste en C
+        return self.as_sql(
+            compiler, connection,
+            template="CAST(strftime('%%%%Y%%%%m', %(expressions)s) AS INTEGER)",
+            **extra_context
+        )
+
+
+def rendement_par_arbre(prefixe=''):
+    return ExpressionWrapper(
+        en_flottant(f'{prefixe}poids_total') / F(f'{prefixe}plantation__nombre_arbres'),
+        output_field=FloatField()
+    )
+
+
+def expression_groupe(groupe, champ_plantation, champ_qualite, champ_date):
+    """Clé de groupe entière calculée par la base."""
+    if groupe == 'plantation':
+        return F(champ_plantation)
+    if groupe == 'qualite':
+        return Case(
+            *[When(**{champ_qualite: code}, then=Value(i)) for i, (code, _) in enumerate(Production.QUALITE_CHOICES)],
+            output_field=IntegerField()
+        )
+    return CleMois(champ_date)
+
+
+def colonnes(queryset, valeur, groupe=None, taille_lot=TAILLE_LOT):
+    """Tableaux ``(valeurs, groupes)`` lus en flux ; ``groupes`` vaut 0 sans regroupement."""
+    expressions = {'valeur_distribution': valeur}
+    if groupe is not None:
+        expressions['groupe_distribution'] = groupe
+    lignes = queryset.order_by().annotate(**expressions).filter(
+        **{f'{nom}__isnull': False for nom in expressions}
+    ).values_list(*expressions, flat=groupe is None).iterator(chunk_size=taille_lot)
+    if groupe is None:
+        valeurs = np.fromiter(lignes, dtype=float)
+        return valeurs, np.zeros(len(valeurs), dtype=np.int64)
+    # Une ligne (valeur, groupe) par élément : tableau n x 2 rempli sans liste intermédiaire
+    tableau = np.fromiter(lignes, dtype=np.dtype((float, 2)))
+    return tableau[:, 0], tableau[:, 1].astype(np.int64)
+
+
+def _resume(valeurs_triees, debuts, effectifs, bornes):
+    """Statistiques de chaque groupe (valeurs triées par groupe puis par valeur)."""
+    fins = debuts + effectifs
+    resultat = {
+        'n': effectifs,
+        'min': valeurs_triees[debuts],
+        'max': valeurs_triees[fins - 1],
+        'moyenne': np.add.reduceat(valeurs_triees, debuts) / effectifs,
+    }
+    # Percentile à interpolation linéaire (méthode par défaut de numpy.percentile)
+    for nom, quantile in QUANTILES.items():
+        position = debuts + quantile * (effectifs - 1)
+        bas = np.floor(position).astype(np.int64)
+        haut = np.ceil(position).astype(np.int64)
+        resultat[nom] = valeurs_triees[bas] + (valeurs_triees[haut] - valeurs_triees[bas]) * (position - bas)
+
+    nb_classes = len(bornes) - 1
+    classes = np.clip(np.searchsorted(bornes, valeurs_triees, side='right') - 1, 0, nb_classes - 1)
+    index_groupe = np.repeat(np.arange(len(debuts)), effectifs)
+    resultat['histogramme'] = np.bincount(
+        index_groupe * nb_classes + classes, minlength=len(debuts) * nb_classes
+    ).reshape(len(debuts), nb_classes)
+    return resultat
+
+
+def _ligne(resume, i):
+    return {
+        'n': int(resume['n'][i]),
+        **{cle: round(float(resume[cle][i]), 4) for cle in ('min', 'max', 'moyenne', *QUANTILES)},
+        'histogramme': resume['histogramme'][i].tolist(),
+    }
+
+
+def codes_groupes(groupes):
+    """Clés distinctes et code dense de chaque ligne (par comptage si les clés sont proches)."""
+    minimum = groupes.min()
+    decalage = groupes - minimum
+    if decalage.max() < ETENDUE_COMPTAGE:
+        presents = np.bincount(decalage) > 0
+        return np.flatnonzero(presents) + minimum, (np.cumsum(presents) - 1)[decalage]
+    return np.unique(groupes, return_inverse=True)
+
+
+def distribution(valeurs, groupes, classes=CLASSES_DEFAUT, libelles=None):
+    """Résumé global et par groupe, avec des classes d'histogramme communes."""
+    if not len(valeurs):
+        return {'n': 0, 'bornes': [], 'groupes': []}
+    bornes = np.histogram_bin_edges(valeurs, bins=classes)
+
+    # Tri par valeur puis tri stable par groupe : codes sur 16 bits -> tri par base
+    cles, codes = codes_groupes(groupes)
+    if len(cles) < 2 ** 16:
+        codes = codes.astype(np.uint16)
+    ordre = np.argsort(valeurs)
+    triees = valeurs[ordre]
+    ordre = ordre[np.argsort(codes[ordre], kind='stable')]
+    effectifs = np.bincount(codes, minlength=len(cles))
+
+    ensemble = _resume(triees, np.array([0]), np.array([len(valeurs)]), bornes)
+    par_groupe = _resume(valeurs[ordre], np.cumsum(effectifs) - effectifs, effectifs, bornes)
+
+    libelles = libelles or {}
+    return {
+        **_ligne(ensemble, 0),
+        'bornes': np.round(bornes, 4).tolist(),
+        'groupes': [
+            {'groupe': libelles.get(int(cle), int(cle)), **_ligne(par_groupe, i)}
+            for i, cle in enumerate(cles)
+        ],
+    }
+
+
+def libelles_groupe(groupe, cles, using='default'):
+    if groupe == 'plantation':
+        return dict(Plantation.objects.using(using).filter(pk__in=cles.tolist()).values_list('pk', 'nom'))
+    if groupe == 'qualite':
+        return {i: code for i, (code, _) in enumerate(Production.QUALITE_CHOICES)}
+    return {int(cle): f'{cle // 100}-{cle % 100:02d}' for cle in cles}
+
+
+def distributions(queryset, metriques, groupe=None, classes=CLASSES_DEFAUT, **champs):
+    """
+    ``metriques`` : nom -> expression de la valeur ; ``champs`` : chemins
+    ``champ_plantation``, ``champ_qualite`` et ``champ_date`` du modèle.
+    """
+    expression = expression_groupe(groupe, **champs) if groupe else None
+    resultat = {'groupe': groupe}
+    for nom, valeur in metriques.items():
+        valeurs, groupes = colonnes(queryset, valeur, expression)
+        libelles = libelles_groupe(groupe, np.unique(groupes), queryset.db) if groupe else None
+        resultat[nom] = distribution(valeurs, groupes, classes, libelles)
+        if not groupe:
+            resultat[nom].pop('groupes', None)
+    return resultat
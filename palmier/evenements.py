@@ -0,0 +1,131 @@
+"""
+Flux SSE des changements de stock, de ventes et de caisse.
+
+Les signaux de ``palmier.signals`` publient un événement compact après la
+validation de chaque écriture ; le ``Diffuseur`` le transmet aux flux SSE
+ouverts dans le même processus. Le flux est une vue asynchrone : servie par
+l'application ASGI (``palmaraie_bst.asgi``), une connexion ouverte n'occupe
+pas de worker.
+
+Le diffuseur est local au processus : avec plusieurs workers, un client ne
+reçoit que les écritures faites par le worker qui sert son flux.
+"""
+import asyncio
+import itertools
+import json
+import threading
+from collections import deque
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+
+INTERVALLE_KEEPALIVE = 15  # secondes
+TAILLE_FILE = 256
+TAILLE_HISTORIQUE = 1000
+
+CHAMPS_EVENEMENT = {
+    'vente': ['production_id', 'date_vente', 'quantite', 'montant_total'],
+    'production': ['plantation_id', 'qualite', 'poids_total', 'stock_disponible'],
+    'mouvementcaisse': ['date', 'type_mouvement', 'montant'],
+}
+
+
+def evenement(instance, action):
+    """Événement compact décrivant une écriture sur ``instance``."""
+    type_evenement = instance._meta.model_name
+    donnees = {'type': type_evenement, 'action': action, 'id': instance.pk}
+    if action != 'suppression':
+        for champ in CHAMPS_EVENEMENT[type_evenement]:
+            donnees[champ.removesuffix('_id')] = getattr(instance, champ)
+    return donnees
+
+
+class Diffuseur:
+    """Diffuse les événements aux abonnés (une file asyncio par flux SSE)."""
+
+    def __init__(self, taille_file=TAILLE_FILE, taille_historique=TAILLE_HISTORIQUE):
+        self.taille_file = taille_file
+        self._abonnes = set()
+        self._historique = deque(maxlen=taille_historique)
+        self._compteur = itertools.count(1)
+        self._verrou = threading.Lock()
+
+    def abonner(self, depuis=None):
+        """Nouvelle file pour la boucle courante, préremplie après l'id ``depuis``."""
+        file = asyncio.Queue(maxsize=self.taille_file)
+        with self._verrou:
+            if depuis is not None:
+                for identifiant, donnees in self._historique:
+                    if identifiant > depuis:
+                        self._deposer(file, (identifiant, donnees))
+            self._abonnes.add((asyncio.get_running_loop(), file))
+        return file
+
+    def desabonner(self, file):
+        with self._verrou:
+            self._abonnes = {(loop, f) for loop, f in self._abonnes if f is not file}
+
+    def publier(self, donnees):
+        """Appelable depuis n'importe quel thread."""
+        with self._verrou:
+            message = (next(self._compteur), donnees)
+            self._historique.append(message)
+            abonnes = list(self._abonnes)
+        for loop, file in abonnes:
+            try:
+                loop.call_soon_threadsafe(self._deposer, file, message)
+            except RuntimeError:
+                # Boucle fermée : le flux a été coupé sans se désabonner
+                self.desabonner(file)
+
+    @staticmethod
+    def _deposer(file, message):
+        # Client trop lent : on perd les plus anciens plutôt que de bloquer
+        if file.full():
+            file.get_nowait()
+        file.put_nowait(message)
+
+
+diffuseur = Diffuseur()
+
+
+def formater(identifiant, donnees):
+    return (
+        f"id: {identifiant}\n"
+        f"event: {donnees['type']}\n"
+        f"data: {json.dumps(donnees, cls=DjangoJSONEncoder, separators=(',', ':'))}\n\n"
+    )
+
+
+async def flux_evenements(request):
+    """
+    ``GET /api/evenements/?types=vente,production`` : flux ``text/event-stream``.
+
+    À la reconnexion, l'en-tête ``Last-Event-ID`` renvoie les événements
+    manqués encore présents dans l'historique du processus.
+    """
+    types = set(filter(None, request.GET.get('types', '').split(',')))
+    try:
+        depuis = int(request.headers['Last-Event-ID'])
+    except (KeyError, ValueError):
+        depuis = None
+
+    async def flux():
+        file = diffuseur.abonner(depuis)
+        try:
+            yield f'retry: {INTERVALLE_KEEPALIVE * 1000}\n\n'
+            while True:
+                try:
+                    identifiant, donnees = await asyncio.wait_for(file.get(), INTERVALLE_KEEPALIVE)
+                except asyncio.TimeoutError:
+                    yield ': keepalive\n\n'
+                    continue
+                if not types or donnees['type'] in types:
+                    yield formater(identifiant, donnees)
+        finally:
+            diffuseur.desabonner(file)
+
+    response = StreamingHttpResponse(flux(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
@@ -0,0 +1,84 @@
+"""
+Page d'entrée de l'application React (``frontend/build/index.html``).
+
+Le fichier est lu une fois, compressé une fois (gzip et, si le paquet
+``brotli`` est installé, brotli) et gardé en mémoire avec son ETag : chaque
+route de l'application sert ces octets sans passer par le moteur de gabarits.
+``Cache-Control: no-cache`` impose au navigateur de revalider la page (304
+tant qu'elle n'a pas changé) pour qu'un nouveau déploiement soit vu aussitôt ;
+les fichiers qu'elle référence ont des noms hachés, servis par WhiteNoise
+avec un cache ``immutable``.
+
+Le fichier est relu quand sa date de modification change (``npm run build``
+pendant que le serveur tourne).
+"""
+import gzip
+import hashlib
+import os
+
+from django.conf import settings
+from django.http import Http404, HttpResponse
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.views.decorators.http import require_safe
+
+try:
+    import brotli
+except ImportError:  # brotli est optionnel : gzip seul
+    brotli = None
+
+_page = None
+
+
+def chemin_index():
+    return getattr(settings, 'FRONTEND_INDEX', os.path.join(settings.BASE_DIR, 'frontend', 'build', 'index.html'))
+
+
+class Page:
+    def __init__(self, chemin):
+        self.chemin = chemin
+        self.date_modification = os.stat(chemin).st_mtime_ns
+        with open(chemin, 'rb') as fichier:
+            self.contenu = fichier.read()
+        self.etag = '"%s"' % hashlib.sha256(self.contenu).hexdigest()[:32]
+        self.variantes = {'gzip': gzip.compress(self.contenu, mtime=0)}
+        if brotli is not None:
+            self.variantes['br'] = brotli.compress(self.contenu, mode=brotli.MODE_TEXT)
+
+    def a_jour(self, chemin):
+        return chemin == self.chemin and os.stat(chemin).st_mtime_ns == self.date_modification
+
+    def encodage(self, accept_encoding):
+        acceptes = {valeur.split(';')[0].strip() for valeur in accept_encoding.split(',')}
+        for encodage in ('br', 'gzip'):
+            if encodage in acceptes and encodage in self.variantes:
+                return encodage
+        return None
+
+
+def page():
+    global _page
+    chemin = chemin_index()
+    try:
+        if _page is None or not _page.a_jour(chemin):
+            _page = Page(chemin)
+    except FileNotFoundError:
+        raise Http404(f"{chemin} introuvable : construire le frontend (npm run build)")
+    return _page
+
+
+@require_safe
+def index(request):
+    courante = page()
+    response = get_conditional_response(request, etag=courante.etag)
+    if response is None:
+        encodage = courante.encodage(request.headers.get('Accept-Encoding', ''))
+        response = HttpResponse(
+            courante.variantes[encodage] if encodage else courante.contenu,
+            content_type='text/html; charset=utf-8'
+        )
+        if encodage:
+            response['Content-Encoding'] = encodage
+    response['ETag'] = courante.etag
+    response['Cache-Control'] = 'no-cache'
+    patch_vary_headers(response, ('Accept-Encoding',))
+    return response
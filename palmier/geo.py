@@ -0,0 +1,120 @@
+"""
+Geohash et requêtes de proximité sans PostGIS.
+
+Chaque plantation géolocalisée porte son geohash (colonne indexée). Une zone
+de recherche est couverte par quelques cellules geohash ; chaque cellule
+devient un intervalle ``[préfixe, préfixe~)`` sur la colonne, ce qui reste
+une recherche d'index sur SQLite comme sur PostgreSQL. Les candidats sont
+ensuite filtrés exactement (bornes ou distance).
+"""
+import math
+from functools import reduce
+from operator import or_
+
+from django.db.models import Q
+
+BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+RAYON_TERRE_KM = 6371.0088
+PRECISION = 9
+MAX_CELLULES = 32
+
+
+def encoder(latitude, longitude, precision=PRECISION):
+    lat_min, lat_max = -90.0, 90.0
+    lon_min, lon_max = -180.0, 180.0
+    geohash, bits, valeur, pair = [], 0, 0, True
+    while len(geohash) < precision:
+        if pair:
+            milieu = (lon_min + lon_max) / 2
+            if longitude >= milieu:
+                valeur, lon_min = valeur * 2 + 1, milieu
+            else:
+                valeur, lon_max = valeur * 2, milieu
+        else:
+            milieu = (lat_min + lat_max) / 2
+            if latitude >= milieu:
+                valeur, lat_min = valeur * 2 + 1, milieu
+            else:
+                valeur, lat_max = valeur * 2, milieu
+        pair = not pair
+        bits += 1
+        if bits == 5:
+            geohash.append(BASE32[valeur])
+            bits, valeur = 0, 0
+    return ''.join(geohash)
+
+
+def coordonnees_valides(latitude, longitude):
+    """Latitude et longitude finies et dans leurs bornes (nan échoue à toute comparaison)."""
+    return -90.0 <= latitude <= 90.0 and -180.0 <= longitude <= 180.0
+
+
+def taille_cellule(precision):
+    """Dimensions (degrés de latitude, degrés de longitude) d'une cellule."""
+    bits = 5 * precision
+    return 180.0 / 2 ** (bits // 2), 360.0 / 2 ** ((bits + 1) // 2)
+
+
+def distance_km(lat1, lon1, lat2, lon2):
+    """Distance orthodromique (haversine)."""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlambda = math.radians(lon2 - lon1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
+    return 2 * RAYON_TERRE_KM * math.asin(math.sqrt(a))
+
+
+def boite_autour(latitude, longitude, rayon_km):
+    """Boîte (lat_min, lon_min, lat_max, lon_max) contenant le cercle."""
+    dlat = math.degrees(rayon_km / RAYON_TERRE_KM)
+    cos_lat = max(math.cos(math.radians(latitude)), 1e-6)
+    dlon = min(math.degrees(rayon_km / (RAYON_TERRE_KM * cos_lat)), 180.0)
+    return (
+        max(latitude - dlat, -90.0), max(longitude - dlon, -180.0),
+        min(latitude + dlat, 90.0), min(longitude + dlon, 180.0),
+    )
+
+
+def cellules(lat_min, lon_min, lat_max, lon_max):
+    """Préfixes geohash couvrant la boîte, à la précision la plus fine possible."""
+    precision = 1
+    for candidate in range(PRECISION, 0, -1):
+        haut, large = taille_cellule(candidate)
+        nombre = (math.ceil((lat_max - lat_min) / haut) + 1) * (math.ceil((lon_max - lon_min) / large) + 1)
+        if nombre <= MAX_CELLULES:
+            precision = candidate
+            break
+
+    haut, large = taille_cellule(precision)
+    prefixes = set()
+    lat = lat_min
+    while True:
+        lon = lon_min
+        while True:
+            prefixes.add(encoder(lat, lon, precision))
+            if lon >= lon_max:
+                break
+            lon = min(lon + large, lon_max)
+        if lat >= lat_max:
+            break
+        lat = min(lat + haut, lat_max)
+    return sorted(prefixes)
+
+
+def intervalles(prefixes):
+    """Intervalles ``(début, fin)`` de geohash correspondant aux préfixes."""
+    # '~' est supérieur à tous les caractères base32
+    return [(prefixe, prefixe + '~') for prefixe in prefixes]
+
+
+def filtrer_boite(queryset, lat_min, lon_min, lat_max, lon_max):
+    """Plantations de ``queryset`` situées dans la boîte (index sur geohash)."""
+    conditions = [
+        Q(geohash__gte=debut, geohash__lt=fin)
+        for debut, fin in intervalles(cellules(lat_min, lon_min, lat_max, lon_max))
+    ]
+    # order_by() : sans tri imposé, le planificateur part de l'index geohash
+    return queryset.filter(reduce(or_, conditions)).filter(
+        latitude__gte=lat_min, latitude__lte=lat_max,
+        longitude__gte=lon_min, longitude__lte=lon_max,
+    ).order_by()
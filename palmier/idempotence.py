@@ -0,0 +1,109 @@
+"""
+En-tête ``Idempotency-Key`` sur les créations et modifications.
+
+Un client qui rejoue une requête avec la même clé reçoit la réponse d'origine
+(en-tête ``Idempotent-Replayed: true``) sans nouvelle écriture : une vente
+n'est pas créée deux fois et le stock n'est décrémenté qu'une fois.
+
+La clé est réservée dans la même transaction que l'écriture : une requête
+concurrente avec la même clé attend la validation de la première puis
+rejoue sa réponse ; si la première échoue, rien n'est gardé et la clé reste
+libre. Seules les réponses réussies sont mémorisées. Réutiliser une clé pour
+une autre requête (méthode, chemin ou corps différents) renvoie un 422.
+
+Les clés expirent après ``IDEMPOTENCE_TTL_HEURES`` heures (24 par défaut) ;
+``manage.py purger_idempotence`` supprime les anciennes.
+"""
+import hashlib
+import json
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, router, transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+from rest_framework.utils.encoders import JSONEncoder
+
+from .models import CleIdempotence
+from .transactions import transaction_stock
+
+EN_TETE = 'Idempotency-Key'
+EN_TETE_REJEU = 'Idempotent-Replayed'
+
+
+def duree_vie():
+    return timedelta(hours=getattr(settings, 'IDEMPOTENCE_TTL_HEURES', 24))
+
+
+def empreinte(request):
+    contenu = json.dumps(
+        [request.method, request.path, request.data],
+        cls=JSONEncoder, sort_keys=True, separators=(',', ':')
+    )
+    return hashlib.sha256(contenu.encode()).hexdigest()
+
+
+def purger(using='default'):
+    limite = timezone.now() - duree_vie()
+    return CleIdempotence.objects.using(using).filter(date_creation__lt=limite).delete()[0]
+
+
+def rejouer(enregistrement, empreinte_requete):
+    if enregistrement.empreinte != empreinte_requete:
+        return Response(
+            {'detail': f"Cette clé {EN_TETE} a déjà servi pour une autre requête"},
+            status=status.HTTP_422_UNPROCESSABLE_ENTITY
+        )
+    return Response(enregistrement.reponse, status=enregistrement.statut, headers={EN_TETE_REJEU: 'true'})
+
+
+class IdempotenceMixin:
+    """Applique ``Idempotency-Key`` aux actions ``create``/``update`` d'un ``ModelViewSet``."""
+
+    def create(self, request, *args, **kwargs):
+        return self._idempotent(super().create, request, *args, **kwargs)
+
+    def update(self, request, *args, **kwargs):
+        return self._idempotent(super().update, request, *args, **kwargs)
+
+    def _idempotent(self, action, request, *args, **kwargs):
+        cle = request.headers.get(EN_TETE)
+        if cle is None:
+            return action(request, *args, **kwargs)
+        if not cle or len(cle) > 255:
+            return Response(
+                {'detail': f"L'en-tête {EN_TETE} doit faire entre 1 et 255 caractères"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        empreinte_requete = empreinte(request)
+        using = router.db_for_write(CleIdempotence)
+        limite = timezone.now() - duree_vie()
+        cles = CleIdempotence.objects.using(using)
+
+        # Cas du rejeu : une seule recherche sur l'index unique
+        enregistrement = cles.filter(cle=cle, date_creation__gte=limite).first()
+        if enregistrement is not None:
+            return rejouer(enregistrement, empreinte_requete)
+
+        # Transaction de stock : sur SQLite, BEGIN IMMEDIATE comme pour une vente sans clé
+        with transaction_stock(using=using):
+            cles.filter(cle=cle, date_creation__lt=limite).delete()
+            try:
+                with transaction.atomic(using=using):
+                    enregistrement = cles.create(cle=cle, empreinte=empreinte_requete)
+            except IntegrityError:
+                # Requête concurrente avec la même clé, validée pendant l'attente du verrou
+                return rejouer(cles.get(cle=cle), empreinte_requete)
+
+            response = action(request, *args, **kwargs)
+            if not status.is_success(response.status_code):
+                transaction.set_rollback(True, using=using)
+                return response
+
+            enregistrement.statut = response.status_code
+            # Même encodeur que le rendu JSON : le rejeu est identique à l'original
+            enregistrement.reponse = json.loads(json.dumps(response.data, cls=JSONEncoder))
+            enregistrement.save(using=using, update_fields=['statut', 'reponse'])
+        return response
@@ -0,0 +1,147 @@
+"""
+Lecture rapide des listes : les lignes sont construites depuis ``values()``.
+
+Pour les grandes pages (exports, tableau de bord), instancier un objet modèle
+puis le passer champ par champ dans un ``ModelSerializer`` coûte l'essentiel
+du temps CPU. L'action ``list`` de ``PlantationViewSet``, ``ProductionViewSet``
+et ``VenteViewSet`` lit ici les colonnes utiles en une requête ``values()`` et
+construit directement chaque ligne, champs calculés compris
+(``pourcentage_stock``, ``rendement_par_arbre``, ``prix_moyen_kg``, libellés
+des ``choices``).
+
+Le JSON produit est identique, octet pour octet, à celui des sérialiseurs
+(ordre des clés, décimaux en chaînes, champs calculés en nombres) : toute
+modification d'un sérialiseur lu ici doit être reportée dans ce module, ce
+que vérifient les tests. ``LECTURE_RAPIDE = False`` rend la main aux
+sérialiseurs ; les écritures, le détail et ``?since=`` les utilisent toujours.
+Mesures : ``manage.py bench_serialisation``.
+"""
+from collections import namedtuple
+from decimal import Decimal
+
+from django.conf import settings
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+
+from .models import Production
+
+CENTIEME = Decimal('0.01')
+QUALITES = dict(Production.QUALITE_CHOICES)
+
+# champs : colonnes de ``values()`` ; ligne : dictionnaire de ces colonnes -> ligne JSON
+Lecture = namedtuple('Lecture', 'champs ligne')
+
+
+def active():
+    return getattr(settings, 'LECTURE_RAPIDE', True)
+
+
+def decimal(valeur):
+    """Rendu de ``serializers.DecimalField`` (2 décimales, chaîne par défaut)."""
+    if valeur is None:
+        return None
+    valeur = valeur.quantize(CENTIEME)
+    return f'{valeur:f}' if api_settings.COERCE_DECIMAL_TO_STRING else valeur
+
+
+def date_iso(valeur):
+    return None if valeur is None else valeur.isoformat()
+
+
+def ligne_plantation(v):
+    nombre_productions = v['nombre_productions']
+    total_poids = Decimal(v['poids_productions']).quantize(CENTIEME)
+    return {
+        'id': v['id'],
+        'nom': v['nom'],
+        'superficie': decimal(v['superficie']),
+        'date_plantation': date_iso(v['date_plantation']),
+        'nombre_arbres': v['nombre_arbres'],
+        'localisation': v['localisation'],
+        'latitude': None if v['latitude'] is None else float(v['latitude']),
+        'longitude': None if v['longitude'] is None else float(v['longitude']),
+        'geohash': v['geohash'],
+        'description': v['description'],
+        'nombre_operations': v['nombre_operations'],
+        'nombre_productions': nombre_productions,
+        'rendement_moyen': total_poids / nombre_productions if nombre_productions else 0,
+    }
+
+
+def ligne_production(v, prefixe=''):
+    poids_total = v[prefixe + 'poids_total']
+    stock = v[prefixe + 'stock_disponible']
+    nombre_arbres = v[prefixe + 'plantation__nombre_arbres']
+    qualite = v[prefixe + 'qualite']
+    return {
+        'id': v[prefixe + 'id'],
+        'plantation': v[prefixe + 'plantation_id'],
+        'plantation_nom': v[prefixe + 'plantation__nom'],
+        'date_recolte': date_iso(v[prefixe + 'date_recolte']),
+        'quantite': v[prefixe + 'quantite'],
+        'poids_total': decimal(poids_total),
+        'stock_disponible': decimal(stock),
+        'pourcentage_stock': (stock / poids_total) * 100 if poids_total > 0 else 0,
+        'qualite': qualite,
+        'qualite_display': QUALITES.get(qualite, qualite),
+        'rendement_par_arbre': poids_total / nombre_arbres if nombre_arbres > 0 else 0,
+    }
+
+
+def ligne_vente(v):
+    quantite = v['quantite']
+    montant_total = v['montant_total']
+    return {
+        'id': v['id'],
+        'production': v['production_id'],
+        'production_details': ligne_production(v, 'production__'),
+        'date_vente': date_iso(v['date_vente']),
+        'client': v['client__nom'],
+        'client_id': v['client_id'],
+        'quantite': decimal(quantite),
+        'prix_unitaire': decimal(v['prix_unitaire']),
+        'montant_total': decimal(montant_total),
+        'stock_restant': decimal(v['production__stock_disponible']),
+        # Absent de l'instance, ajouté en dernier par VenteSerializer.to_representation
+        'prix_moyen_kg': montant_total / quantite if quantite > 0 else 0,
+    }
+
+
+CHAMPS_PRODUCTION = (
+    'id', 'plantation_id', 'plantation__nom', 'plantation__nombre_arbres', 'date_recolte',
+    'quantite', 'poids_total', 'stock_disponible', 'qualite',
+)
+
+PLANTATIONS = Lecture(
+    champs=(
+        'id', 'nom', 'superficie', 'date_plantation', 'nombre_arbres', 'localisation', 'latitude',
+        'longitude', 'geohash', 'description', 'nombre_operations', 'nombre_productions', 'poids_productions',
+    ),
+    ligne=ligne_plantation,
+)
+
+PRODUCTIONS = Lecture(champs=CHAMPS_PRODUCTION, ligne=ligne_production)
+
+VENTES = Lecture(
+    champs=(
+        'id', 'production_id', 'date_vente', 'client_id', 'client__nom', 'quantite', 'prix_unitaire',
+        'montant_total', *(f'production__{champ}' for champ in CHAMPS_PRODUCTION),
+    ),
+    ligne=ligne_vente,
+)
+
+
+class LectureRapideMixin:
+    """``list`` servie par la ``Lecture`` de ``lecture_rapide`` (sauf ``?since=``, laissé à ``SynchroMixin``)."""
+    lecture_rapide = None
+
+    def list(self, request, *args, **kwargs):
+        if self.lecture_rapide is None or not active() or 'since' in request.query_params:
+            return super().list(request, *args, **kwargs)
+
+        queryset = self.filter_queryset(self.get_queryset()).values(*self.lecture_rapide.champs)
+        ligne = self.lecture_rapide.ligne
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response([ligne(valeurs) for valeurs in page])
+        return Response([ligne(valeurs) for valeurs in queryset])
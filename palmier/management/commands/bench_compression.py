@@ -0,0 +1,72 @@
+import statistics
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.test import Client
+from django.urls import reverse
+from palmier import compression
+
+# (nom d'URL, paramètres) : listes, séries mensuelles, détails imbriqués, export en flux
+POINTS = [
+    ('plantation-list', {}),
+    ('production-list', {}),
+    ('vente-list', {}),
+    ('operation-list', {}),
+    ('mouvementcaisse-list', {}),
+    ('vente-statistiques-ventes', {}),
+    ('production-statistiques-globales', {}),
+    ('operation-statistiques-mensuelles', {}),
+    ('vente-analyse-prix', {}),
+    ('plantation-rapport-annuel', {'annee': None, 'type_fichier': 'csv'}),
+]
+
+
+class Command(BaseCommand):
+    help = "Mesure les octets transmis et le coût CPU de la compression des réponses de l'API"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repetitions', type=int, default=20)
+        parser.add_argument('--annee', type=int, default=None, help='Année du rapport annuel (année en cours par défaut)')
+
+    def handle(self, *args, **options):
+        # Hôte accepté par ALLOWED_HOSTS ('localhost' en DEBUG quand la liste est vide)
+        hotes = [hote.lstrip('.') for hote in settings.ALLOWED_HOSTS if hote and hote != '*']
+        client = Client(HTTP_HOST=hotes[0] if hotes else 'localhost')
+        annee = options['annee'] or time.localtime().tm_year
+        lignes = []
+        for nom, parametres in POINTS:
+            parametres = {cle: annee if valeur is None else valeur for cle, valeur in parametres.items()}
+            response = client.get(reverse(nom), parametres, HTTP_ACCEPT_ENCODING='identity')
+            if response.status_code != 200:
+                self.stdout.write(self.style.WARNING(f'{nom} : statut {response.status_code}, ignoré'))
+                continue
+            corps = b''.join(response.streaming_content) if response.streaming else response.content
+            lignes.append((nom, len(corps), *self._mesurer(corps, 'gzip', options['repetitions']),
+                           *self._mesurer(corps, 'br', options['repetitions'])))
+
+        self.stdout.write(
+            f"{'point':36} {'brut':>10} {'gzip':>10} {'ratio':>6} {'cpu':>8} {'br':>10} {'ratio':>6} {'cpu':>8}"
+        )
+        for nom, brut, gzip_taille, gzip_ms, br_taille, br_ms in lignes:
+            self.stdout.write(
+                f'{nom:36} {brut:>10} '
+                f'{gzip_taille:>10} {gzip_taille / brut:>6.1%} {gzip_ms:>6.2f}ms '
+                f'{br_taille:>10} {br_taille / brut:>6.1%} {br_ms:>6.2f}ms'
+            )
+        total = sum(ligne[1] for ligne in lignes)
+        self.stdout.write(self.style.SUCCESS(
+            f"total : {total} octets bruts, {sum(l[2] for l in lignes)} en gzip "
+            f"(niveau {compression.niveau_gzip()}), {sum(l[4] for l in lignes)} en brotli "
+            f"(niveau {compression.niveau_brotli()}) ; temps CPU médian par réponse"
+        ))
+
+    def _mesurer(self, corps, codage, repetitions):
+        if codage == 'br' and compression.brotli is None:
+            return 0, 0.0
+        durees = []
+        for _ in range(repetitions):
+            debut = time.process_time()
+            taille = len(compression.compresser(corps, codage))
+            durees.append(time.process_time() - debut)
+        return taille, statistics.median(durees) * 1000
@@ -0,0 +1,92 @@
+import os
+import statistics
+import tempfile
+import time
+from datetime import date
+from decimal import Decimal
+
+import numpy as np
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import connections
+from palmier import previsions
+from palmier.models import Plantation, Production
+
+
+class Command(BaseCommand):
+    help = "Mesure le temps des prévisions de récolte sur un historique synthétique"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--plantations', type=int, default=500)
+        parser.add_argument('--recoltes', type=int, default=2, help='Récoltes par plantation et par mois')
+        parser.add_argument('--horizon', type=int, default=12)
+        parser.add_argument('--repetitions', type=int, default=5)
+
+    def handle(self, *args, **options):
+        alias = 'bench_previsions'
+        with tempfile.TemporaryDirectory() as dossier:
+            connections.settings[alias] = connections.configure_settings({
+                'default': {},
+                alias: {'ENGINE': 'palmier.backends.sqlite3', 'NAME': os.path.join(dossier, 'bench.sqlite3')},
+            })[alias]
+            try:
+                call_command('migrate', database=alias, verbosity=0)
+                niveaux = self._remplir(alias, options['plantations'], options['recoltes'])
+                self._mesurer(alias, niveaux, options['horizon'], options['repetitions'])
+            finally:
+                connections[alias].close()
+                del connections.settings[alias]
+
+    def _remplir(self, alias, nb_plantations, nb_recoltes):
+        generateur = np.random.default_rng(0)
+        aujourd_hui = date.today()
+        plantations = Plantation.objects.using(alias).bulk_create([
+            Plantation(
+                nom=f'Bench {i}',
+                superficie=Decimal('10.00'),
+                date_plantation=date(aujourd_hui.year - int(generateur.integers(4, 30)), 1, 1),
+                nombre_arbres=int(generateur.integers(500, 2000)),
+                localisation='Bench',
+            )
+            for i in range(nb_plantations)
+        ])
+        niveaux = generateur.uniform(5, 15, nb_plantations)
+        saison = 1 + 0.3 * np.sin(np.arange(12) / 12 * 2 * np.pi)
+        mois_courant = previsions.numero_mois(aujourd_hui)
+
+        lignes = []
+        for plantation, niveau in zip(plantations, niveaux):
+            mois_plantation = previsions.numero_mois(plantation.date_plantation)
+            for mois in range(mois_courant - previsions.HISTORIQUE_MOIS, mois_courant):
+                attendu = niveau * plantation.nombre_arbres * saison[mois % 12] * previsions.courbe_age(
+                    (mois - mois_plantation) / 12
+                )
+                for jour in range(1, nb_recoltes + 1):
+                    poids = attendu / nb_recoltes * generateur.normal(1, 0.1)
+                    lignes.append(Production(
+                        plantation=plantation,
+                        date_recolte=previsions.premier_jour(mois).replace(day=jour * 7),
+                        quantite=max(1, int(poids / 10)),
+                        poids_total=Decimal(f'{max(poids, 0.01):.2f}'),
+                        stock_disponible=Decimal(f'{max(poids, 0.01):.2f}'),
+                        qualite='ABCD'[int(generateur.integers(0, 4))],
+                    ))
+        Production.objects.using(alias).bulk_create(lignes, batch_size=5000)
+        self.stdout.write(f'{nb_plantations} plantations, {len(lignes)} récoltes sur {previsions.HISTORIQUE_MOIS} mois')
+        return niveaux
+
+    def _mesurer(self, alias, niveaux, horizon, repetitions):
+        queryset = Plantation.objects.using(alias).all()
+        durees = []
+        for _ in range(repetitions):
+            debut = time.perf_counter()
+            resultat = previsions.previsions(queryset, horizon)
+            durees.append(time.perf_counter() - debut)
+
+        estimes = np.array([ligne['niveau'] for ligne in sorted(resultat['plantations'], key=lambda l: l['plantation'])])
+        ecart = np.abs(estimes - niveaux) / niveaux
+        self.stdout.write(
+            f'prévisions à {horizon} mois : médiane {statistics.median(durees) * 1000:.0f} ms, '
+            f'max {max(durees) * 1000:.0f} ms (requêtes comprises)'
+        )
+        self.stdout.write(f'niveau retrouvé : écart médian {np.median(ecart):.1%}, p90 {np.percentile(ecart, 90):.1%}')
@@ -0,0 +1,53 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.renderers import JSONRenderer
+from palmier.views import PlantationViewSet, ProductionViewSet, VenteViewSet
+
+VUES = [PlantationViewSet, ProductionViewSet, VenteViewSet]
+
+
+class Command(BaseCommand):
+    help = "Compare le débit (lignes/s) des listes : sérialiseurs DRF contre lecture rapide (palmier.lecture)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lignes', type=int, default=1000, help='Lignes par page mesurée')
+        parser.add_argument('--repetitions', type=int, default=5)
+
+    def handle(self, *args, **options):
+        rendu = JSONRenderer()
+        self.stdout.write(f"{'liste':12} {'lignes':>7} {'sérialiseur':>14} {'lecture rapide':>16} {'gain':>6}")
+        for vue in VUES:
+            queryset = vue().get_queryset()[:options['lignes']]
+            lecture = vue.lecture_rapide
+
+            def serialiseur():
+                # all() : nouvelle requête à chaque mesure, sans le cache du queryset
+                return rendu.render(vue.serializer_class(list(queryset.all()), many=True).data)
+
+            def rapide():
+                return rendu.render([lecture.ligne(valeurs) for valeurs in queryset.values(*lecture.champs)])
+
+            attendu = serialiseur()
+            if rapide() != attendu:
+                raise CommandError(f'{vue.__name__} : la lecture rapide ne produit pas le JSON du sérialiseur')
+            nombre = queryset.count()
+            if not nombre:
+                self.stdout.write(self.style.WARNING(f'{vue.__name__} : aucune ligne, ignoré'))
+                continue
+            lent = self._debit(serialiseur, nombre, options['repetitions'])
+            vite = self._debit(rapide, nombre, options['repetitions'])
+            self.stdout.write(
+                f'{vue.queryset.model._meta.model_name:12} {nombre:>7} '
+                f'{lent:>10.0f} l/s {vite:>12.0f} l/s {vite / lent:>5.1f}x'
+            )
+        self.stdout.write(self.style.SUCCESS('JSON identique ; requête, construction et rendu JSON compris, médiane'))
+
+    def _debit(self, fonction, nombre, repetitions):
+        durees = []
+        for _ in range(repetitions):
+            debut = time.perf_counter()
+            fonction()
+            durees.append(time.perf_counter() - debut)
+        return nombre / statistics.median(durees)
@@ -0,0 +1,133 @@
+import os
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from decimal import Decimal
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, connections
+from django.db.models import Sum
+from django.utils import timezone
+from palmier.models import Client, Plantation, Production, Vente
+
+
+def vendre_sans_verrou(alias, production_id, **champs):
+    """
+    Chemin d'écriture d'origine de ``Vente.save`` : stock relu, contrôlé puis
+    réécrit en autocommit, sans transaction ni verrou.
+    """
+    production = Production.objects.using(alias).get(pk=production_id)
+    vente = Vente(production=production, **champs)
+    vente.montant_total = round(vente.quantite * vente.prix_unitaire, 2)
+    vente.clean()
+    production.stock_disponible -= vente.quantite
+    production.save(using=alias)
+    super(Vente, vente).save(using=alias)
+
+
+def vendre(alias, production_id, **champs):
+    Vente(production_id=production_id, **champs).save(using=alias)
+
+
+# Référence : moteur et réglages de Django par défaut, écriture d'origine
+PROFILS = {
+    'sqlite standard': ('django.db.backends.sqlite3', vendre_sans_verrou),
+    'sqlite réglé (WAL)': ('palmier.backends.sqlite3', vendre),
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Mesure le débit d'écriture concurrent des ventes : SQLite standard avec l'écriture d'origine "
+        "(stock relu puis réécrit) contre le profil réglé avec BEGIN IMMEDIATE"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--ventes', type=int, default=100, help='Ventes par thread')
+
+    def handle(self, *args, **options):
+        for libelle, (engine, ecrire) in PROFILS.items():
+            with tempfile.TemporaryDirectory() as dossier:
+                alias = f'bench_{engine.replace(".", "_")}'
+                self._configurer(alias, engine, os.path.join(dossier, 'bench.sqlite3'))
+                try:
+                    ventes, erreurs, duree, perdu = self._mesurer(
+                        alias, ecrire, options['threads'], options['ventes']
+                    )
+                finally:
+                    connections[alias].close()
+                    del connections[alias]
+                    del connections.settings[alias]
+            self.stdout.write(
+                f'{libelle:<20} {ventes / duree:8.1f} ventes/s '
+                f'({ventes} ventes en {duree:.2f}s, {erreurs} échecs « database is locked », '
+                f'{perdu} kg de stock non décomptés)'
+            )
+
+    def _configurer(self, alias, engine, nom):
+        # Pas d'OPTIONS : chaque profil garde les réglages par défaut de son moteur
+        connections.settings[alias] = connections.configure_settings({
+            'default': {},
+            alias: {'ENGINE': engine, 'NAME': nom},
+        })[alias]
+        call_command('migrate', database=alias, verbosity=0)
+
+    def _mesurer(self, alias, ecrire, nb_threads, nb_ventes):
+        plantation = Plantation.objects.using(alias).create(
+            nom='Bench',
+            superficie=Decimal('10.00'),
+            date_plantation=timezone.now().date() - timedelta(days=365),
+            nombre_arbres=100,
+            localisation='Bench',
+        )
+        productions = [
+            Production.objects.using(alias).create(
+                plantation=plantation,
+                date_recolte=timezone.now().date(),
+                quantite=10,
+                poids_total=Decimal(nb_threads * nb_ventes),
+                qualite='A',
+            )
+            for _ in range(2)
+        ]
+        clients = [Client.obtenir(f'Client {index}', using=alias) for index in range(nb_threads)]
+        connections[alias].close()
+
+        compteurs = {'ventes': 0, 'erreurs': 0}
+        verrou = threading.Lock()
+
+        def vendre_en_boucle(index):
+            production = productions[index % len(productions)]
+            for _ in range(nb_ventes):
+                try:
+                    ecrire(
+                        alias, production.pk,
+                        date_vente=timezone.now().date(),
+                        client=clients[index],
+                        quantite=Decimal('0.50'),
+                        prix_unitaire=Decimal('2.00'),
+                    )
+                    cle = 'ventes'
+                except OperationalError:
+                    cle = 'erreurs'
+                with verrou:
+                    compteurs[cle] += 1
+            connections[alias].close()
+
+        threads = [threading.Thread(target=vendre_en_boucle, args=(i,)) for i in range(nb_threads)]
+        debut = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        duree = time.perf_counter() - debut
+
+        # Mises à jour perdues : stock restant supérieur à poids_total - quantités vendues
+        perdu = sum(
+            production.stock_disponible - (production.poids_total - (production.vendu or 0))
+            for production in Production.objects.using(alias).annotate(vendu=Sum('ventes__quantite'))
+        )
+        return compteurs['ventes'], compteurs['erreurs'], duree, perdu
@@ -1,6 +1,6 @@
 from django.core.management.base import BaseCommand
 from django.utils import timezone
-from palmier.models import Plantation, Operation, Production, Vente, MouvementCaisse
+from palmier.models import Plantation, Operation, Production, Vente, MouvementCaisse, Client
 from decimal import Decimal
 from datetime import timedelta
 
@@ -71,7 +71,7 @@ class Command(BaseCommand):
             Vente.objects.create(
                 production=production,
                 date_vente=timezone.now().date() - timedelta(days=5),
-                client='Client A',
+                client=Client.obtenir('Client A'),
                 quantite=Decimal('500.00'),
                 prix_unitaire=Decimal('2.50')
             )
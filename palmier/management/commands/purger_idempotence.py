@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from palmier import idempotence
+
+
+class Command(BaseCommand):
+    help = "Supprime les clés Idempotency-Key plus anciennes que IDEMPOTENCE_TTL_HEURES"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='default')
+
+    def handle(self, *args, **options):
+        nombre = idempotence.purger(using=options['database'])
+        self.stdout.write(self.style.SUCCESS(f'{nombre} clés purgées'))
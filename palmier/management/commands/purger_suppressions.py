@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from palmier import synchro
+
+
+class Command(BaseCommand):
+    help = "Supprime les traces de suppression plus anciennes que SYNCHRO_RETENTION_JOURS"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='default')
+
+    def handle(self, *args, **options):
+        nombre = synchro.purger(using=options['database'])
+        self.stdout.write(self.style.SUCCESS(f'{nombre} traces de suppression purgées'))
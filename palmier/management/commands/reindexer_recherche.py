@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from palmier import recherche
+
+
+class Command(BaseCommand):
+    help = "Reconstruit les index de recherche (après des écritures en masse)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='default')
+
+    def handle(self, *args, **options):
+        for model in recherche.CHAMPS_INDEXES:
+            nombre = recherche.reindexer(model, using=options['database'])
+            self.stdout.write(f'{model._meta.verbose_name_plural} : {nombre} lignes indexées')
+        self.stdout.write(self.style.SUCCESS('Index de recherche reconstruits'))
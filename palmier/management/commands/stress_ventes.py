@@ -0,0 +1,285 @@
+import logging
+import os
+import random
+import statistics
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+from decimal import Decimal
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError, OperationalError, connections
+from django.db.models import Count, Sum
+from django.test.utils import override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APIClient
+from palmier.models import Client, Plantation, Production
+
+QUANTITES = [Decimal('0.50'), Decimal('1.00'), Decimal('2.00'), Decimal('5.00')]
+NOMBRE_CLIENTS = 2  # clients partagés : leurs cumuls sont aussi mis à jour en concurrence
+
+# Instructions qui attendent un verrou : écriture SQLite, lignes de stock, cumuls et vente modifiée
+VERROUS = ('BEGIN IMMEDIATE', 'UPDATE "palmier_production"', 'UPDATE "palmier_client"')
+
+SCENARIOS = {
+    'même production': lambda index: 0,
+    'productions distinctes': lambda index: index,
+}
+
+
+class RoutageStress:
+    """Envoie toutes les requêtes vers la base du stress, y compris celles des vues de l'API."""
+
+    def __init__(self, alias):
+        self.alias = alias
+
+    def db_for_read(self, model, **hints):
+        return self.alias
+
+    def db_for_write(self, model, **hints):
+        return self.alias
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+
+class Command(BaseCommand):
+    help = (
+        "Ventes concurrentes (threads) sur une même production puis sur des productions distinctes : "
+        "vérifie qu'aucun stock n'est survendu et mesure le débit et l'attente des verrous. "
+        "Les écritures passent par l'API (vue, sérialiseur puis Vente.save)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--ventes', type=int, default=200, help='Ventes par thread')
+        parser.add_argument(
+            '--surreservation', type=float, default=1.5,
+            help='Demande totale / stock : au-delà de 1, une partie des ventes doit être refusée'
+        )
+        parser.add_argument(
+            '--modifications', type=float, default=0.1,
+            help="Part des opérations qui modifient la quantité d'une vente déjà passée"
+        )
+        parser.add_argument(
+            '--postgres', default=os.getenv('STRESS_POSTGRES_URL'),
+            help='URL PostgreSQL (base de test créée puis supprimée) ; défaut : $STRESS_POSTGRES_URL'
+        )
+        parser.add_argument('--graine', type=int, default=0)
+
+    def handle(self, *args, **options):
+        bases = [('sqlite (fichier, WAL)', self._sqlite)]
+        if options['postgres']:
+            bases.append(('postgresql', lambda: self._postgres(options['postgres'])))
+        else:
+            self.stdout.write(self.style.WARNING('PostgreSQL ignoré : --postgres ou STRESS_POSTGRES_URL non fourni'))
+
+        echecs = []
+        for libelle, base in bases:
+            for scenario, choix in SCENARIOS.items():
+                try:
+                    with base() as alias:
+                        resultat = self._stresser(alias, choix, options)
+                except OperationalError as erreur:
+                    self.stdout.write(self.style.WARNING(f'{libelle} indisponible : {erreur}'))
+                    break
+                self._afficher(libelle, scenario, resultat)
+                echecs += [f'{libelle}, {scenario} : {anomalie}' for anomalie in resultat['anomalies']]
+
+        if echecs:
+            raise CommandError('Incohérences après les ventes concurrentes :\n' + '\n'.join(echecs))
+        self.stdout.write(self.style.SUCCESS(
+            'Aucune survente : stock_disponible = poids_total - somme des quantités vendues, jamais négatif ; '
+            'cumuls clients cohérents'
+        ))
+
+    @contextmanager
+    def _sqlite(self):
+        with tempfile.TemporaryDirectory() as dossier:
+            alias = 'stress_sqlite'
+            self._configurer(alias, {
+                'ENGINE': 'palmier.backends.sqlite3',
+                'NAME': os.path.join(dossier, 'stress.sqlite3'),
+                'OPTIONS': {},
+            })
+            try:
+                call_command('migrate', database=alias, verbosity=0)
+                yield alias
+            finally:
+                self._liberer(alias)
+
+    @contextmanager
+    def _postgres(self, url):
+        import dj_database_url
+
+        alias = 'stress_postgres'
+        self._configurer(alias, dj_database_url.parse(url))
+        creation = connections[alias].creation
+        nom = connections[alias].settings_dict['NAME']
+        try:
+            # Base test_<nom> créée et migrée, supprimée à la fin : la base de l'URL n'est pas touchée
+            creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+            try:
+                yield alias
+            finally:
+                connections.close_all()
+                creation.destroy_test_db(nom, verbosity=0)
+        finally:
+            self._liberer(alias)
+
+    def _configurer(self, alias, parametres):
+        connections.settings[alias] = connections.configure_settings({'default': {}, alias: parametres})[alias]
+
+    def _liberer(self, alias):
+        # La connexion du thread principal est oubliée avec sa configuration : le scénario suivant repart de zéro
+        connections[alias].close()
+        del connections[alias]
+        del connections.settings[alias]
+
+    def _stresser(self, alias, choix_production, options):
+        nb_threads, nb_ventes = options['threads'], options['ventes']
+        demande = nb_threads * nb_ventes * sum(QUANTITES) / len(QUANTITES)
+        nb_productions = len({choix_production(index) for index in range(nb_threads)})
+        poids = (demande / Decimal(str(options['surreservation'])) / nb_productions).quantize(Decimal('0.01'))
+
+        aujourd_hui = timezone.now().date()
+        plantation = Plantation.objects.using(alias).create(
+            nom='Stress', superficie=Decimal('10.00'), date_plantation=aujourd_hui - timedelta(days=365),
+            nombre_arbres=100, localisation='Stress',
+        )
+        productions = [
+            Production.objects.using(alias).create(
+                plantation=plantation, date_recolte=aujourd_hui, quantite=10, poids_total=poids, qualite='A'
+            )
+            for _ in range(nb_productions)
+        ]
+        clients = [Client.obtenir(f'Client {index}', using=alias) for index in range(NOMBRE_CLIENTS)]
+        connections[alias].close()
+
+        compteurs = {'ventes': 0, 'modifications': 0, 'refus': 0, 'verrou': 0, 'contrainte': 0}
+        latences, attentes, anomalies = [], [], []
+        verrou = threading.Lock()
+
+        def vendre(index):
+            hasard = random.Random(options['graine'] + index)
+            production = productions[choix_production(index)]
+            client = clients[index % NOMBRE_CLIENTS]
+            api = APIClient()
+            passees, locales, attente_locale, inattendues = [], [], [], []
+
+            def chronometrer(execute, sql, params, many, context):
+                if not sql.startswith(VERROUS) and not sql.endswith('FOR UPDATE'):
+                    return execute(sql, params, many, context)
+                debut = time.perf_counter()
+                try:
+                    return execute(sql, params, many, context)
+                finally:
+                    attente_locale.append(time.perf_counter() - debut)
+
+            resultats = dict.fromkeys(compteurs, 0)
+            with connections[alias].execute_wrapper(chronometrer):
+                for _ in range(nb_ventes):
+                    debut = time.perf_counter()
+                    try:
+                        if passees and hasard.random() < options['modifications']:
+                            response = api.patch(
+                                reverse('vente-detail', kwargs={'pk': hasard.choice(passees)}),
+                                {'quantite': str(hasard.choice(QUANTITES))}, format='json'
+                            )
+                            cle = 'modifications'
+                        else:
+                            response = api.post(reverse('vente-list'), {
+                                'production': production.pk, 'date_vente': aujourd_hui.isoformat(),
+                                'client': client.nom, 'quantite': str(hasard.choice(QUANTITES)),
+                                'prix_unitaire': '2.00',
+                            }, format='json')
+                            cle = 'ventes'
+                        if response.status_code == status.HTTP_400_BAD_REQUEST:
+                            cle = 'refus'  # stock insuffisant : refus attendu
+                        elif response.status_code >= 300:
+                            inattendues.append(f'réponse {response.status_code} : {response.content[:200]!r}')
+                            continue
+                        elif cle == 'ventes':
+                            passees.append(response.data['id'])
+                    except IntegrityError:
+                        cle = 'contrainte'  # la contrainte CHECK a dû rattraper une écriture
+                    except OperationalError:
+                        cle = 'verrou'  # « database is locked » après busy_timeout
+                    resultats[cle] += 1
+                    locales.append(time.perf_counter() - debut)
+            connections[alias].close()
+            with verrou:
+                for cle, nombre in resultats.items():
+                    compteurs[cle] += nombre
+                latences.extend(locales)
+                attentes.extend(attente_locale)
+                anomalies.extend(inattendues)
+
+        threads = [threading.Thread(target=vendre, args=(index,)) for index in range(nb_threads)]
+        # Les vues lisent et écrivent via le routeur : il les dirige vers la base du stress
+        with override_settings(ALLOWED_HOSTS=['testserver'], DATABASE_ROUTERS=[RoutageStress(alias)]), \
+                self._sans_journal_requetes():
+            debut = time.perf_counter()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            duree = time.perf_counter() - debut
+
+        anomalies += self._verifier(alias)
+        connections[alias].close()
+        return {**compteurs, 'duree': duree, 'latences': latences, 'attentes': attentes, 'anomalies': anomalies}
+
+    @contextmanager
+    def _sans_journal_requetes(self):
+        # Les refus pour stock (400) sont attendus : pas une ligne de journal par refus
+        journal = logging.getLogger('django.request')
+        niveau = journal.level
+        journal.setLevel(logging.ERROR)
+        try:
+            yield
+        finally:
+            journal.setLevel(niveau)
+
+    def _verifier(self, alias):
+        anomalies = []
+        productions = Production.objects.using(alias).annotate(vendu=Sum('ventes__quantite'))
+        for production in productions:
+            attendu = production.poids_total - (production.vendu or 0)
+            if production.stock_disponible != attendu:
+                anomalies.append(
+                    f'production {production.pk} : stock {production.stock_disponible}, attendu {attendu}'
+                )
+            if production.stock_disponible < 0:
+                anomalies.append(f'production {production.pk} : stock négatif ({production.stock_disponible})')
+        clients = Client.objects.using(alias).annotate(total=Sum('ventes__montant_total'), nombre=Count('ventes'))
+        for client in clients:
+            if (client.chiffre_affaires, client.nombre_achats) != (client.total or 0, client.nombre):
+                anomalies.append(
+                    f'client {client.nom} : cumuls {client.chiffre_affaires}/{client.nombre_achats}, '
+                    f'attendu {client.total or 0}/{client.nombre}'
+                )
+        return anomalies
+
+    def _afficher(self, libelle, scenario, resultat):
+        ecritures = resultat['ventes'] + resultat['modifications']
+        latences = sorted(resultat['latences'])
+        p50 = statistics.median(latences) * 1000 if latences else 0
+        p99 = latences[int(len(latences) * 0.99) - 1] * 1000 if latences else 0
+        attentes = resultat['attentes']
+        self.stdout.write(
+            f"{libelle} — {scenario} : {ecritures / resultat['duree']:.1f} écritures/s "
+            f"({resultat['ventes']} ventes, {resultat['modifications']} modifications, "
+            f"{resultat['refus']} refus pour stock, {resultat['verrou']} « database is locked », "
+            f"{resultat['contrainte']} rattrapées par les contraintes, en {resultat['duree']:.2f}s)\n"
+            f"    latence p50 {p50:.1f} ms, p99 {p99:.1f} ms ; attente des verrous "
+            f"{sum(attentes) * 1000:.0f} ms cumulés, max {max(attentes, default=0) * 1000:.1f} ms "
+            f"sur {len(attentes)} instructions"
+        )
+        style = self.style.ERROR if resultat['anomalies'] else self.style.SUCCESS
+        self.stdout.write(style(f"    {len(resultat['anomalies'])} incohérence(s)"))
@@ -0,0 +1,32 @@
+# Generated by Django 5.0.2 on 2026-10-19 18:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('palmier', '0004_alter_production_stock_disponible_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TacheRapport',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('type_rapport', models.CharField(max_length=50)),
+                ('parametres', models.JSONField(blank=True, default=dict)),
+                ('statut', models.CharField(choices=[('EN_ATTENTE', 'En attente'), ('EN_COURS', 'En cours'), ('TERMINEE', 'Terminée'), ('ECHEC', 'Échec')], db_index=True, default='EN_ATTENTE', max_length=20)),
+                ('fichier', models.FileField(blank=True, upload_to='rapports/')),
+                ('erreur', models.TextField(blank=True)),
+                ('date_creation', models.DateTimeField(auto_now_add=True)),
+                ('date_debut', models.DateTimeField(blank=True, null=True)),
+                ('date_fin', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name': 'Tâche de rapport',
+                'verbose_name_plural': 'Tâches de rapport',
+                'ordering': ['-date_creation'],
+            },
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.0.2 on 2026-10-19 18:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('palmier', '0005_tacherapport'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='mouvementcaisse',
+            name='date',
+            field=models.DateField(db_index=True),
+        ),
+        migrations.AlterField(
+            model_name='operation',
+            name='date',
+            field=models.DateField(db_index=True),
+        ),
+        migrations.AlterField(
+            model_name='production',
+            name='date_recolte',
+            field=models.DateField(db_index=True),
+        ),
+        migrations.AlterField(
+            model_name='vente',
+            name='date_vente',
+            field=models.DateField(db_index=True),
+        ),
+    ]
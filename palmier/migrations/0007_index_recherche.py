@@ -0,0 +1,56 @@
+from django.db import migrations
+
+# table -> colonnes indexées (voir palmier.recherche.CHAMPS_INDEXES)
+COLONNES = {
+    'palmier_plantation': ['nom', 'localisation'],
+    'palmier_operation': ['description'],
+    'palmier_vente': ['client'],
+    'palmier_mouvementcaisse': ['description'],
+}
+
+
+def table_fts(table):
+    return 'palmier_recherche_' + table[len('palmier_'):]
+
+
+def creer_index(apps, schema_editor):
+    connexion = schema_editor.connection
+    if connexion.vendor == 'sqlite':
+        for table, colonnes in COLONNES.items():
+            contenu = " || ' ' || ".join(f"COALESCE({colonne}, '')" for colonne in colonnes)
+            schema_editor.execute(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {table_fts(table)} "
+                f"USING fts5(contenu, tokenize='trigram')"
+            )
+            schema_editor.execute(
+                f"INSERT INTO {table_fts(table)} (rowid, contenu) SELECT id, {contenu} FROM {table}"
+            )
+    elif connexion.vendor == 'postgresql':
+        schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        for table, colonnes in COLONNES.items():
+            for colonne in colonnes:
+                schema_editor.execute(
+                    f'CREATE INDEX IF NOT EXISTS {table}_{colonne}_trgm '
+                    f'ON {table} USING gin (UPPER({colonne}::text) gin_trgm_ops)'
+                )
+
+
+def supprimer_index(apps, schema_editor):
+    connexion = schema_editor.connection
+    for table, colonnes in COLONNES.items():
+        if connexion.vendor == 'sqlite':
+            schema_editor.execute(f'DROP TABLE IF EXISTS {table_fts(table)}')
+        elif connexion.vendor == 'postgresql':
+            for colonne in colonnes:
+                schema_editor.execute(f'DROP INDEX IF EXISTS {table}_{colonne}_trgm')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('palmier', '0006_index_dates'),
+    ]
+
+    operations = [
+        migrations.RunPython(creer_index, supprimer_index),
+    ]
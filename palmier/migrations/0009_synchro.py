@@ -0,0 +1,53 @@
+# Generated by Django 5.0.2 on 2026-10-19 18:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('palmier', '0008_plantation_coordonnees'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='mouvementcaisse',
+            name='date_modification',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+        migrations.AddField(
+            model_name='operation',
+            name='date_modification',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+        migrations.AddField(
+            model_name='plantation',
+            name='date_modification',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+        migrations.AddField(
+            model_name='production',
+            name='date_modification',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+        migrations.AddField(
+            model_name='vente',
+            name='date_modification',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+        migrations.CreateModel(
+            name='Suppression',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('type_objet', models.CharField(max_length=50)),
+                ('objet_id', models.BigIntegerField()),
+                ('date_suppression', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Suppression',
+                'verbose_name_plural': 'Suppressions',
+                'ordering': ['date_suppression'],
+                'indexes': [models.Index(fields=['type_objet', 'date_suppression'], name='palmier_sup_type_ob_e2d219_idx')],
+            },
+        ),
+    ]
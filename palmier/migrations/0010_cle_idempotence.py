@@ -0,0 +1,28 @@
+# Generated by Django 5.0.2 on 2026-10-19 18:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('palmier', '0009_synchro'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CleIdempotence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('cle', models.CharField(max_length=255, unique=True)),
+                ('empreinte', models.CharField(max_length=64)),
+                ('statut', models.PositiveSmallIntegerField(null=True)),
+                ('reponse', models.JSONField(null=True)),
+                ('date_creation', models.DateTimeField(auto_now_add=True, db_index=True)),
+            ],
+            options={
+                'verbose_name': "Clé d'idempotence",
+                'verbose_name_plural': "Clés d'idempotence",
+            },
+        ),
+    ]
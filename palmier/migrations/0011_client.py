@@ -0,0 +1,147 @@
+import unicodedata
+from collections import Counter, defaultdict
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Max, Sum
+
+
+def normaliser_nom(nom):
+    # Copie de palmier.models.normaliser_nom, figée pour cette migration
+    decompose = unicodedata.normalize('NFKD', nom)
+    return ' '.join(''.join(c for c in decompose if not unicodedata.combining(c)).casefold().split())
+
+
+def dedoublonner_clients(apps, schema_editor):
+    Client = apps.get_model('palmier', 'Client')
+    Vente = apps.get_model('palmier', 'Vente')
+    db = schema_editor.connection.alias
+
+    noms = Vente.objects.using(db).values_list('client_nom').annotate(nombre=Count('id')).order_by()
+    graphies = defaultdict(Counter)
+    for nom, nombre in noms:
+        graphies[normaliser_nom(nom)][' '.join(nom.split())] += nombre
+
+    # Nom affiché : la graphie la plus fréquente parmi les doublons
+    Client.objects.using(db).bulk_create([
+        Client(nom=max(compte, key=lambda graphie: (compte[graphie], graphie)), nom_normalise=cle)
+        for cle, compte in graphies.items()
+    ], batch_size=1000)
+    ids = dict(Client.objects.using(db).values_list('nom_normalise', 'pk'))
+    for nom, _ in noms:
+        Vente.objects.using(db).filter(client_nom=nom).update(client_id=ids[normaliser_nom(nom)])
+
+    cumuls = Vente.objects.using(db).values('client_id').annotate(
+        total=Sum('montant_total'), quantite=Sum('quantite'), nombre=Count('id'), dernier=Max('date_vente')
+    ).order_by()
+    clients = []
+    for ligne in cumuls:
+        clients.append(Client(
+            pk=ligne['client_id'],
+            chiffre_affaires=ligne['total'],
+            quantite_totale=ligne['quantite'],
+            nombre_achats=ligne['nombre'],
+            dernier_achat=ligne['dernier'],
+        ))
+    Client.objects.using(db).bulk_update(
+        clients, ['chiffre_affaires', 'quantite_totale', 'nombre_achats', 'dernier_achat'], batch_size=1000
+    )
+
+
+def restaurer_noms(apps, schema_editor):
+    Client = apps.get_model('palmier', 'Client')
+    Vente = apps.get_model('palmier', 'Vente')
+    db = schema_editor.connection.alias
+    for pk, nom in Client.objects.using(db).values_list('pk', 'nom'):
+        Vente.objects.using(db).filter(client_id=pk).update(client_nom=nom)
+
+
+def index_recherche_clients(apps, schema_editor):
+    # Les ventes se cherchent désormais par le nom du client (voir palmier.recherche)
+    connexion = schema_editor.connection
+    if connexion.vendor == 'sqlite':
+        schema_editor.execute('DROP TABLE IF EXISTS palmier_recherche_vente')
+        schema_editor.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS palmier_recherche_client "
+            "USING fts5(contenu, tokenize='trigram')"
+        )
+        schema_editor.execute(
+            "INSERT INTO palmier_recherche_client (rowid, contenu) SELECT id, nom FROM palmier_client"
+        )
+    elif connexion.vendor == 'postgresql':
+        schema_editor.execute(
+            'CREATE INDEX IF NOT EXISTS palmier_client_nom_trgm '
+            'ON palmier_client USING gin (UPPER(nom::text) gin_trgm_ops)'
+        )
+
+
+def supprimer_index_recherche_clients(apps, schema_editor):
+    # La colonne texte des ventes n'existe pas encore à ce stade du retour arrière :
+    # la table FTS des ventes est recréée vide (manage.py reindexer_recherche)
+    connexion = schema_editor.connection
+    if connexion.vendor == 'sqlite':
+        schema_editor.execute('DROP TABLE IF EXISTS palmier_recherche_client')
+        schema_editor.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS palmier_recherche_vente "
+            "USING fts5(contenu, tokenize='trigram')"
+        )
+    elif connexion.vendor == 'postgresql':
+        schema_editor.execute('DROP INDEX IF EXISTS palmier_client_nom_trgm')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('palmier', '0010_cle_idempotence'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Client',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nom', models.CharField(max_length=255)),
+                ('nom_normalise', models.CharField(editable=False, max_length=255, unique=True)),
+                ('chiffre_affaires', models.DecimalField(db_index=True, decimal_places=2, default=0, max_digits=14)),
+                ('quantite_totale', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('nombre_achats', models.PositiveIntegerField(default=0)),
+                ('dernier_achat', models.DateField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name': 'Client',
+                'verbose_name_plural': 'Clients',
+                'ordering': ['nom'],
+            },
+        ),
+        migrations.RenameField(
+            model_name='vente',
+            old_name='client',
+            new_name='client_nom',
+        ),
+        migrations.AddField(
+            model_name='vente',
+            name='client',
+            field=models.ForeignKey(
+                db_index=False, null=True, on_delete=django.db.models.deletion.PROTECT,
+                related_name='ventes', to='palmier.client'
+            ),
+        ),
+        migrations.RunPython(dedoublonner_clients, restaurer_noms),
+        migrations.AlterField(
+            model_name='vente',
+            name='client',
+            field=models.ForeignKey(
+                db_index=False, on_delete=django.db.models.deletion.PROTECT,
+                related_name='ventes', to='palmier.client'
+            ),
+        ),
+        migrations.RemoveField(
+            model_name='vente',
+            name='client_nom',
+        ),
+        migrations.AddIndex(
+            model_name='vente',
+            index=models.Index(fields=['client', '-date_vente'], name='palmier_vente_client_date'),
+        ),
+        migrations.RunPython(index_recherche_clients, supprimer_index_recherche_clients),
+    ]
@@ -0,0 +1,66 @@
+# Generated by Django 5.0.2 on 2026-10-19 19:06
+
+import django.db.models.expressions
+from decimal import Decimal
+from django.db import migrations, models
+from django.db.models import F
+
+
+def corriger_donnees(apps, schema_editor):
+    # Lignes que les contraintes refuseraient, laissées par les anciennes versions de Vente.save
+    # (stock rendu à la mauvaise production quand une vente en changeait, montants non recalculés)
+    Production = apps.get_model('palmier', 'Production')
+    Vente = apps.get_model('palmier', 'Vente')
+    db = schema_editor.connection.alias
+    Production.objects.using(db).filter(stock_disponible__lt=0).update(stock_disponible=0)
+    Production.objects.using(db).filter(stock_disponible__gt=F('poids_total')).update(stock_disponible=F('poids_total'))
+    ventes = []
+    for vente in Vente.objects.using(db).only('quantite', 'prix_unitaire', 'montant_total').iterator(chunk_size=2000):
+        montant_total = round(vente.quantite * vente.prix_unitaire, 2)
+        if vente.montant_total != montant_total:
+            vente.montant_total = montant_total
+            ventes.append(vente)
+    Vente.objects.using(db).bulk_update(ventes, ['montant_total'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('palmier', '0011_client'),
+    ]
+
+    operations = [
+        migrations.RunPython(corriger_donnees, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='mouvementcaisse',
+            constraint=models.CheckConstraint(check=models.Q(('montant__gt', 0)), name='palmier_mouvementcaisse_montant_positif'),
+        ),
+        migrations.AddConstraint(
+            model_name='operation',
+            constraint=models.CheckConstraint(check=models.Q(('cout__gte', 0)), name='palmier_operation_cout_positif'),
+        ),
+        migrations.AddConstraint(
+            model_name='production',
+            constraint=models.CheckConstraint(check=models.Q(('quantite__gte', 1)), name='palmier_production_quantite_positive'),
+        ),
+        migrations.AddConstraint(
+            model_name='production',
+            constraint=models.CheckConstraint(check=models.Q(('poids_total__gt', 0)), name='palmier_production_poids_positif'),
+        ),
+        migrations.AddConstraint(
+            model_name='production',
+            constraint=models.CheckConstraint(check=models.Q(('stock_disponible__gte', 0), ('stock_disponible__lte', models.F('poids_total'))), name='palmier_production_stock', violation_error_message='Le stock disponible doit rester entre 0 et le poids total'),
+        ),
+        migrations.AddConstraint(
+            model_name='vente',
+            constraint=models.CheckConstraint(check=models.Q(('quantite__gt', 0)), name='palmier_vente_quantite_positive'),
+        ),
+        migrations.AddConstraint(
+            model_name='vente',
+            constraint=models.CheckConstraint(check=models.Q(('prix_unitaire__gt', 0)), name='palmier_vente_prix_positif'),
+        ),
+        migrations.AddConstraint(
+            model_name='vente',
+            constraint=models.CheckConstraint(check=models.Q(('montant_total__gt', django.db.models.expressions.CombinedExpression(django.db.models.expressions.CombinedExpression(models.F('quantite'), '*', models.F('prix_unitaire')), '-', models.Value(Decimal('0.01')))), ('montant_total__lt', django.db.models.expressions.CombinedExpression(django.db.models.expressions.CombinedExpression(models.F('quantite'), '*', models.F('prix_unitaire')), '+', models.Value(Decimal('0.01'))))), name='palmier_vente_montant_total', violation_error_message='Le montant total doit valoir quantité × prix unitaire'),
+        ),
+    ]
@@ -1,7 +1,14 @@
-from django.db import models
-from django.core.validators import MinValueValidator
+import unicodedata
+from django.db import models, router
+from django.db.models import F, OuterRef, Q, Subquery
+from django.db.models.signals import post_save
+from django.core.validators import MinValueValidator, MaxValueValidator
 from django.core.exceptions import ValidationError
+from django.utils import timezone
 from datetime import date
+from decimal import Decimal
+from .transactions import transaction_stock
+from . import geo
 
 # Create your models here.
 
@@ -15,7 +22,19 @@ class Plantation(models.Model):
     date_plantation = models.DateField()
     nombre_arbres = models.IntegerField(validators=[MinValueValidator(1)])
     localisation = models.CharField(max_length=255)
+    latitude = models.FloatField(
+        null=True,
+        blank=True,
+        validators=[MinValueValidator(-90), MaxValueValidator(90)]
+    )
+    longitude = models.FloatField(
+        null=True,
+        blank=True,
+        validators=[MinValueValidator(-180), MaxValueValidator(180)]
+    )
+    geohash = models.CharField(max_length=12, blank=True, db_index=True, editable=False)
     description = models.TextField(blank=True)
+    date_modification = models.DateTimeField(auto_now=True, db_index=True)
 
     class Meta:
         ordering = ['nom']
@@ -28,6 +47,15 @@ class Plantation(models.Model):
     def clean(self):
         if self.date_plantation > date.today():
             raise ValidationError("La date de plantation ne peut pas être dans le futur")
+        if (self.latitude is None) != (self.longitude is None):
+            raise ValidationError("La latitude et la longitude vont ensemble")
+
+    def save(self, *args, **kwargs):
+        if self.latitude is not None and self.longitude is not None:
+            self.geohash = geo.encoder(self.latitude, self.longitude)
+        else:
+            self.geohash = ''
+        super().save(*args, **kwargs)
 
 class Operation(models.Model):
     TYPE_CHOICES = [
@@ -43,16 +71,20 @@ class Operation(models.Model):
         related_name='operations'
     )
     type_operation = models.CharField(max_length=20, choices=TYPE_CHOICES)
-    date = models.DateField()
+    date = models.DateField(db_index=True)
     cout = models.DecimalField(
         max_digits=10, 
         decimal_places=2,
         validators=[MinValueValidator(0)]
     )
     description = models.TextField()
+    date_modification = models.DateTimeField(auto_now=True, db_index=True)
 
     class Meta:
         ordering = ['-date']
+        constraints = [
+            models.CheckConstraint(check=Q(cout__gte=0), name='palmier_operation_cout_positif'),
+        ]
         verbose_name = 'Opération'
         verbose_name_plural = 'Opérations'
 
@@ -76,7 +108,7 @@ class Production(models.Model):
         on_delete=models.CASCADE, 
         related_name='productions'
     )
-    date_recolte = models.DateField()
+    date_recolte = models.DateField(db_index=True)
     quantite = models.IntegerField(validators=[MinValueValidator(1)])
     poids_total = models.DecimalField(
         max_digits=10, 
@@ -89,9 +121,19 @@ class Production(models.Model):
         validators=[MinValueValidator(0)]
     )
     qualite = models.CharField(max_length=1, choices=QUALITE_CHOICES)
+    date_modification = models.DateTimeField(auto_now=True, db_index=True)
 
     class Meta:
         ordering = ['-date_recolte']
+        constraints = [
+            models.CheckConstraint(check=Q(quantite__gte=1), name='palmier_production_quantite_positive'),
+            models.CheckConstraint(check=Q(poids_total__gt=0), name='palmier_production_poids_positif'),
+            models.CheckConstraint(
+                check=Q(stock_disponible__gte=0, stock_disponible__lte=F('poids_total')),
+                name='palmier_production_stock',
+                violation_error_message="Le stock disponible doit rester entre 0 et le poids total",
+            ),
+        ]
         verbose_name = 'Production'
         verbose_name_plural = 'Productions'
 
@@ -107,14 +149,81 @@ class Production(models.Model):
             self.stock_disponible = self.poids_total
         super().save(*args, **kwargs)
 
+    @classmethod
+    def retirer_stock(cls, production_id, quantite, using=None):
+        """
+        Retire ``quantite`` du stock (ou la remet, si elle est négative) par un
+        UPDATE conditionnel, sans relire la ligne. Renvoie False, sans rien
+        modifier, si le stock est insuffisant.
+        """
+        # update() ne passe pas par auto_now : date_modification est posée ici (synchro)
+        return cls.objects.db_manager(using).filter(
+            pk=production_id, stock_disponible__gte=quantite
+        ).update(stock_disponible=F('stock_disponible') - quantite, date_modification=timezone.now()) == 1
+
+def normaliser_nom(nom):
+    """Clé de dédoublonnage des clients : sans accents, casse ni espaces superflus."""
+    decompose = unicodedata.normalize('NFKD', nom)
+    return ' '.join(''.join(c for c in decompose if not unicodedata.combining(c)).casefold().split())
+
+class Client(models.Model):
+    nom = models.CharField(max_length=255)
+    nom_normalise = models.CharField(max_length=255, unique=True, editable=False)
+    # Cumuls tenus à jour à chaque écriture de vente (voir Client.cumuler)
+    chiffre_affaires = models.DecimalField(max_digits=14, decimal_places=2, default=0, db_index=True)
+    quantite_totale = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    nombre_achats = models.PositiveIntegerField(default=0)
+    dernier_achat = models.DateField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['nom']
+        verbose_name = 'Client'
+        verbose_name_plural = 'Clients'
+
+    def __str__(self):
+        return self.nom
+
+    def save(self, *args, **kwargs):
+        self.nom = ' '.join(self.nom.split())
+        self.nom_normalise = normaliser_nom(self.nom)
+        super().save(*args, **kwargs)
+
+    @classmethod
+    def obtenir(cls, nom, using=None):
+        """Client de ce nom (à l'orthographe près), créé s'il n'existe pas."""
+        nom = ' '.join(nom.split())
+        client, _ = cls.objects.db_manager(using).get_or_create(
+            nom_normalise=normaliser_nom(nom), defaults={'nom': nom}
+        )
+        return client
+
+    @classmethod
+    def cumuler(cls, client_id, montant, quantite, nombre, using=None):
+        """Ajoute (ou retire, avec des valeurs négatives) des achats aux cumuls du client."""
+        cls.objects.db_manager(using).filter(pk=client_id).update(
+            chiffre_affaires=F('chiffre_affaires') + montant,
+            quantite_totale=F('quantite_totale') + quantite,
+            nombre_achats=F('nombre_achats') + nombre,
+            # Lecture de l'index (client, -date_vente)
+            dernier_achat=Subquery(
+                Vente.objects.filter(client=OuterRef('pk')).order_by('-date_vente').values('date_vente')[:1]
+            ),
+        )
+
 class Vente(models.Model):
     production = models.ForeignKey(
         Production, 
         on_delete=models.CASCADE, 
         related_name='ventes'
     )
-    date_vente = models.DateField()
-    client = models.CharField(max_length=255)
+    date_vente = models.DateField(db_index=True)
+    # Index composite (client, -date_vente) ci-dessous : sert aussi les jointures
+    client = models.ForeignKey(
+        Client,
+        on_delete=models.PROTECT,
+        related_name='ventes',
+        db_index=False
+    )
     quantite = models.DecimalField(
         max_digits=10, 
         decimal_places=2,
@@ -130,18 +239,36 @@ class Vente(models.Model):
         decimal_places=2,
         editable=False
     )
+    date_modification = models.DateTimeField(auto_now=True, db_index=True)
 
     class Meta:
         ordering = ['-date_vente']
+        indexes = [models.Index(fields=['client', '-date_vente'], name='palmier_vente_client_date')]
+        constraints = [
+            models.CheckConstraint(check=Q(quantite__gt=0), name='palmier_vente_quantite_positive'),
+            models.CheckConstraint(check=Q(prix_unitaire__gt=0), name='palmier_vente_prix_positif'),
+            # À un centime près : arrondi Python (au pair) et ROUND SQL diffèrent sur les demi-centimes
+            models.CheckConstraint(
+                check=Q(
+                    montant_total__gt=F('quantite') * F('prix_unitaire') - Decimal('0.01'),
+                    montant_total__lt=F('quantite') * F('prix_unitaire') + Decimal('0.01'),
+                ),
+                name='palmier_vente_montant_total',
+                violation_error_message="Le montant total doit valoir quantité × prix unitaire",
+            ),
+        ]
         verbose_name = 'Vente'
         verbose_name_plural = 'Ventes'
 
     def __str__(self):
         return f"Vente à {self.client} - {self.date_vente} ({self.montant_total}€)"
 
-    def clean(self):
+    def verifier_date(self):
         if self.date_vente > date.today():
             raise ValidationError("La date de vente ne peut pas être dans le futur")
+
+    def clean(self):
+        self.verifier_date()
         if hasattr(self, 'production'):
             if self.quantite > self.production.stock_disponible:
                 raise ValidationError("La quantité vendue ne peut pas dépasser le stock disponible")
@@ -149,19 +276,46 @@ class Vente(models.Model):
     def save(self, *args, **kwargs):
         # Calcul du montant total avec arrondi à 2 décimales
         self.montant_total = round(self.quantite * self.prix_unitaire, 2)
-        self.full_clean()
-        
-        # Mise à jour du stock
-        if self.id:
-            # Si c'est une modification, on restaure d'abord l'ancien stock
-            ancien_vente = Vente.objects.get(id=self.id)
-            self.production.stock_disponible += ancien_vente.quantite
-            
-        # On soustrait la nouvelle quantité
-        self.production.stock_disponible -= self.quantite
-        self.production.save()
-        
-        super().save(*args, **kwargs)
+        # Contrôles sans requête : clés étrangères, stock et montants sont vérifiés par la base
+        self.clean_fields(exclude=['production', 'client'])
+        self.verifier_date()
+        using = kwargs.get('using') or router.db_for_write(Vente, instance=self)
+
+        with transaction_stock(using=using):
+            ancienne = None
+            if self.pk is not None:
+                # Si c'est une modification, l'ancienne quantité retourne au stock
+                ancienne = Vente.objects.using(using).select_for_update().filter(pk=self.pk).values(
+                    'production_id', 'client_id', 'quantite', 'montant_total'
+                ).first()
+
+            mouvements = {self.production_id: self.quantite}
+            if ancienne is not None:
+                mouvements[ancienne['production_id']] = (
+                    mouvements.get(ancienne['production_id'], 0) - ancienne['quantite']
+                )
+            mouvements = {pk: quantite for pk, quantite in mouvements.items() if quantite}
+            # Ordre fixe des verrous de ligne : pas d'interblocage entre deux ventes
+            for production_id in sorted(mouvements):
+                if not Production.retirer_stock(production_id, mouvements[production_id], using):
+                    raise ValidationError("La quantité vendue ne peut pas dépasser le stock disponible")
+            if mouvements:
+                # Stock à jour pour la réponse, et notification comme après un save()
+                productions = Production.objects.using(using).in_bulk(mouvements)
+                for production in productions.values():
+                    post_save.send(
+                        sender=Production, instance=production, created=False, raw=False,
+                        using=using, update_fields=frozenset(['stock_disponible', 'date_modification'])
+                    )
+                if self.production_id in productions:
+                    self.production = productions[self.production_id]
+
+            super().save(*args, **kwargs)
+
+            # Cumuls des clients
+            if ancienne is not None:
+                Client.cumuler(ancienne['client_id'], -ancienne['montant_total'], -ancienne['quantite'], -1, using)
+            Client.cumuler(self.client_id, self.montant_total, self.quantite, 1, using)
 
 class MouvementCaisse(models.Model):
     TYPE_CHOICES = [
@@ -169,7 +323,7 @@ class MouvementCaisse(models.Model):
         ('SORTIE', 'Sortie'),
     ]
 
-    date = models.DateField()
+    date = models.DateField(db_index=True)
     type_mouvement = models.CharField(max_length=10, choices=TYPE_CHOICES)
     montant = models.DecimalField(
         max_digits=12, 
@@ -177,9 +331,13 @@ class MouvementCaisse(models.Model):
         validators=[MinValueValidator(0.01)]
     )
     description = models.TextField()
+    date_modification = models.DateTimeField(auto_now=True, db_index=True)
 
     class Meta:
         ordering = ['-date']
+        constraints = [
+            models.CheckConstraint(check=Q(montant__gt=0), name='palmier_mouvementcaisse_montant_positif'),
+        ]
         verbose_name = 'Mouvement de caisse'
         verbose_name_plural = 'Mouvements de caisse'
 
@@ -189,3 +347,58 @@ class MouvementCaisse(models.Model):
     def clean(self):
         if self.date > date.today():
             raise ValidationError("La date du mouvement ne peut pas être dans le futur")
+
+class TacheRapport(models.Model):
+    STATUT_CHOICES = [
+        ('EN_ATTENTE', 'En attente'),
+        ('EN_COURS', 'En cours'),
+        ('TERMINEE', 'Terminée'),
+        ('ECHEC', 'Échec'),
+    ]
+
+    type_rapport = models.CharField(max_length=50)
+    parametres = models.JSONField(default=dict, blank=True)
+    statut = models.CharField(max_length=20, choices=STATUT_CHOICES, default='EN_ATTENTE', db_index=True)
+    fichier = models.FileField(upload_to='rapports/', blank=True)
+    erreur = models.TextField(blank=True)
+    date_creation = models.DateTimeField(auto_now_add=True)
+    date_debut = models.DateTimeField(null=True, blank=True)
+    date_fin = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-date_creation']
+        verbose_name = 'Tâche de rapport'
+        verbose_name_plural = 'Tâches de rapport'
+
+    def __str__(self):
+        return f"{self.type_rapport} ({self.get_statut_display()})"
+
+class Suppression(models.Model):
+    """Trace d'une ligne supprimée, pour la synchronisation incrémentale (``?since=``)."""
+    type_objet = models.CharField(max_length=50)
+    objet_id = models.BigIntegerField()
+    date_suppression = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['date_suppression']
+        indexes = [models.Index(fields=['type_objet', 'date_suppression'])]
+        verbose_name = 'Suppression'
+        verbose_name_plural = 'Suppressions'
+
+    def __str__(self):
+        return f"{self.type_objet} #{self.objet_id} ({self.date_suppression})"
+
+class CleIdempotence(models.Model):
+    """Réponse mémorisée pour un en-tête ``Idempotency-Key`` (voir ``palmier.idempotence``)."""
+    cle = models.CharField(max_length=255, unique=True)
+    empreinte = models.CharField(max_length=64)
+    statut = models.PositiveSmallIntegerField(null=True)
+    reponse = models.JSONField(null=True)
+    date_creation = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        verbose_name = "Clé d'idempotence"
+        verbose_name_plural = "Clés d'idempotence"
+
+    def __str__(self):
+        return f"{self.cle} ({self.statut})"
@@ -0,0 +1,179 @@
+"""
+Prévisions de récolte par plantation.
+
+Poids récolté au mois ``t`` : ``niveau × arbres × courbe_age(âge) × saison(mois)``.
+
+- ``courbe_age`` : courbe type du palmier à huile (entrée en production vers
+  3 ans, plein rendement de 8 à 18 ans, déclin ensuite) ;
+- ``saison`` : profil mensuel propre à la plantation, rapproché du profil de
+  l'ensemble des plantations tant que son historique est court ;
+- ``niveau`` : rendement propre à la plantation, estimé une fois l'âge et la
+  saison retirés, en donnant plus de poids aux mois récents.
+
+L'historique est lu en une seule requête ``values_list`` et toutes les
+plantations sont ajustées en une passe sur des tableaux plantations × mois.
+"""
+from datetime import date
+
+import numpy as np
+from django.db.models import Max, Min
+
+from .models import Production
+
+AGES = [0, 3, 5, 8, 18, 25, 35]
+FACTEURS_AGE = [0.0, 0.15, 0.6, 1.0, 1.0, 0.75, 0.5]
+HISTORIQUE_MOIS = 36
+DEMI_VIE_MOIS = 12
+LISSAGE_SAISON = 2  # années d'historique accordées au profil global
+HORIZON_MAX = 24
+QUALITES = [qualite for qualite, _ in Production.QUALITE_CHOICES]
+
+
+def numero_mois(valeur):
+    """Mois depuis janvier 1970 (``date``, ``datetime64`` ou tableau de dates)."""
+    return np.asarray(valeur, dtype='datetime64[M]').astype(np.int64)
+
+
+def libelle_mois(numero):
+    return str(np.datetime64(int(numero), 'M'))
+
+
+def premier_jour(numero):
+    return np.datetime64(int(numero), 'M').astype('datetime64[D]').item()
+
+
+def courbe_age(age_annees):
+    return np.interp(age_annees, AGES, FACTEURS_AGE)
+
+
+def ajuster(arbres, mois_plantation, poids, premier_mois, observe=None):
+    """
+    Ajuste le modèle sur ``poids`` (plantations × mois, colonne 0 = ``premier_mois``).
+
+    ``observe`` (plantations × mois, booléens) écarte les mois sans saisie
+    possible, antérieurs à la première récolte enregistrée : ils ne comptent
+    ni comme récolte nulle ni dans la récolte attendue.
+
+    Renvoie ``(niveau, saison)`` : un niveau par plantation et un profil
+    (plantations × 12) de moyenne 1.
+    """
+    nombre_mois = poids.shape[1]
+    mois = premier_mois + np.arange(nombre_mois)
+    attendu = arbres[:, None] * courbe_age((mois[None, :] - mois_plantation[:, None]) / 12)
+    if observe is not None:
+        attendu = attendu * observe
+    calendrier = np.eye(12)[mois % 12]  # mois × 12
+
+    # Saison : rendement relatif par mois calendaire, normalisé à une moyenne de 1
+    recolte_mois = poids @ calendrier
+    attendu_mois = attendu @ calendrier
+    with np.errstate(divide='ignore', invalid='ignore'):
+        globale = recolte_mois.sum(axis=0) / attendu_mois.sum(axis=0)
+        globale = np.where(np.isfinite(globale), globale, 0)
+        globale = globale / globale.mean() if globale.mean() > 0 else np.ones(12)
+        brute = recolte_mois / attendu_mois
+        brute = np.where(np.isfinite(brute), brute, globale)
+        moyenne = brute.mean(axis=1, keepdims=True)
+        brute = np.where(moyenne > 0, brute / moyenne, globale)
+    annees = (attendu > 0) @ calendrier
+    saison = (annees * brute + LISSAGE_SAISON * globale) / (annees + LISSAGE_SAISON)
+
+    # Niveau : récolte / récolte attendue, pondérées vers les mois récents
+    poids_temps = 0.5 ** ((nombre_mois - 1 - np.arange(nombre_mois)) / DEMI_VIE_MOIS)
+    attendu_saison = attendu * saison[:, mois % 12] * poids_temps
+    recolte = poids @ poids_temps
+    reference = attendu_saison.sum(axis=1)
+    niveau_global = recolte.sum() / reference.sum() if reference.sum() > 0 else 0.0
+    with np.errstate(divide='ignore', invalid='ignore'):
+        niveau = np.where(reference > 0, recolte / reference, niveau_global)
+    return niveau, saison
+
+
+def prevoir(arbres, mois_plantation, niveau, saison, mois_futurs):
+    """Poids prévus (plantations × mois futurs)."""
+    age = (mois_futurs[None, :] - mois_plantation[:, None]) / 12
+    return niveau[:, None] * arbres[:, None] * courbe_age(age) * saison[:, mois_futurs % 12]
+
+
+def previsions(plantations, horizon=6, aujourd_hui=None):
+    """Prévisions mensuelles de poids et de régimes pour les plantations du queryset."""
+    horizon = max(1, min(horizon, HORIZON_MAX))
+    mois_courant = numero_mois(aujourd_hui or date.today())
+    mois_futurs = mois_courant + np.arange(horizon)
+
+    lignes = list(plantations.order_by('pk').values_list('pk', 'nom', 'nombre_arbres', 'date_plantation'))
+    if not lignes:
+        return {
+            'mois': [libelle_mois(m) for m in mois_futurs],
+            'plantations': [],
+            'total': {'poids_total': [0.0] * horizon, 'quantite': [0] * horizon},
+        }
+    ids = np.array([ligne[0] for ligne in lignes])
+    arbres = np.array([ligne[2] for ligne in lignes], dtype=float)
+    mois_plantation = numero_mois([ligne[3] for ligne in lignes])
+
+    # Historique : les HISTORIQUE_MOIS mois complets jusqu'à la dernière récolte saisie
+    productions = Production.objects.using(plantations.db).filter(plantation__in=plantations.values('pk'))
+    derniere = productions.aggregate(derniere=Max('date_recolte'))['derniere']
+    dernier_mois = min(mois_courant - 1, numero_mois(derniere)) if derniere else mois_courant - 1
+    premier_mois = dernier_mois - HISTORIQUE_MOIS + 1
+    historique = list(productions.filter(date_recolte__gte=premier_jour(premier_mois)).values_list(
+        'plantation_id', 'date_recolte', 'poids_total', 'quantite', 'qualite'
+    ))
+
+    poids = np.zeros((len(ids), HISTORIQUE_MOIS))
+    regimes = np.zeros(len(ids))
+    par_qualite = np.zeros((len(ids), len(QUALITES)))
+    if historique:
+        plantation_id, date_recolte, poids_total, quantite, qualite = zip(*historique)
+        ligne = np.searchsorted(ids, plantation_id)
+        colonne = numero_mois(date_recolte) - premier_mois
+        valeurs = np.array(poids_total, dtype=float)
+        dans_fenetre = colonne < HISTORIQUE_MOIS
+        np.add.at(poids, (ligne[dans_fenetre], colonne[dans_fenetre]), valeurs[dans_fenetre])
+        np.add.at(regimes, ligne, np.array(quantite, dtype=float))
+        np.add.at(par_qualite, (ligne, np.searchsorted(QUALITES, qualite)), valeurs)
+
+    # Fenêtre de chaque plantation : à partir de son premier mois de récolte enregistré
+    premieres = dict(productions.values('plantation').annotate(premiere=Min('date_recolte')).values_list(
+        'plantation', 'premiere'
+    ).order_by())
+    premier_observe = np.array([
+        numero_mois(premieres[pk]) if pk in premieres else dernier_mois + 1 for pk in ids.tolist()
+    ])
+    observe = premier_mois + np.arange(HISTORIQUE_MOIS)[None, :] >= premier_observe[:, None]
+
+    niveau, saison = ajuster(arbres, mois_plantation, poids, premier_mois, observe)
+    prevu = prevoir(arbres, mois_plantation, niveau, saison, mois_futurs)
+
+    # Régimes et qualités : proportions observées (celles de l'ensemble à défaut)
+    total_poids = par_qualite.sum(axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        regimes_par_kg = np.where(total_poids > 0, regimes / total_poids, regimes.sum() / max(total_poids.sum(), 1))
+        repartition = np.where(
+            total_poids[:, None] > 0,
+            par_qualite / total_poids[:, None],
+            par_qualite.sum(axis=0) / max(total_poids.sum(), 1)
+        )
+    regimes_prevus = np.rint(prevu * regimes_par_kg[:, None]).astype(int)
+
+    return {
+        'mois': [libelle_mois(m) for m in mois_futurs],
+        'historique': {'debut': libelle_mois(premier_mois), 'fin': libelle_mois(dernier_mois)},
+        'plantations': [
+            {
+                'plantation': int(ids[i]),
+                'plantation_nom': lignes[i][1],
+                'niveau': round(float(niveau[i]), 3),
+                'mois_avec_recolte': int(np.count_nonzero(poids[i])),
+                'poids_total': np.round(prevu[i], 2).tolist(),
+                'quantite': regimes_prevus[i].tolist(),
+                'repartition_qualite': dict(zip(QUALITES, np.round(repartition[i], 3).tolist())),
+            }
+            for i in range(len(ids))
+        ],
+        'total': {
+            'poids_total': np.round(prevu.sum(axis=0), 2).tolist(),
+            'quantite': regimes_prevus.sum(axis=0).tolist(),
+        },
+    }
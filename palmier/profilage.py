@@ -0,0 +1,200 @@
+"""
+Profilage d'une requête à la demande, réservé au personnel (``is_staff``).
+
+- ``?_profile=1`` : la réponse est remplacée par le rapport JSON (le statut
+  d'origine y figure) ;
+- en-tête ``X-Profile: 1`` : la réponse est rendue telle quelle, le rapport
+  est écrit dans ``PROFILAGE_DOSSIER`` (avec le ``.prof`` de cProfile, lisible
+  par ``pstats`` ou snakeviz) et son nom renvoyé dans ``X-Profile-Report``.
+
+La vue tourne sous ``cProfile`` et chaque requête SQL, sur toutes les bases,
+est chronométrée avec sa ligne d'origine dans le projet (vue, sérialiseur,
+rapport...). Le rapport liste les fonctions les plus coûteuses, les requêtes
+identiques répétées et les motifs N+1 : la même requête, aux paramètres
+près, lancée au moins ``PROFILAGE_SEUIL_N_PLUS_UN`` fois depuis la même ligne.
+"""
+import cProfile
+import json
+import os
+import pstats
+import sys
+import time
+import traceback
+from collections import Counter, defaultdict
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+from django.http import JsonResponse
+from django.utils import timezone
+from rest_framework.utils.encoders import JSONEncoder
+
+PARAMETRE = '_profile'
+EN_TETE = 'X-Profile'
+EN_TETE_RAPPORT = 'X-Profile-Report'
+NOMBRE_FONCTIONS = 30
+NOMBRE_REQUETES = 200
+
+_FICHIER = os.path.abspath(__file__)
+
+
+def seuil_n_plus_un():
+    return getattr(settings, 'PROFILAGE_SEUIL_N_PLUS_UN', 5)
+
+
+def dossier():
+    return getattr(settings, 'PROFILAGE_DOSSIER', os.path.join(settings.BASE_DIR, 'profils'))
+
+
+def _du_projet(fichier):
+    if fichier.startswith('<'):
+        # <frozen importlib._bootstrap>, <string>, fonctions natives
+        return False
+    fichier = os.path.abspath(fichier)
+    return (
+        fichier.startswith(str(settings.BASE_DIR))
+        and 'site-packages' not in fichier
+        and fichier != _FICHIER
+    )
+
+
+def origine():
+    """Ligne du projet la plus proche de l'appel (``palmier/serializers.py:42 get_x``)."""
+    for cadre in reversed(traceback.extract_stack()):
+        if _du_projet(cadre.filename):
+            chemin = os.path.relpath(cadre.filename, settings.BASE_DIR)
+            return f'{chemin}:{cadre.lineno} {cadre.name}'
+    return None
+
+
+class JournalSQL:
+    """``execute_wrapper`` qui chronomètre chaque requête et note son origine."""
+
+    def __init__(self):
+        self.requetes = []
+
+    def surveiller(self, pile):
+        for connexion in connections.all():
+            pile.enter_context(connexion.execute_wrapper(self._enveloppe(connexion.alias)))
+
+    def _enveloppe(self, alias):
+        def enveloppe(execute, sql, params, many, context):
+            debut = time.perf_counter()
+            try:
+                return execute(sql, params, many, context)
+            finally:
+                self.requetes.append({
+                    'base': alias,
+                    'sql': sql,
+                    'params': None if many else params,
+                    'duree_ms': round((time.perf_counter() - debut) * 1000, 3),
+                    'origine': origine(),
+                })
+        return enveloppe
+
+    def doublons(self):
+        """Requêtes lancées plusieurs fois avec les mêmes paramètres."""
+        comptes = Counter((r['sql'], repr(r['params'])) for r in self.requetes)
+        origines = defaultdict(set)
+        for r in self.requetes:
+            origines[r['sql'], repr(r['params'])].add(r['origine'])
+        return [
+            {'sql': sql, 'params': params, 'nombre': nombre, 'origines': sorted(filter(None, origines[sql, params]))}
+            for (sql, params), nombre in comptes.most_common() if nombre > 1
+        ]
+
+    def n_plus_un(self):
+        """Même requête (paramètres exceptés) répétée depuis la même ligne."""
+        groupes = defaultdict(list)
+        for r in self.requetes:
+            groupes[r['sql'], r['origine']].append(r['duree_ms'])
+        lignes = [
+            {'sql': sql, 'origine': ligne, 'nombre': len(durees), 'duree_ms': round(sum(durees), 3)}
+            for (sql, ligne), durees in groupes.items() if len(durees) >= seuil_n_plus_un()
+        ]
+        return sorted(lignes, key=lambda ligne: -ligne['nombre'])
+
+
+def fonctions(profil, projet_seulement=False, nombre=NOMBRE_FONCTIONS):
+    """Fonctions triées par temps cumulé."""
+    statistiques = pstats.Stats(profil).stats
+    lignes = []
+    for (fichier, numero, nom), (_, appels, propre, cumule, _) in statistiques.items():
+        if projet_seulement and not _du_projet(fichier):
+            continue
+        lignes.append({
+            'fonction': nom,
+            'fichier': os.path.relpath(fichier, settings.BASE_DIR) if _du_projet(fichier) else fichier,
+            'ligne': numero,
+            'appels': appels,
+            'temps_propre_ms': round(propre * 1000, 3),
+            'temps_cumule_ms': round(cumule * 1000, 3),
+        })
+    lignes.sort(key=lambda ligne: -ligne['temps_cumule_ms'])
+    return lignes[:nombre]
+
+
+def rapport(request, response, duree, profil, journal):
+    return {
+        'requete': {
+            'methode': request.method,
+            'chemin': request.get_full_path(),
+            'statut': response.status_code,
+            'duree_ms': round(duree * 1000, 3),
+        },
+        'sql': {
+            'nombre': len(journal.requetes),
+            'duree_ms': round(sum(r['duree_ms'] for r in journal.requetes), 3),
+            'requetes': journal.requetes[:NOMBRE_REQUETES],
+        },
+        'n_plus_un': journal.n_plus_un(),
+        'doublons': journal.doublons(),
+        'fonctions_projet': fonctions(profil, projet_seulement=True),
+        'fonctions': fonctions(profil),
+    }
+
+
+def enregistrer(contenu, profil):
+    os.makedirs(dossier(), exist_ok=True)
+    nom = f"{timezone.now():%Y%m%d-%H%M%S-%f}"
+    with open(os.path.join(dossier(), f'{nom}.json'), 'w', encoding='utf-8') as fichier:
+        json.dump(contenu, fichier, cls=JSONEncoder, ensure_ascii=False, indent=2)
+    profil.dump_stats(os.path.join(dossier(), f'{nom}.prof'))
+    return nom
+
+
+class ProfilageMiddleware:
+    """À placer après ``AuthenticationMiddleware`` : le personnel est reconnu par sa session."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        en_place = request.GET.get(PARAMETRE) == '1'
+        en_tete = request.headers.get(EN_TETE) == '1'
+        utilisateur = getattr(request, 'user', None)
+        if not (en_place or en_tete) or not (utilisateur and utilisateur.is_active and utilisateur.is_staff):
+            return self.get_response(request)
+        if sys.getprofile() is not None:
+            # Un seul profileur par thread (débogueur, autre profilage en cours)
+            return self.get_response(request)
+
+        journal = JournalSQL()
+        profil = cProfile.Profile()
+        debut = time.perf_counter()
+        with ExitStack() as pile:
+            journal.surveiller(pile)
+            profil.enable()
+            try:
+                response = self.get_response(request)
+                if response.streaming and not response.get('Content-Type', '').startswith('text/event-stream'):
+                    # Les exports sont produits pendant la lecture du flux : on les mesure ici
+                    response.streaming_content = [b''.join(response.streaming_content)]
+            finally:
+                profil.disable()
+        contenu = rapport(request, response, time.perf_counter() - debut, profil, journal)
+
+        if en_place:
+            return JsonResponse(contenu, encoder=JSONEncoder)
+        response[EN_TETE_RAPPORT] = enregistrer(contenu, profil)
+        return response
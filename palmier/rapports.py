@@ -0,0 +1,487 @@
+"""
+Calculs des rapports, partagés par les vues et les tâches en arrière-plan.
+"""
+import csv
+import io
+from datetime import date
+from decimal import Decimal
+
+from django.db.models import (
+    Sum, Avg, Count, F, Q, ExpressionWrapper, FloatField, DecimalField, OuterRef, Subquery, Value,
+    Func, RowRange, Window
+)
+from django.db.models.functions import Cast, Coalesce, ExtractYear, ExtractMonth, TruncMonth, TruncWeek
+from openpyxl import Workbook
+from .models import Operation, Production, Vente, Client
+from . import series
+
+
+def top_clients(queryset, nombre=5):
+    if not queryset.query.where:
+        # Toutes les ventes : cumuls tenus à jour sur la fiche client (index sur chiffre_affaires)
+        return Client.objects.using(queryset.db).filter(nombre_achats__gt=0).order_by('-chiffre_affaires').values(
+            'nombre_achats', 'quantite_totale',
+            client=F('nom'),
+            total_achats=F('chiffre_affaires')
+        )[:nombre]
+    lignes = queryset.values('client__nom').annotate(
+        total_achats=Sum('montant_total'),
+        nombre_achats=Count('id'),
+        quantite_totale=Sum('quantite')
+    ).order_by('-total_achats')[:nombre]
+    return [{'client': ligne.pop('client__nom'), **ligne} for ligne in lignes]
+
+
+def statistiques_ventes(queryset, granularite=None, points_max=None):
+    if granularite or points_max:
+        evolution = {'evolution': series.evolution(
+            queryset, 'date_vente',
+            {'chiffre_affaires': Sum('montant_total'), 'quantite_vendue': Sum('quantite')},
+            granularite, points_max
+        )}
+    else:
+        evolution = {'evolution_mensuelle': queryset.annotate(
+            mois=ExtractMonth('date_vente'),
+            annee=ExtractYear('date_vente')
+        ).values('annee', 'mois').annotate(
+            chiffre_affaires=Sum('montant_total'),
+            quantite_vendue=Sum('quantite')
+        ).order_by('annee', 'mois')}
+    return {
+        'chiffre_affaires_total': queryset.aggregate(
+            total=Sum('montant_total')
+        )['total'] or 0,
+        'prix_moyen_kg': queryset.aggregate(
+            prix_moyen=Sum('montant_total') / Sum('quantite')
+        )['prix_moyen'] or 0,
+        **evolution,
+        'top_clients': top_clients(queryset),
+        'repartition_stock': Production.objects.annotate(
+            pourcentage_stock=ExpressionWrapper(
+                F('stock_disponible') * 100.0 / F('poids_total'),
+                output_field=FloatField()
+            )
+        ).values('plantation__nom').annotate(
+            stock_total=Sum('stock_disponible'),
+            production_totale=Sum('poids_total'),
+            pourcentage_moyen=Avg('pourcentage_stock')
+        )
+    }
+
+
+def bilan_caisse(queryset, date_debut=None, date_fin=None, granularite=None, points_max=None):
+    if date_debut:
+        queryset = queryset.filter(date__gte=date_debut)
+    if date_fin:
+        queryset = queryset.filter(date__lte=date_fin)
+
+    entrees = queryset.filter(type_mouvement='ENTREE')
+    sorties = queryset.filter(type_mouvement='SORTIE')
+
+    total_entrees = entrees.aggregate(total=Sum('montant'))['total'] or 0
+    total_sorties = sorties.aggregate(total=Sum('montant'))['total'] or 0
+
+    if granularite or points_max:
+        # Entrées et sorties en colonnes : un point par période
+        evolution = {'evolution': series.evolution(queryset, 'date', {
+            'entrees': Sum('montant', filter=Q(type_mouvement='ENTREE')),
+            'sorties': Sum('montant', filter=Q(type_mouvement='SORTIE')),
+            'nombre': Count('id'),
+        }, granularite, points_max)}
+    else:
+        evolution = {'evolution_mensuelle': queryset.annotate(
+            mois=ExtractMonth('date'),
+            annee=ExtractYear('date')
+        ).values('annee', 'mois', 'type_mouvement').annotate(
+            total=Sum('montant'),
+            nombre=Count('id')
+        ).order_by('annee', 'mois', 'type_mouvement')}
+
+    return {
+        'total_entrees': total_entrees,
+        'total_sorties': total_sorties,
+        'solde': total_entrees - total_sorties,
+        **evolution
+    }
+
+
+# date(annee - 1, 1, 1) et date(annee + 1, 1, 1) doivent exister
+PIVOT_ANNEE_MIN = date.min.year + 1
+PIVOT_ANNEE_MAX = date.max.year - 1
+
+
+def pivot_operations(queryset, annee, par_plantation=False):
+    """
+    Matrice mois × type d'opération des coûts de ``annee``, comparés à l'année
+    précédente. Une seule requête : les deux années sont lues sur une plage
+    de dates (index sur ``date``) et ventilées par des ``Sum(filter=...)``.
+    """
+    debut_annee = date(annee, 1, 1)
+    queryset = queryset.filter(date__gte=date(annee - 1, 1, 1), date__lt=date(annee + 1, 1, 1))
+    types = [type_operation for type_operation, _ in Operation.TYPE_CHOICES]
+
+    sommes = {}
+    for type_operation in types:
+        sommes[f'{type_operation}_courant'] = Sum(
+            'cout', filter=Q(type_operation=type_operation, date__gte=debut_annee)
+        )
+        sommes[f'{type_operation}_precedent'] = Sum(
+            'cout', filter=Q(type_operation=type_operation, date__lt=debut_annee)
+        )
+    groupes = ['plantation', 'plantation__nom', 'mois'] if par_plantation else ['mois']
+    lignes = queryset.annotate(mois=ExtractMonth('date')).values(*groupes).annotate(
+        **sommes
+    ).order_by(*groupes)
+
+    def cellule(courant, precedent):
+        return {
+            'courant': courant,
+            'precedent': precedent,
+            'delta': courant - precedent,
+            'variation': round((courant - precedent) * 100 / precedent, 2) if precedent else None,
+        }
+
+    def matrice(par_mois):
+        resultat = []
+        for mois in range(1, 13):
+            ligne = par_mois.get(mois, {})
+            cellules = {
+                type_operation: cellule(
+                    _arrondi(ligne.get(f'{type_operation}_courant')),
+                    _arrondi(ligne.get(f'{type_operation}_precedent'))
+                )
+                for type_operation in types
+            }
+            cellules['total'] = cellule(
+                sum(c['courant'] for c in cellules.values()),
+                sum(c['precedent'] for c in cellules.values())
+            )
+            resultat.append({'mois': mois, **cellules})
+        return resultat
+
+    if not par_plantation:
+        return {
+            'annee': annee,
+            'types': types,
+            'matrice': matrice({ligne['mois']: ligne for ligne in lignes}),
+        }
+
+    plantations = {}
+    for ligne in lignes:
+        plantation = plantations.setdefault(ligne['plantation'], {
+            'nom': ligne['plantation__nom'], 'mois': {}
+        })
+        plantation['mois'][ligne['mois']] = ligne
+    return {
+        'annee': annee,
+        'types': types,
+        'plantations': [
+            {'plantation': pk, 'plantation_nom': p['nom'], 'matrice': matrice(p['mois'])}
+            for pk, p in plantations.items()
+        ],
+    }
+
+
+def statistiques_plantations(plantations):
+    """
+    Statistiques de ``/plantations/{id}/statistiques/`` pour chaque plantation
+    du queryset, en requêtes groupées : leur nombre ne dépend pas du nombre
+    de plantations. Renvoie un dictionnaire ``id -> statistiques``.
+    """
+    lignes = list(plantations.order_by().values_list('pk', 'nombre_arbres'))
+    ids = [pk for pk, _ in lignes]
+    operations = {
+        ligne['plantation']: ligne
+        for ligne in Operation.objects.using(plantations.db).filter(plantation__in=ids).order_by().values(
+            'plantation'
+        ).annotate(total=Sum('cout'), nombre=Count('id'))
+    }
+    productions = {
+        ligne['plantation']: ligne
+        for ligne in Production.objects.using(plantations.db).filter(plantation__in=ids).order_by().values(
+            'plantation'
+        ).annotate(total=Sum('poids_total'), nombre=Count('id'), moyenne=Avg('poids_total'))
+    }
+    qualites = {
+        (plantation, qualite): nombre
+        for plantation, qualite, nombre in Production.objects.using(plantations.db).filter(
+            plantation__in=ids
+        ).order_by().values_list('plantation', 'qualite').annotate(nombre=Count('id'))
+    }
+    ventes = dict(
+        Vente.objects.using(plantations.db).filter(production__plantation__in=ids).order_by().values_list(
+            'production__plantation'
+        ).annotate(total=Sum('montant_total'))
+    )
+
+    resultat = {}
+    for pk, nombre_arbres in lignes:
+        operation = operations.get(pk, {})
+        production = productions.get(pk, {})
+        resultat[pk] = {
+            'total_cout_operations': operation.get('total') or 0,
+            'total_production': production.get('total') or 0,
+            'nombre_operations': operation.get('nombre', 0),
+            'nombre_productions': production.get('nombre', 0),
+            'rendement_moyen': (production.get('moyenne') or 0) / nombre_arbres,
+            'chiffre_affaires': ventes.get(pk) or 0,
+            'qualite_productions': {
+                qualite: qualites.get((pk, qualite), 0)
+                for qualite, _ in Production.QUALITE_CHOICES
+            }
+        }
+    return resultat
+
+
+RENTABILITE_TRIS = [
+    'nom', 'superficie', 'nombre_arbres', 'production', 'cout_operations',
+    'chiffre_affaires', 'marge', 'marge_par_hectare', 'marge_par_arbre',
+]
+
+
+def _somme_par_plantation(queryset, champ_plantation, champ):
+    """Sous-requête corrélée : somme de ``champ`` pour la plantation de la ligne."""
+    return Coalesce(
+        Subquery(
+            queryset.filter(**{champ_plantation: OuterRef('pk')}).order_by().values(champ_plantation).annotate(
+                total=Sum(champ)
+            ).values('total')
+        ),
+        Value(0),
+        output_field=DecimalField(max_digits=14, decimal_places=2)
+    )
+
+
+def rentabilite_plantations(plantations, date_debut=None, date_fin=None, tri='-marge'):
+    """
+    Coûts, chiffre d'affaires et marges de toutes les plantations en une
+    requête : une sous-requête agrégée par plantation et par table.
+    """
+    operations = Operation.objects.all()
+    productions = Production.objects.all()
+    ventes = Vente.objects.all()
+    if date_debut:
+        operations = operations.filter(date__gte=date_debut)
+        productions = productions.filter(date_recolte__gte=date_debut)
+        ventes = ventes.filter(date_vente__gte=date_debut)
+    if date_fin:
+        operations = operations.filter(date__lte=date_fin)
+        productions = productions.filter(date_recolte__lte=date_fin)
+        ventes = ventes.filter(date_vente__lte=date_fin)
+
+    # Ratios en flottant : SQLite ferait une division entière entre deux entiers
+    lignes = plantations.annotate(
+        production=_somme_par_plantation(productions, 'plantation', 'poids_total'),
+        cout_operations=_somme_par_plantation(operations, 'plantation', 'cout'),
+        chiffre_affaires=_somme_par_plantation(ventes, 'production__plantation', 'montant_total'),
+    ).annotate(
+        marge=F('chiffre_affaires') - F('cout_operations'),
+    ).annotate(
+        marge_par_hectare=ExpressionWrapper(
+            Cast('marge', FloatField()) / Cast('superficie', FloatField()), output_field=FloatField()
+        ),
+        marge_par_arbre=ExpressionWrapper(
+            Cast('marge', FloatField()) / F('nombre_arbres'), output_field=FloatField()
+        ),
+    ).order_by(tri, 'nom').values('id', 'nom', 'superficie', 'nombre_arbres', *RENTABILITE_TRIS[3:])
+
+    return [
+        {
+            'rang': rang,
+            **ligne,
+            **{cle: _arrondi(ligne[cle]) for cle in ('production', 'cout_operations', 'chiffre_affaires', 'marge')},
+            'marge_par_hectare': round(ligne['marge_par_hectare'] or 0, 2),
+            'marge_par_arbre': round(ligne['marge_par_arbre'] or 0, 2),
+        }
+        for rang, ligne in enumerate(lignes, start=1)
+    ]
+
+
+ANALYSE_PRIX_PERIODES = {'semaine': TruncWeek, 'mois': TruncMonth}
+ANALYSE_PRIX_GROUPES = {'qualite': 'production__qualite', 'client': 'client__nom'}
+ANALYSE_PRIX_FENETRES = (3, 12)
+
+
+class SommeFenetre(Func):
+    """``SUM(...)`` utilisable dans une fenêtre, y compris autour d'un agrégat."""
+    function = 'SUM'
+    window_compatible = True
+    output_field = FloatField()
+
+
+class Rapport(Func):
+    """Quotient de deux fenêtres ; ni l'un ni l'autre n'entre dans le GROUP BY."""
+    arg_joiner = ' / '
+    template = '(%(expressions)s)'
+    output_field = FloatField()
+
+    def get_group_by_cols(self):
+        return []
+
+
+def _moyenne_glissante(periodes, partition):
+    """Prix moyen pondéré par les quantités sur les ``periodes`` dernières périodes vendues."""
+    fenetre = {
+        'partition_by': [F(partition)],
+        'order_by': F('periode').asc(),
+        'frame': RowRange(start=-(periodes - 1), end=0),
+    }
+    return Rapport(
+        Window(SommeFenetre('chiffre_affaires'), **fenetre),
+        Window(SommeFenetre('quantite_vendue'), **fenetre),
+    )
+
+
+def analyse_prix(queryset, periode='mois', groupes=tuple(ANALYSE_PRIX_GROUPES)):
+    """
+    Prix unitaire moyen (pondéré par les quantités) par période et par qualité
+    ou par client, avec ses moyennes glissantes sur 3 et 12 périodes.
+
+    Une requête par regroupement : agrégats par période, puis fonctions de
+    fenêtre sur ces agrégats. Les fenêtres comptent les périodes où le groupe
+    a vendu ; les ventes écartées par ``queryset`` n'y entrent pas.
+    """
+    resultat = {'periode': periode}
+    for groupe in groupes:
+        champ = ANALYSE_PRIX_GROUPES[groupe]
+        lignes = queryset.order_by().annotate(
+            periode=ANALYSE_PRIX_PERIODES[periode]('date_vente')
+        ).values(champ, 'periode').annotate(
+            chiffre_affaires=Sum(Cast('montant_total', FloatField())),
+            quantite_vendue=Sum(Cast('quantite', FloatField())),
+        ).annotate(
+            prix_moyen=Rapport(F('chiffre_affaires'), F('quantite_vendue')),
+            **{f'moyenne_{n}': _moyenne_glissante(n, champ) for n in ANALYSE_PRIX_FENETRES},
+        ).order_by(champ, 'periode')
+        resultat[groupe] = [
+            {
+                groupe: ligne[champ],
+                'periode': ligne['periode'],
+                'quantite_vendue': round(ligne['quantite_vendue'], 2),
+                'chiffre_affaires': round(ligne['chiffre_affaires'], 2),
+                **{cle: round(ligne[cle], 4) for cle in ('prix_moyen', *(f'moyenne_{n}' for n in ANALYSE_PRIX_FENETRES))},
+            }
+            for ligne in lignes
+        ]
+    return resultat
+
+
+EXPORT_VENTES_COLONNES = [
+    ('id', 'id'),
+    ('date_vente', 'date_vente'),
+    ('client', 'client__nom'),
+    ('plantation', 'production__plantation__nom'),
+    ('qualite', 'production__qualite'),
+    ('quantite', 'quantite'),
+    ('prix_unitaire', 'prix_unitaire'),
+    ('montant_total', 'montant_total'),
+]
+
+
+def export_ventes_csv(sortie, date_debut=None, date_fin=None):
+    """Écrit les ventes en CSV dans ``sortie`` (fichier binaire), par lots."""
+    queryset = Vente.objects.order_by('date_vente', 'id')
+    if date_debut:
+        queryset = queryset.filter(date_vente__gte=date_debut)
+    if date_fin:
+        queryset = queryset.filter(date_vente__lte=date_fin)
+
+    texte = io.TextIOWrapper(sortie, encoding='utf-8', newline='', write_through=True)
+    writer = csv.writer(texte)
+    writer.writerow([entete for entete, _ in EXPORT_VENTES_COLONNES])
+    champs = [champ for _, champ in EXPORT_VENTES_COLONNES]
+    for ligne in queryset.values_list(*champs).iterator(chunk_size=2000):
+        writer.writerow(ligne)
+    texte.detach()
+
+
+class _Echo:
+    """Pseudo-fichier pour csv.writer : renvoie la ligne au lieu de l'écrire."""
+
+    def write(self, valeur):
+        return valeur
+
+
+def _arrondi(valeur):
+    # Les sommes SQLite reviennent avec des décimales parasites
+    return Decimal(valeur or 0).quantize(Decimal('0.01'))
+
+
+RAPPORT_ANNUEL_SECTIONS = {
+    'operations': ['plantation', 'type_operation', 'nombre_operations', 'total_cout'],
+    'recoltes': ['plantation', 'qualite', 'nombre_recoltes', 'nombre_regimes', 'poids_total'],
+    'ventes': ['plantation', 'client', 'nombre_ventes', 'quantite_vendue', 'chiffre_affaires'],
+    'marges': ['plantation', 'cout_operations', 'chiffre_affaires', 'marge'],
+}
+
+
+def rapport_annuel(annee, plantations=None):
+    """
+    Génère les lignes ``(section, ligne)`` du rapport annuel par plantation.
+
+    Une requête groupée par section, lue en flux ; seuls les totaux par
+    plantation sont gardés en mémoire pour la section des marges.
+    """
+    debut, fin = date(annee, 1, 1), date(annee + 1, 1, 1)
+    operations = Operation.objects.filter(date__gte=debut, date__lt=fin)
+    productions = Production.objects.filter(date_recolte__gte=debut, date_recolte__lt=fin)
+    ventes = Vente.objects.filter(date_vente__gte=debut, date_vente__lt=fin)
+    if plantations:
+        operations = operations.filter(plantation__in=plantations)
+        productions = productions.filter(plantation__in=plantations)
+        ventes = ventes.filter(production__plantation__in=plantations)
+
+    couts, chiffres = {}, {}
+
+    for nom, type_operation, nombre, total in operations.values_list(
+        'plantation__nom', 'type_operation'
+    ).annotate(nombre=Count('id'), total=Sum('cout')).order_by(
+        'plantation__nom', 'type_operation'
+    ).iterator():
+        total = _arrondi(total)
+        couts[nom] = couts.get(nom, 0) + total
+        yield 'operations', [nom, type_operation, nombre, total]
+
+    for nom, qualite, nombre, regimes, poids in productions.values_list(
+        'plantation__nom', 'qualite'
+    ).annotate(
+        nombre=Count('id'), regimes=Sum('quantite'), poids=Sum('poids_total')
+    ).order_by('plantation__nom', 'qualite').iterator():
+        yield 'recoltes', [nom, qualite, nombre, regimes, _arrondi(poids)]
+
+    for nom, client, nombre, quantite, total in ventes.values_list(
+        'production__plantation__nom', 'client__nom'
+    ).annotate(
+        nombre=Count('id'), quantite=Sum('quantite'), total=Sum('montant_total')
+    ).order_by('production__plantation__nom', 'client__nom').iterator():
+        total = _arrondi(total)
+        chiffres[nom] = chiffres.get(nom, 0) + total
+        yield 'ventes', [nom, client, nombre, _arrondi(quantite), total]
+
+    for nom in sorted(couts.keys() | chiffres.keys()):
+        cout, chiffre = couts.get(nom, 0), chiffres.get(nom, 0)
+        yield 'marges', [nom, cout, chiffre, chiffre - cout]
+
+
+def rapport_annuel_csv(annee, plantations=None):
+    """Lignes CSV du rapport annuel (un en-tête par section), pour une StreamingHttpResponse."""
+    writer = csv.writer(_Echo())
+    section_courante = None
+    for section, ligne in rapport_annuel(annee, plantations):
+        if section != section_courante:
+            section_courante = section
+            yield writer.writerow(['section'] + RAPPORT_ANNUEL_SECTIONS[section])
+        yield writer.writerow([section] + ligne)
+
+
+def rapport_annuel_xlsx(sortie, annee, plantations=None):
+    """Écrit le classeur (une feuille par section) ligne par ligne dans ``sortie``."""
+    # write_only : les lignes partent sur disque au fil de l'eau
+    classeur = Workbook(write_only=True)
+    feuilles = {}
+    for section, colonnes in RAPPORT_ANNUEL_SECTIONS.items():
+        feuilles[section] = classeur.create_sheet(title=section)
+        feuilles[section].append(colonnes)
+    for section, ligne in rapport_annuel(annee, plantations):
+        feuilles[section].append(ligne)
+    classeur.save(sortie)
@@ -0,0 +1,142 @@
+"""
+Recherche indexée sur les plantations, les clients et les descriptions.
+
+- SQLite : une table FTS5 (tokenizer ``trigram``) par modèle, dont le rowid
+  est la clé primaire de la ligne indexée. Les ventes sont cherchées par le
+  nom de leur client, dans l'index des clients (``INDEX_PAR_RELATION``).
+  Les index sont tenus à jour par
+  les signaux ``post_save``/``post_delete`` (voir ``palmier.signals``), donc
+  aussi par ``QuerySet.delete()``, qui les envoie ligne par ligne. Ni
+  ``bulk_create``, ni ``bulk_update``, ni ``QuerySet.update()``, ni le SQL direct
+  ne les envoient : après de telles écritures sur un champ indexé,
+  ``manage.py reindexer_recherche`` reconstruit les index.
+- PostgreSQL : index GIN ``gin_trgm_ops`` sur ``UPPER(colonne::text)``, qui
+  servent directement les ``icontains`` de ``SearchFilter``.
+
+Les termes de moins de 3 caractères ne passent pas par l'index trigramme :
+ils sont filtrés par un ``icontains`` sur les lignes déjà retenues.
+"""
+from django.db import connections
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+from rest_framework import filters
+
+from .models import Plantation, Operation, Vente, MouvementCaisse, Client
+
+CHAMPS_INDEXES = {
+    Plantation: ['nom', 'localisation'],
+    Operation: ['description'],
+    Client: ['nom'],
+    MouvementCaisse: ['description'],
+}
+
+# modèle cherché -> (relation, modèle indexé)
+INDEX_PAR_RELATION = {
+    Vente: ('client', Client),
+}
+
+TAILLE_TRIGRAMME = 3
+
+# (alias, base) -> tables présentes ; vidé après chaque migrate du processus (signal post_migrate)
+_tables_disponibles = {}
+
+
+def table_fts(model):
+    return f'palmier_recherche_{model._meta.model_name}'
+
+
+def fts_disponible(connexion, model):
+    """Les tables FTS5 existent-elles sur cette base (SQLite uniquement) ?"""
+    if connexion.vendor != 'sqlite':
+        return False
+    cle = (connexion.alias, connexion.settings_dict['NAME'])
+    if cle not in _tables_disponibles:
+        _tables_disponibles[cle] = set(connexion.introspection.table_names())
+    return table_fts(model) in _tables_disponibles[cle]
+
+
+def oublier_tables(using=None):
+    """Relit les tables présentes à la prochaine recherche (toutes les bases, ou ``using``)."""
+    for cle in list(_tables_disponibles):
+        if using is None or cle[0] == using:
+            del _tables_disponibles[cle]
+
+
+def contenu(instance):
+    return ' '.join(str(getattr(instance, champ) or '') for champ in CHAMPS_INDEXES[type(instance)])
+
+
+def indexer(instance, using):
+    connexion = connections[using]
+    if not fts_disponible(connexion, type(instance)):
+        return
+    with connexion.cursor() as cursor:
+        cursor.execute(
+            f'INSERT OR REPLACE INTO {table_fts(type(instance))} (rowid, contenu) VALUES (%s, %s)',
+            [instance.pk, contenu(instance)]
+        )
+
+
+def desindexer(instance, using):
+    connexion = connections[using]
+    if not fts_disponible(connexion, type(instance)):
+        return
+    with connexion.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {table_fts(type(instance))} WHERE rowid = %s', [instance.pk])
+
+
+def reindexer(model, using='default', taille_lot=2000):
+    connexion = connections[using]
+    oublier_tables(using)
+    if not fts_disponible(connexion, model):
+        return 0
+    table = table_fts(model)
+    nombre = 0
+    with connexion.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {table}')
+        lot = []
+        for instance in model.objects.using(using).only('pk', *CHAMPS_INDEXES[model]).iterator(chunk_size=taille_lot):
+            lot.append((instance.pk, contenu(instance)))
+            if len(lot) >= taille_lot:
+                cursor.executemany(f'INSERT INTO {table} (rowid, contenu) VALUES (%s, %s)', lot)
+                nombre += len(lot)
+                lot = []
+        if lot:
+            cursor.executemany(f'INSERT INTO {table} (rowid, contenu) VALUES (%s, %s)', lot)
+            nombre += len(lot)
+    return nombre
+
+
+class RechercheFilter(filters.SearchFilter):
+    """
+    ``SearchFilter`` servi par l'index FTS5 sur SQLite (même paramètre ``?search=``).
+
+    Sur les autres bases, et pour les termes trop courts, on garde le
+    comportement de ``SearchFilter`` (``icontains``, indexé par trigrammes
+    sur PostgreSQL).
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        termes = self.get_search_terms(request)
+        relation, model = INDEX_PAR_RELATION.get(queryset.model, ('pk', queryset.model))
+        connexion = connections[queryset.db]
+        if not termes or not fts_disponible(connexion, model):
+            return super().filter_queryset(request, queryset, view)
+
+        longs = [terme for terme in termes if len(terme) >= TAILLE_TRIGRAMME]
+        if longs:
+            # Chaque terme entre guillemets : sous-chaîne, tous les termes requis
+            requete = ' '.join('"%s"' % terme.replace('"', '""') for terme in longs)
+            table = table_fts(model)
+            queryset = queryset.filter(**{
+                f'{relation}__in': RawSQL(f'SELECT rowid FROM {table} WHERE {table} MATCH %s', [requete])
+            })
+
+        champs = self.get_search_fields(view, request) or CHAMPS_INDEXES[model]
+        for terme in termes:
+            if len(terme) < TAILLE_TRIGRAMME:
+                conditions = Q()
+                for champ in champs:
+                    conditions |= Q(**{f'{champ}__icontains': terme})
+                queryset = queryset.filter(conditions)
+        return queryset
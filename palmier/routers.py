@@ -0,0 +1,166 @@
+"""
+Routage des lectures statistiques vers un réplica en lecture.
+
+Le réplica est optionnel : tant que l'alias ``replica`` n'est pas déclaré dans
+``DATABASES``, toutes les requêtes restent sur ``default``. Les actions
+décorées avec ``sur_replica`` lisent sur le réplica, sauf si le client vient
+d'écrire (fenêtre ``REPLICA_LAG_TOLERANCE``) ou si la requête courante a déjà
+écrit : on lit alors sur le primaire pour voir ses propres écritures.
+
+L'épinglage après une écriture ne vaut que pour la portée qui l'a ouverte
+(la requête dans ``ReplicaPinningMiddleware``, sinon le bloc
+``lecture_replica``, par exemple dans un thread de rapports) : il ne survit
+pas à la requête dans le thread ou la tâche qui la servait.
+"""
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models.query import QuerySet
+
+REPLICA = 'replica'
+COOKIE_ECRITURE = 'palmier_ecriture'
+
+_lecture_replica = ContextVar('lecture_replica', default=False)
+# Portée d'épinglage : [bool] modifiable, partagé par tout le code de la portée ; None hors portée
+_epingle_primaire = ContextVar('epingle_primaire', default=None)
+
+
+def replica_disponible():
+    return REPLICA in settings.DATABASES
+
+
+def tolerance_retard():
+    return getattr(settings, 'REPLICA_LAG_TOLERANCE', 5)
+
+
+@contextmanager
+def portee_epinglage(epingle=False):
+    """Portée où une écriture épingle les lectures suivantes sur le primaire."""
+    token = _epingle_primaire.set([epingle])
+    try:
+        yield
+    finally:
+        _epingle_primaire.reset(token)
+
+
+def epingle():
+    portee = _epingle_primaire.get()
+    return portee is not None and portee[0]
+
+
+@contextmanager
+def lecture_replica():
+    """Envoie les lectures du bloc vers le réplica (si disponible)."""
+    token = _lecture_replica.set(True)
+    try:
+        if _epingle_primaire.get() is None:
+            # Hors requête (thread de rapports) : le bloc est sa propre portée
+            with portee_epinglage():
+                yield
+        else:
+            yield
+    finally:
+        _lecture_replica.reset(token)
+
+
+def en_lecture_replica(iterable):
+    """
+    Itère ``iterable`` en lisant sur le réplica, pour les réponses en flux
+    (consommées après la sortie de la vue, donc hors de ``sur_replica``).
+    """
+    iterateur = iter(iterable)
+    while True:
+        with lecture_replica():
+            try:
+                element = next(iterateur)
+            except StopIteration:
+                return
+        yield element
+
+
+def _evaluer(data):
+    # Les réponses contiennent des QuerySets paresseux, évalués au rendu,
+    # donc hors du bloc lecture_replica : on les évalue ici.
+    if isinstance(data, QuerySet):
+        return list(data)
+    if isinstance(data, dict):
+        return {cle: _evaluer(valeur) for cle, valeur in data.items()}
+    return data
+
+
+def sur_replica(vue):
+    """Décorateur pour les actions statistiques et les exports en lecture seule."""
+    @wraps(vue)
+    def wrapper(*args, **kwargs):
+        with lecture_replica():
+            response = vue(*args, **kwargs)
+            if hasattr(response, 'data'):
+                response.data = _evaluer(response.data)
+            return response
+    return wrapper
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if _lecture_replica.get() and not epingle() and replica_disponible():
+            return REPLICA
+        return None
+
+    def db_for_write(self, model, **hints):
+        # Lecture après écriture : la suite de la portée (requête ou bloc) reste sur le primaire
+        portee = _epingle_primaire.get()
+        if portee is not None:
+            portee[0] = True
+        instance = hints.get('instance')
+        if instance is not None and instance._state.db == REPLICA:
+            return DEFAULT_DB_ALIAS
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        bases = {DEFAULT_DB_ALIAS, REPLICA}
+        if obj1._state.db in bases and obj2._state.db in bases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db == REPLICA:
+            return False
+        return None
+
+
+class ReplicaPinningMiddleware:
+    """
+    Garde sur le primaire les clients qui viennent d'écrire.
+
+    Après une requête d'écriture réussie, un cookie valable
+    ``REPLICA_LAG_TOLERANCE`` secondes épingle les lectures du client sur le
+    primaire, le temps que le réplica rattrape son retard.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        derniere_ecriture = request.COOKIES.get(COOKIE_ECRITURE)
+        try:
+            recent = time.time() - float(derniere_ecriture) < tolerance_retard()
+        except (TypeError, ValueError):
+            recent = False
+
+        with portee_epinglage(recent):
+            response = self.get_response(request)
+
+        if (replica_disponible() and request.method not in ('GET', 'HEAD', 'OPTIONS')
+                and response.status_code < 400):
+            response.set_cookie(
+                COOKIE_ECRITURE,
+                str(time.time()),
+                max_age=tolerance_retard(),
+                httponly=True,
+                samesite='Lax',
+            )
+        return response
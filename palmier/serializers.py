@@ -1,5 +1,11 @@
+from decimal import Decimal
+
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.urls import reverse
 from rest_framework import serializers
-from .models import Plantation, Operation, Production, Vente, MouvementCaisse
+from rest_framework.settings import api_settings
+from .models import Plantation, Operation, Production, Vente, MouvementCaisse, TacheRapport, Client
+from .taches import TYPES_RAPPORT
 
 class PlantationSerializer(serializers.ModelSerializer):
     nombre_operations = serializers.IntegerField(read_only=True)
@@ -10,22 +16,38 @@ class PlantationSerializer(serializers.ModelSerializer):
         model = Plantation
         fields = [
             'id', 'nom', 'superficie', 'date_plantation', 
-            'nombre_arbres', 'localisation', 'description',
+            'nombre_arbres', 'localisation', 'latitude', 'longitude',
+            'geohash', 'description',
             'nombre_operations', 'nombre_productions', 'rendement_moyen'
         ]
 
     def to_representation(self, instance):
         data = super().to_representation(instance)
-        data['nombre_operations'] = instance.operations.count()
-        data['nombre_productions'] = instance.productions.count()
-        productions = instance.productions.all()
-        if productions:
+        if hasattr(instance, 'poids_productions'):
+            # Compteurs annotés par PlantationViewSet.get_queryset
+            nombre_productions = instance.nombre_productions
+            total_poids = Decimal(instance.poids_productions).quantize(Decimal('0.01'))
+        else:
+            productions = instance.productions.all()
+            nombre_productions = len(productions)
             total_poids = sum(p.poids_total for p in productions)
-            data['rendement_moyen'] = total_poids / len(productions)
+            data['nombre_operations'] = instance.operations.count()
+        data['nombre_productions'] = nombre_productions
+        if nombre_productions:
+            data['rendement_moyen'] = total_poids / nombre_productions
         else:
             data['rendement_moyen'] = 0
         return data
 
+    def validate(self, data):
+        latitude = data.get('latitude', getattr(self.instance, 'latitude', None))
+        longitude = data.get('longitude', getattr(self.instance, 'longitude', None))
+        if (latitude is None) != (longitude is None):
+            raise serializers.ValidationError(
+                "La latitude et la longitude vont ensemble"
+            )
+        return data
+
 class OperationSerializer(serializers.ModelSerializer):
     plantation_nom = serializers.CharField(source='plantation.nom', read_only=True)
     type_operation_display = serializers.CharField(source='get_type_operation_display', read_only=True)
@@ -58,6 +80,23 @@ class ProductionSerializer(serializers.ModelSerializer):
             return (obj.stock_disponible / obj.poids_total) * 100
         return 0
 
+    def validate(self, data):
+        if self.instance is None:
+            # Création : Production.save part d'un stock égal au poids total
+            return data
+        if 'poids_total' in data and 'stock_disponible' not in data:
+            # Poids corrigé : le stock suit, les quantités déjà vendues restent vendues
+            data['stock_disponible'] = (
+                self.instance.stock_disponible + data['poids_total'] - self.instance.poids_total
+            )
+        poids_total = data.get('poids_total', self.instance.poids_total)
+        stock = data.get('stock_disponible', self.instance.stock_disponible)
+        if not 0 <= stock <= poids_total:
+            raise serializers.ValidationError(
+                "Le stock disponible doit rester entre 0 et le poids total (quantités déjà vendues comprises)"
+            )
+        return data
+
     def to_representation(self, instance):
         data = super().to_representation(instance)
         if instance.plantation.nombre_arbres > 0:
@@ -67,6 +106,9 @@ class ProductionSerializer(serializers.ModelSerializer):
         return data
 
 class VenteSerializer(serializers.ModelSerializer):
+    # Le client reste saisi et affiché par son nom ; la fiche Client est retrouvée ou créée
+    client = serializers.CharField(max_length=255)
+    client_id = serializers.IntegerField(read_only=True)
     production_details = ProductionSerializer(source='production', read_only=True)
     prix_moyen_kg = serializers.DecimalField(max_digits=10, decimal_places=2, read_only=True)
     stock_restant = serializers.DecimalField(source='production.stock_disponible', read_only=True, max_digits=10, decimal_places=2)
@@ -75,7 +117,7 @@ class VenteSerializer(serializers.ModelSerializer):
         model = Vente
         fields = [
             'id', 'production', 'production_details',
-            'date_vente', 'client', 'quantite',
+            'date_vente', 'client', 'client_id', 'quantite',
             'prix_unitaire', 'montant_total', 
             'prix_moyen_kg', 'stock_restant'
         ]
@@ -89,13 +131,31 @@ class VenteSerializer(serializers.ModelSerializer):
             data['prix_moyen_kg'] = 0
         return data
 
-    def validate(self, data):
-        if 'production' in data and 'quantite' in data:
-            if data['quantite'] > data['production'].stock_disponible:
-                raise serializers.ValidationError(
-                    "La quantité vendue ne peut pas dépasser le stock disponible"
-                )
-        return data
+    # Le stock est contrôlé par Vente.save(), sur sa valeur courante et dans la
+    # même requête que sa mise à jour : ses refus deviennent des erreurs 400
+    def create(self, validated_data):
+        validated_data['client'] = Client.obtenir(validated_data['client'])
+        try:
+            return super().create(validated_data)
+        except DjangoValidationError as erreur:
+            raise serializers.ValidationError({api_settings.NON_FIELD_ERRORS_KEY: erreur.messages})
+
+    def update(self, instance, validated_data):
+        if 'client' in validated_data:
+            validated_data['client'] = Client.obtenir(validated_data['client'])
+        try:
+            return super().update(instance, validated_data)
+        except DjangoValidationError as erreur:
+            raise serializers.ValidationError({api_settings.NON_FIELD_ERRORS_KEY: erreur.messages})
+
+class ClientSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Client
+        fields = [
+            'id', 'nom', 'chiffre_affaires',
+            'quantite_totale', 'nombre_achats', 'dernier_achat'
+        ]
+        read_only_fields = ['chiffre_affaires', 'quantite_totale', 'nombre_achats', 'dernier_achat']
 
 class MouvementCaisseSerializer(serializers.ModelSerializer):
     type_mouvement_display = serializers.CharField(source='get_type_mouvement_display', read_only=True)
@@ -113,4 +173,26 @@ class MouvementCaisseSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError(
                 "Le montant doit être supérieur à 0"
             )
-        return value 
\ No newline at end of file
+        return value
+
+class TacheRapportSerializer(serializers.ModelSerializer):
+    type_rapport = serializers.ChoiceField(choices=sorted(TYPES_RAPPORT))
+    statut_display = serializers.CharField(source='get_statut_display', read_only=True)
+    url_telechargement = serializers.SerializerMethodField()
+
+    class Meta:
+        model = TacheRapport
+        fields = [
+            'id', 'type_rapport', 'parametres',
+            'statut', 'statut_display', 'erreur',
+            'date_creation', 'date_debut', 'date_fin',
+            'url_telechargement'
+        ]
+        read_only_fields = ['statut', 'erreur', 'date_creation', 'date_debut', 'date_fin']
+
+    def get_url_telechargement(self, obj):
+        if obj.statut != 'TERMINEE':
+            return None
+        request = self.context.get('request')
+        url = reverse('tacherapport-telecharger', args=[obj.pk])
+        return request.build_absolute_uri(url) if request else url
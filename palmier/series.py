@@ -0,0 +1,108 @@
+"""
+Séries temporelles des graphiques : ``?granularite=`` et ``?points_max=``.
+
+Les actions statistiques (ventes, productions, caisse) renvoient par défaut
+``evolution_mensuelle``, un point par mois depuis la première écriture. Avec
+``?granularite=jour|semaine|mois|trimestre|annee``, elles renvoient à la place
+``evolution`` : les lignes sont regroupées par la base (``Trunc*``) et les
+périodes sans écriture sont complétées à zéro, pour un axe des dates régulier.
+
+``?points_max=N`` borne la taille de la série, quelle que soit l'étendue de
+l'historique : au-delà de N périodes, la série est réduite par l'algorithme
+LTTB (Largest-Triangle-Three-Buckets), qui garde les points dessinant le
+mieux la courbe de la première mesure (pics et creux compris) plutôt qu'un
+point sur k. Le premier et le dernier point sont toujours gardés.
+"""
+from datetime import date
+
+from django.db.models.functions import TruncDay, TruncMonth, TruncQuarter, TruncWeek, TruncYear
+
+GRANULARITES = {
+    'jour': TruncDay,
+    'semaine': TruncWeek,
+    'mois': TruncMonth,
+    'trimestre': TruncQuarter,
+    'annee': TruncYear,
+}
+GRANULARITE_DEFAUT = 'mois'
+POINTS_MIN = 3  # LTTB garde au moins le premier, le dernier et un point intermédiaire
+
+# Mois ajoutés pour passer à la période suivante
+PAS_MOIS = {'mois': 1, 'trimestre': 3, 'annee': 12}
+
+
+def suivante(periode, granularite):
+    """Début de la période qui suit ``periode`` (déjà tronquée)."""
+    if granularite == 'jour':
+        return date.fromordinal(periode.toordinal() + 1)
+    if granularite == 'semaine':
+        return date.fromordinal(periode.toordinal() + 7)
+    mois = periode.year * 12 + periode.month - 1 + PAS_MOIS[granularite]
+    return date(mois // 12, mois % 12 + 1, 1)
+
+
+def serie(queryset, champ_date, granularite, valeurs):
+    """
+    ``[{'periode': date, **valeurs}]`` de la première à la dernière période,
+    une ligne par période : ``valeurs`` (nom -> agrégat) est calculé par la
+    base, les périodes vides valent 0.
+    """
+    lignes = queryset.annotate(
+        periode=GRANULARITES[granularite](champ_date)
+    ).values('periode').annotate(**valeurs).order_by('periode')
+    par_periode = {}
+    for ligne in lignes:
+        periode = ligne.pop('periode')
+        # TruncDay & co. renvoient un datetime quand le champ en est un
+        periode = periode.date() if hasattr(periode, 'date') else periode
+        par_periode[periode] = {nom: valeur or 0 for nom, valeur in ligne.items()}
+    if not par_periode:
+        return []
+
+    points = []
+    periode, fin = min(par_periode), max(par_periode)
+    while periode <= fin:
+        points.append({'periode': periode, **par_periode.get(periode, dict.fromkeys(valeurs, 0))})
+        periode = suivante(periode, granularite)
+    return points
+
+
+def lttb(points, nombre, cle):
+    """
+    ``nombre`` points de ``points`` choisis par Largest-Triangle-Three-Buckets
+    sur la mesure ``cle`` ; la série est renvoyée telle quelle si elle est
+    déjà assez courte.
+    """
+    if nombre >= len(points) or nombre < POINTS_MIN:
+        return points
+    xs = [point['periode'].toordinal() for point in points]
+    ys = [float(point[cle]) for point in points]
+    # Les points intermédiaires sont répartis en nombre - 2 seaux ; un point gardé par seau
+    taille_seau = (len(points) - 2) / (nombre - 2)
+
+    gardes = [0]
+    precedent = 0
+    for seau in range(nombre - 2):
+        debut = int(seau * taille_seau) + 1
+        fin = int((seau + 1) * taille_seau) + 1
+        # Sommet du triangle : moyenne du seau suivant (le dernier point pour le dernier seau)
+        suivant_fin = min(int((seau + 2) * taille_seau) + 1, len(points))
+        moyenne_x = sum(xs[fin:suivant_fin]) / (suivant_fin - fin)
+        moyenne_y = sum(ys[fin:suivant_fin]) / (suivant_fin - fin)
+
+        x_a, y_a = xs[precedent], ys[precedent]
+        precedent = max(
+            range(debut, fin),
+            key=lambda i: abs((x_a - moyenne_x) * (ys[i] - y_a) - (x_a - xs[i]) * (moyenne_y - y_a))
+        )
+        gardes.append(precedent)
+    gardes.append(len(points) - 1)
+    return [points[i] for i in gardes]
+
+
+def evolution(queryset, champ_date, valeurs, granularite=None, points_max=None):
+    """Série complétée de ``granularite`` (mois par défaut), réduite à ``points_max`` points sur la première mesure."""
+    points = serie(queryset, champ_date, granularite or GRANULARITE_DEFAUT, valeurs)
+    if points_max:
+        points = lttb(points, points_max, next(iter(valeurs)))
+    return points
@@ -2,6 +2,7 @@ import os
 from pathlib import Path
 from dotenv import load_dotenv
 import dj_database_url
+from corsheaders.defaults import default_headers
 
 load_dotenv()
 
@@ -33,11 +34,14 @@ INSTALLED_APPS = [
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
+    'palmier.compression.CompressionMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'palmier.profilage.ProfilageMiddleware',
+    'palmier.routers.ReplicaPinningMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -70,6 +74,26 @@ DATABASES = {
     )
 }
 
+# SQLite en WAL avec pragmas réglés pour un déploiement mono-serveur
+if DATABASES['default']['ENGINE'] == 'django.db.backends.sqlite3':
+    DATABASES['default']['ENGINE'] = 'palmier.backends.sqlite3'
+
+# Réplica en lecture optionnel pour les statistiques et les exports
+# (en local : DATABASE_REPLICA_URL=sqlite:///replica.sqlite3)
+if os.getenv('DATABASE_REPLICA_URL'):
+    DATABASES['replica'] = dj_database_url.parse(
+        os.getenv('DATABASE_REPLICA_URL'),
+        conn_max_age=600
+    )
+    DATABASES['replica']['TEST'] = {'MIRROR': 'default'}
+    if DATABASES['replica']['ENGINE'] == 'django.db.backends.sqlite3':
+        DATABASES['replica']['ENGINE'] = 'palmier.backends.sqlite3'
+
+DATABASE_ROUTERS = ['palmier.routers.ReplicaRouter']
+
+# Délai (secondes) pendant lequel un client qui vient d'écrire lit sur le primaire
+REPLICA_LAG_TOLERANCE = int(os.getenv('REPLICA_LAG_TOLERANCE', 5))
+
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -98,7 +122,35 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 STATICFILES_DIRS = [
     os.path.join(BASE_DIR, 'frontend', 'build', 'static'),
 ]
-STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
+STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    # Noms hachés et copies .gz/.br produites par collectstatic
+    'staticfiles': {'BACKEND': 'whitenoise.storage.CompressedManifestStaticFilesStorage'},
+}
+# Fichiers à la racine du build React (favicon.ico, manifest.json, robots.txt...)
+WHITENOISE_ROOT = os.path.join(BASE_DIR, 'frontend', 'build')
+# Noms hachés par Django (12 caractères) ou par le build React (8) : cache d'un an, immutable
+WHITENOISE_IMMUTABLE_FILE_TEST = r'\.[0-9a-f]{8,12}\.'
+# Page d'entrée servie depuis la mémoire (palmier.frontend)
+FRONTEND_INDEX = os.path.join(BASE_DIR, 'frontend', 'build', 'index.html')
+
+# Fichiers produits par les rapports en arrière-plan
+MEDIA_URL = 'media/'
+MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+
+# Nombre de threads exécutant les rapports en arrière-plan (par processus)
+RAPPORTS_WORKERS = int(os.getenv('RAPPORTS_WORKERS', 2))
+# Au-delà, une tâche « en cours » trouvée au démarrage est passée en échec
+RAPPORTS_DUREE_MAX_MINUTES = int(os.getenv('RAPPORTS_DUREE_MAX_MINUTES', 60))
+
+# Synchronisation incrémentale (?since=) : durée de conservation des suppressions
+SYNCHRO_RETENTION_JOURS = int(os.getenv('SYNCHRO_RETENTION_JOURS', 30))
+
+# Durée de vie des clés Idempotency-Key
+IDEMPOTENCE_TTL_HEURES = int(os.getenv('IDEMPOTENCE_TTL_HEURES', 24))
+
+# Compression gzip/brotli des réponses de l'API à partir de cette taille (octets)
+COMPRESSION_TAILLE_MIN = int(os.getenv('COMPRESSION_TAILLE_MIN', 1024))
 
 # Default primary key field type
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
@@ -106,6 +158,8 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # CORS settings
 CORS_ALLOWED_ORIGINS = os.getenv('CORS_ALLOWED_ORIGINS', '').split(',')
 CORS_ALLOW_CREDENTIALS = True
+CORS_ALLOW_HEADERS = (*default_headers, 'idempotency-key', 'x-profile')
+CORS_EXPOSE_HEADERS = ['Idempotent-Replayed', 'X-Profile-Report']
 
 # REST Framework settings
 REST_FRAMEWORK = {
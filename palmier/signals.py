@@ -0,0 +1,59 @@
+from django.db import transaction
+from django.db.models.signals import post_migrate, post_save, post_delete
+from django.dispatch import receiver
+
+from . import recherche, synchro
+from .evenements import diffuseur, evenement
+from .models import Plantation, Operation, Production, Vente, MouvementCaisse, Client
+
+
+@receiver(post_save, sender=Plantation)
+@receiver(post_save, sender=Operation)
+@receiver(post_save, sender=Client)
+@receiver(post_save, sender=MouvementCaisse)
+def indexer_recherche(sender, instance, using, **kwargs):
+    recherche.indexer(instance, using)
+
+
+@receiver(post_delete, sender=Plantation)
+@receiver(post_delete, sender=Operation)
+@receiver(post_delete, sender=Client)
+@receiver(post_delete, sender=MouvementCaisse)
+def desindexer_recherche(sender, instance, using, **kwargs):
+    recherche.desindexer(instance, using)
+
+
+@receiver(post_migrate)
+def oublier_tables_recherche(using, **kwargs):
+    # Une migration a pu créer ou supprimer des tables FTS5
+    recherche.oublier_tables(using)
+
+
+@receiver(post_delete, sender=Vente)
+def decompter_vente_client(sender, instance, using, **kwargs):
+    Client.cumuler(instance.client_id, -instance.montant_total, -instance.quantite, -1, using)
+
+
+@receiver(post_save, sender=Vente)
+@receiver(post_save, sender=Production)
+@receiver(post_save, sender=MouvementCaisse)
+def publier_ecriture(sender, instance, created, using, **kwargs):
+    donnees = evenement(instance, 'creation' if created else 'modification')
+    transaction.on_commit(lambda: diffuseur.publier(donnees), using=using)
+
+
+@receiver(post_delete, sender=Vente)
+@receiver(post_delete, sender=Production)
+@receiver(post_delete, sender=MouvementCaisse)
+def publier_suppression(sender, instance, using, **kwargs):
+    donnees = evenement(instance, 'suppression')
+    transaction.on_commit(lambda: diffuseur.publier(donnees), using=using)
+
+
+@receiver(post_delete, sender=Plantation)
+@receiver(post_delete, sender=Operation)
+@receiver(post_delete, sender=Production)
+@receiver(post_delete, sender=Vente)
+@receiver(post_delete, sender=MouvementCaisse)
+def tracer_suppression(sender, instance, using, **kwargs):
+    synchro.enregistrer_suppression(instance, using)
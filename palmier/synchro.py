@@ -0,0 +1,130 @@
+"""
+Synchronisation incrémentale : ``GET /api/<ressource>/?since=<jeton>``.
+
+Chaque modèle porte ``date_modification`` (indexée) et chaque suppression
+laisse une trace dans ``Suppression`` (signal ``post_delete``). Avec
+``?since=``, la liste ne renvoie que les lignes créées ou modifiées après le
+jeton, les identifiants supprimés depuis, et le jeton à utiliser ensuite :
+
+    {"jeton": "...", "complet": true, "modifies": [...], "supprimes": [3, 8]}
+
+``?since=0`` sert au chargement initial. Les lignes arrivent par lots de
+``SYNCHRO_TAILLE_LOT`` ; tant que ``complet`` vaut ``false``, on rappelle
+avec le nouveau jeton.
+
+Une écriture peut être datée avant une lecture mais validée après : aucun
+jeton ne dépasse donc ``maintenant - SYNCHRO_MARGE`` secondes, sur aucune
+page. Un lot n'est coupé (jeton exact ``(date, pk)`` de sa dernière ligne)
+que dans les lignes plus anciennes que cette borne, que plus aucune
+validation tardive ne peut précéder ; s'il atteint la fenêtre de marge, il
+se prolonge jusqu'à la dernière ligne et le jeton recule à la borne.
+Quelques lignes peuvent être renvoyées deux fois, le client les remplace.
+
+Les traces de suppression sont gardées ``SYNCHRO_RETENTION_JOURS`` jours
+(``manage.py purger_suppressions``) ; un jeton plus ancien reçoit un 410 et
+le client recharge toute la collection.
+"""
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
+
+from .models import Suppression
+
+
+def taille_lot():
+    return getattr(settings, 'SYNCHRO_TAILLE_LOT', 500)
+
+
+def marge():
+    return timedelta(seconds=getattr(settings, 'SYNCHRO_MARGE', 5))
+
+
+def retention():
+    return timedelta(days=getattr(settings, 'SYNCHRO_RETENTION_JOURS', 30))
+
+
+def encoder_jeton(moment, pk=0):
+    """Jeton opaque : microsecondes depuis l'epoch et clé primaire (départage)."""
+    micro = (moment - datetime(1970, 1, 1, tzinfo=dt_timezone.utc)) // timedelta(microseconds=1)
+    return f'{micro}.{pk}'
+
+
+def decoder_jeton(jeton):
+    """``(moment, pk)`` du jeton, ``None`` pour ``0`` (tout depuis le début)."""
+    if jeton == '0':
+        return None
+    try:
+        micro, pk = (int(partie) for partie in jeton.split('.'))
+        # OverflowError : au-delà de timedelta ou de datetime (années 1 à 9999)
+        moment = datetime(1970, 1, 1, tzinfo=dt_timezone.utc) + timedelta(microseconds=micro)
+    except (ValueError, OverflowError):
+        raise ValidationError({'since': "Jeton de synchronisation invalide"})
+    return moment, pk
+
+
+def apres(queryset, moment, pk):
+    """Lignes strictement après ``(moment, pk)`` dans l'ordre ``(date_modification, pk)``."""
+    # La borne ``gte`` seule permet une recherche par intervalle sur l'index
+    return queryset.filter(date_modification__gte=moment).exclude(date_modification=moment, pk__lte=pk)
+
+
+def enregistrer_suppression(instance, using):
+    Suppression.objects.using(using).create(type_objet=instance._meta.model_name, objet_id=instance.pk)
+
+
+def purger(using='default'):
+    limite = timezone.now() - retention()
+    return Suppression.objects.using(using).filter(date_suppression__lt=limite).delete()[0]
+
+
+class SynchroMixin:
+    """Ajoute le mode ``?since=<jeton>`` à l'action ``list`` d'un ``ModelViewSet``."""
+
+    def list(self, request, *args, **kwargs):
+        if 'since' not in request.query_params:
+            return super().list(request, *args, **kwargs)
+
+        maintenant = timezone.now()
+        depuis = decoder_jeton(request.query_params['since'])
+        if depuis is not None and depuis[0] < maintenant - retention():
+            return Response(
+                {'detail': "Jeton expiré : rechargez la collection avec ?since=0"},
+                status=status.HTTP_410_GONE
+            )
+
+        queryset = self.filter_queryset(self.get_queryset()).order_by('date_modification', 'pk')
+        supprimes = []
+        if depuis is not None:
+            moment, pk = depuis
+            queryset = apres(queryset, moment, pk)
+            supprimes = list(
+                Suppression.objects.using(queryset.db).filter(
+                    type_objet=queryset.model._meta.model_name,
+                    date_suppression__gte=moment
+                ).values_list('objet_id', flat=True)
+            )
+
+        borne = maintenant - marge()
+        lot = list(queryset[:taille_lot() + 1])
+        complet = len(lot) <= taille_lot()
+        if not complet and lot[taille_lot() - 1].date_modification >= borne:
+            # Coupe dans la fenêtre de marge : la suite du lot part aussi, le jeton recule à la borne
+            dernier = lot[-1]
+            lot += list(apres(queryset, dernier.date_modification, dernier.pk))
+            complet = True
+        if not complet:
+            lot = lot[:taille_lot()]
+            jeton = encoder_jeton(lot[-1].date_modification, lot[-1].pk)
+        else:
+            jeton = encoder_jeton(max(borne, depuis[0]) if depuis else borne)
+
+        return Response({
+            'jeton': jeton,
+            'complet': complet,
+            'modifies': self.get_serializer(lot, many=True).data,
+            'supprimes': supprimes,
+        })
@@ -0,0 +1,135 @@
+"""
+Exécution des rapports lourds en arrière-plan.
+
+Les tâches sont enregistrées dans la table ``TacheRapport`` puis exécutées par
+un pool de threads du processus : pas de broker externe. Le client soumet le
+rapport, interroge son statut, puis télécharge le fichier produit.
+
+Le pool ne survit pas au processus : à la première requête après un
+démarrage, ``reprendre`` soumet de nouveau les tâches restées en attente et
+passe en échec celles en cours depuis plus de ``RAPPORTS_DUREE_MAX_MINUTES``.
+Une tâche n'est prise qu'une fois, même soumise deux fois.
+"""
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files import File
+from django.core.signals import request_started
+from django.db import close_old_connections, connections, transaction
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+
+from . import rapports
+from .models import TacheRapport, Vente, MouvementCaisse
+from .routers import lecture_replica
+
+
+def _rapport_json(donnees, sortie):
+    sortie.write(JSONRenderer().render(donnees))
+
+
+def _bilan(parametres, sortie):
+    _rapport_json(rapports.bilan_caisse(
+        MouvementCaisse.objects.all(),
+        date_debut=parametres.get('date_debut'),
+        date_fin=parametres.get('date_fin')
+    ), sortie)
+
+
+def _statistiques_ventes(parametres, sortie):
+    _rapport_json(rapports.statistiques_ventes(Vente.objects.all()), sortie)
+
+
+def _export_ventes(parametres, sortie):
+    rapports.export_ventes_csv(
+        sortie,
+        date_debut=parametres.get('date_debut'),
+        date_fin=parametres.get('date_fin')
+    )
+
+
+def _rapport_annuel(parametres, sortie):
+    rapports.rapport_annuel_xlsx(
+        sortie,
+        int(parametres.get('annee', timezone.now().year)),
+        parametres.get('plantations')
+    )
+
+
+# type de rapport -> (fonction(parametres, sortie), extension du fichier)
+TYPES_RAPPORT = {
+    'bilan': (_bilan, 'json'),
+    'statistiques_ventes': (_statistiques_ventes, 'json'),
+    'export_ventes': (_export_ventes, 'csv'),
+    'rapport_annuel': (_rapport_annuel, 'xlsx'),
+}
+
+_executeur = None
+DEMARRAGE = timezone.now()
+REPRISE = 'palmier.taches.reprendre'  # dispatch_uid du branchement sur request_started
+
+
+def duree_max():
+    return timedelta(minutes=getattr(settings, 'RAPPORTS_DUREE_MAX_MINUTES', 60))
+
+
+def _get_executeur():
+    global _executeur
+    if _executeur is None:
+        _executeur = ThreadPoolExecutor(
+            max_workers=getattr(settings, 'RAPPORTS_WORKERS', 2),
+            thread_name_prefix='rapports'
+        )
+    return _executeur
+
+
+def soumettre(type_rapport, parametres=None):
+    """Crée la tâche et la confie au pool une fois la transaction validée."""
+    tache = TacheRapport.objects.create(type_rapport=type_rapport, parametres=parametres or {})
+    transaction.on_commit(lambda: _get_executeur().submit(executer, tache.pk))
+    return tache
+
+
+def reprendre(**kwargs):
+    """
+    Tâches laissées par un processus arrêté. Branché sur ``request_started``
+    (voir ``PalmierConfig.ready``) et exécuté à la première requête seulement.
+    """
+    request_started.disconnect(dispatch_uid=REPRISE)
+    # Un autre processus encore vivant peut les avoir en file : executer ne prend la tâche qu'une fois
+    en_attente = TacheRapport.objects.filter(statut='EN_ATTENTE', date_creation__lt=DEMARRAGE)
+    for tache_id in en_attente.values_list('pk', flat=True):
+        _get_executeur().submit(executer, tache_id)
+    TacheRapport.objects.filter(statut='EN_COURS', date_debut__lt=timezone.now() - duree_max()).update(
+        statut='ECHEC', erreur='Tâche interrompue (arrêt du serveur ou durée maximale dépassée)', date_fin=timezone.now()
+    )
+
+
+def executer(tache_id):
+    close_old_connections()
+    try:
+        # Prise atomique : une tâche soumise deux fois (reprise au démarrage) ne s'exécute qu'une fois
+        pris = TacheRapport.objects.filter(pk=tache_id, statut='EN_ATTENTE').update(
+            statut='EN_COURS', date_debut=timezone.now()
+        )
+        if not pris:
+            return
+        tache = TacheRapport.objects.get(pk=tache_id)
+        fonction, extension = TYPES_RAPPORT[tache.type_rapport]
+        with tempfile.TemporaryFile() as sortie, lecture_replica():
+            fonction(tache.parametres, sortie)
+            sortie.seek(0)
+            tache.fichier.save(f'{tache.type_rapport}_{tache.pk}.{extension}', File(sortie), save=False)
+        tache.statut = 'TERMINEE'
+        tache.date_fin = timezone.now()
+        tache.save(update_fields=['statut', 'fichier', 'date_fin'])
+    except Exception as exc:
+        # Toute erreur, lecture de la tâche comprise : la tâche ne reste pas « en cours »
+        TacheRapport.objects.filter(pk=tache_id).update(
+            statut='ECHEC', erreur=str(exc) or type(exc).__name__, date_fin=timezone.now()
+        )
+    finally:
+        # Le thread du pool n'est pas un cycle de requête : on ferme nous-mêmes
+        connections.close_all()
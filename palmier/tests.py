@@ -1,3 +1,1318 @@
-from django.test import TestCase
+import asyncio
+import csv
+import gzip
+import io
+import os
+import random
+import tempfile
+from datetime import date, timedelta
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.sql import emit_post_migrate_signal
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, connection, connections, transaction
+from django.db.migrations.executor import MigrationExecutor
+from django.db.models import Count, F, Max, Sum
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLPattern, URLResolver, reverse
+from django.utils import timezone
+from openpyxl import load_workbook
+from .admin import ComptageEstimePaginator
+from .evenements import Diffuseur, diffuseur
+from .management.commands import stress_ventes
+from .models import Plantation, Operation, Production, Vente, MouvementCaisse, Client, TacheRapport, Suppression
+from .profilage import JournalSQL
+from .transactions import transaction_stock
+from . import distributions, geo, previsions, rapports, recherche, routers, serializers, series, synchro, taches, urls
+
+
+def creer_production(poids=Decimal('1000.00')):
+    plantation = Plantation.objects.create(
+        nom='Plantation Test',
+        superficie=Decimal('10.00'),
+        date_plantation=date.today() - timedelta(days=365),
+        nombre_arbres=100,
+        localisation='Zone Test'
+    )
+    return Production.objects.create(
+        plantation=plantation,
+        date_recolte=date.today(),
+        quantite=10,
+        poids_total=poids,
+        qualite='A'
+    )
+
+
+class EcouteurEvenements:
+    """Abonné de test : collecte les événements publiés pendant le bloc."""
+
+    def __init__(self, source=diffuseur):
+        self.source = source
+        self.evenements = []
+
+    def __enter__(self):
+        self._publier = self.source.publier
+        self.source.publier = lambda donnees: (self.evenements.append(donnees), self._publier(donnees))
+        return self
+
+    def __exit__(self, *exc):
+        self.source.publier = self._publier
+
+    def types(self):
+        return [(e['type'], e['action']) for e in self.evenements]
+
+
+class DiffuseurTests(TestCase):
+    def test_abonnes_et_historique(self):
+        source = Diffuseur(taille_file=2)
+
+        async def scenario():
+            file = source.abonner()
+            for i in range(3):
+                source.publier({'type': 'vente', 'n': i})
+            await asyncio.sleep(0)
+            recus = [file.get_nowait()[1]['n'] for _ in range(file.qsize())]
+            rejoue = source.abonner(depuis=1)
+            await asyncio.sleep(0)
+            source.desabonner(file)
+            source.desabonner(rejoue)
+            return recus, [rejoue.get_nowait()[1]['n'] for _ in range(rejoue.qsize())]
+
+        recus, rejoue = asyncio.run(scenario())
+        # File de 2 : le plus ancien est perdu plutôt que de bloquer
+        self.assertEqual(recus, [1, 2])
+        self.assertEqual(rejoue, [1, 2])
+
+
+class EvenementsEcrituresTests(TestCase):
+    def test_vente_publie_vente_et_stock(self):
+        production = creer_production()
+        with EcouteurEvenements() as ecouteur, self.captureOnCommitCallbacks(execute=True):
+            Vente.objects.create(
+                production=production,
+                date_vente=date.today(),
+                client=Client.obtenir('Client A'),
+                quantite=Decimal('100.00'),
+                prix_unitaire=Decimal('2.00')
+            )
+        self.assertEqual(ecouteur.types(), [('production', 'modification'), ('vente', 'creation')])
+        self.assertEqual(ecouteur.evenements[0]['stock_disponible'], Decimal('900.00'))
+
+    def test_rien_sans_commit(self):
+        with EcouteurEvenements() as ecouteur, self.captureOnCommitCallbacks(execute=False):
+            MouvementCaisse.objects.create(
+                date=date.today(), type_mouvement='ENTREE', montant=Decimal('10.00'), description='Test'
+            )
+        self.assertEqual(ecouteur.evenements, [])
+
+
+class ContraintesTests(TestCase):
+    def vendre(self, production, quantite):
+        return Vente.objects.create(
+            production=production, date_vente=date.today(), client=Client.obtenir('Client A'),
+            quantite=Decimal(quantite), prix_unitaire=Decimal('2.00')
+        )
+
+    def test_stock_insuffisant(self):
+        production = creer_production(Decimal('100.00'))
+        vente = self.vendre(production, '60.00')
+        with self.assertRaises(ValidationError):
+            self.vendre(production, '50.00')
+        vente.quantite = Decimal('100.00')
+        vente.save()
+        production.refresh_from_db()
+        self.assertEqual(production.stock_disponible, Decimal('0.00'))
+        self.assertEqual(Client.obtenir('Client A').chiffre_affaires, Decimal('200.00'))
+
+    def test_changement_de_production(self):
+        premiere = creer_production()
+        vente = self.vendre(premiere, '10.00')
+        autre = Production.objects.create(
+            plantation=premiere.plantation, date_recolte=date.today(),
+            quantite=1, poids_total=Decimal('50.00'), qualite='B'
+        )
+        vente.production = autre
+        vente.save()
+        premiere.refresh_from_db()
+        autre.refresh_from_db()
+        self.assertEqual((premiere.stock_disponible, autre.stock_disponible), (Decimal('1000.00'), Decimal('40.00')))
+
+    def test_ecritures_en_masse_controlees(self):
+        vente = self.vendre(creer_production(), '10.00')
+        for queryset, valeurs in [
+            (Production.objects.all(), {'stock_disponible': Decimal('-1.00')}),
+            (Production.objects.all(), {'stock_disponible': F('poids_total') + 1}),
+            (Vente.objects.all(), {'montant_total': Decimal('1.00')}),
+            (Vente.objects.all(), {'quantite': Decimal('0.00'), 'montant_total': Decimal('0.00')}),
+        ]:
+            with self.subTest(valeurs=valeurs), self.assertRaises(IntegrityError), transaction.atomic():
+                queryset.update(**valeurs)
+        vente.refresh_from_db()
+        self.assertEqual(vente.montant_total, Decimal('20.00'))
+
+    def test_refus_en_400(self):
+        production = creer_production(Decimal('10.00'))
+        response = self.client.post(reverse('vente-list'), {
+            'production': production.pk, 'date_vente': date.today(), 'client': 'Client A',
+            'quantite': '11.00', 'prix_unitaire': '2.00'
+        })
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('non_field_errors', response.data)
+
+    def test_poids_corrige_en_400(self):
+        production = creer_production(Decimal('100.00'))
+        self.vendre(production, '10.00')
+        url = reverse('production-detail', kwargs={'pk': production.pk})
+        response = self.client.patch(url, {'poids_total': '50.00'}, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['stock_disponible'], '40.00')
+        for valeurs in [{'poids_total': '5.00'}, {'stock_disponible': '60.00'}, {'stock_disponible': '-1.00'}]:
+            with self.subTest(valeurs=valeurs):
+                response = self.client.patch(url, valeurs, content_type='application/json')
+                self.assertEqual(response.status_code, 400)
+        production.refresh_from_db()
+        self.assertEqual((production.poids_total, production.stock_disponible), (Decimal('50.00'), Decimal('40.00')))
+
+
+class IdempotenceTests(TestCase):
+    def setUp(self):
+        self.production = creer_production(Decimal('100.00'))
+        self.vente = {
+            'production': self.production.pk, 'date_vente': date.today().isoformat(), 'client': 'Client A',
+            'quantite': '10.00', 'prix_unitaire': '2.00',
+        }
+
+    def poster(self, donnees, cle='cle-1'):
+        return self.client.post(
+            reverse('vente-list'), donnees, content_type='application/json', headers={'Idempotency-Key': cle}
+        )
+
+    def etat(self):
+        self.production.refresh_from_db()
+        client = Client.obtenir('Client A')
+        return Vente.objects.count(), self.production.stock_disponible, client.chiffre_affaires, client.nombre_achats
+
+    def test_rejeu_sans_nouvelle_ecriture(self):
+        premiere = self.poster(self.vente)
+        self.assertEqual(premiere.status_code, 201)
+        apres = self.etat()
+        self.assertEqual(apres, (1, Decimal('90.00'), Decimal('20.00'), 1))
+
+        rejeu = self.poster(self.vente)
+        self.assertEqual(rejeu.status_code, 201)
+        self.assertEqual(rejeu['Idempotent-Replayed'], 'true')
+        self.assertEqual(rejeu.json(), premiere.json())
+        self.assertEqual(self.etat(), apres)
+
+    def test_meme_cle_autre_corps_en_422(self):
+        self.poster(self.vente)
+        apres = self.etat()
+        response = self.poster({**self.vente, 'quantite': '20.00'})
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(self.etat(), apres)
+
+    def test_echec_ne_reserve_pas_la_cle(self):
+        self.assertEqual(self.poster({**self.vente, 'quantite': '500.00'}).status_code, 400)
+        self.assertEqual(self.poster(self.vente).status_code, 201)
+        self.assertEqual(self.etat(), (1, Decimal('90.00'), Decimal('20.00'), 1))
+
+    def test_modification_rejouee(self):
+        vente = self.poster(self.vente).json()
+        url = reverse('vente-detail', kwargs={'pk': vente['id']})
+        for rejeu in (False, True):
+            response = self.client.put(
+                url, {**self.vente, 'quantite': '30.00'}, content_type='application/json',
+                headers={'Idempotency-Key': 'cle-2'}
+            )
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.has_header('Idempotent-Replayed'), rejeu)
+        self.assertEqual(self.etat(), (1, Decimal('70.00'), Decimal('60.00'), 1))
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class SqliteRegleTests(TestCase):
+    """Backend palmier.backends.sqlite3 sur un fichier : pragmas à la connexion, BEGIN IMMEDIATE pour le stock."""
+
+    def setUp(self):
+        dossier = tempfile.TemporaryDirectory()
+        self.addCleanup(dossier.cleanup)
+        self.alias = 'sqlite_regle'
+        connections.settings[self.alias] = connections.configure_settings({'default': {}, self.alias: {
+            'ENGINE': 'palmier.backends.sqlite3', 'NAME': os.path.join(dossier.name, 'regle.sqlite3'),
+            'OPTIONS': {'pragmas': {'cache_size': -2000}},
+        }})[self.alias]
+        self.addCleanup(self.liberer)
+
+    def liberer(self):
+        connections[self.alias].close()
+        del connections[self.alias]
+        del connections.settings[self.alias]
+
+    def pragma(self, nom):
+        with connections[self.alias].cursor() as curseur:
+            curseur.execute(f'PRAGMA {nom}')
+            return curseur.fetchone()[0]
+
+    def test_pragmas_a_chaque_connexion(self):
+        attendus = {
+            'journal_mode': 'wal', 'synchronous': 1, 'busy_timeout': 5000, 'cache_size': -2000,
+            'mmap_size': 268435456, 'temp_store': 2,
+        }
+        for _ in range(2):
+            self.assertEqual({nom: self.pragma(nom) for nom in attendus}, attendus)
+            connections[self.alias].close()
+
+    def test_transaction_stock_en_begin_immediate(self):
+        connexion = connections[self.alias]
+        with CaptureQueriesContext(connexion) as requetes:
+            with transaction_stock(using=self.alias):
+                connexion.cursor().execute('SELECT 1')
+            with transaction.atomic(using=self.alias):
+                connexion.cursor().execute('SELECT 1')
+        debuts = [requete['sql'] for requete in requetes if requete['sql'].startswith('BEGIN')]
+        self.assertEqual(debuts, ['BEGIN IMMEDIATE', 'BEGIN'])
+        self.assertFalse(connexion.begin_immediate)
+
+
+class IdempotenceVerrouTests(TransactionTestCase):
+    """Hors de la transaction d'un TestCase : la requête ouvre elle-même sa transaction."""
+
+    def test_vente_avec_cle_en_begin_immediate(self):
+        production = creer_production(Decimal('100.00'))
+        with CaptureQueriesContext(connection) as requetes:
+            response = self.client.post(reverse('vente-list'), {
+                'production': production.pk, 'date_vente': date.today().isoformat(), 'client': 'Client A',
+                'quantite': '10.00', 'prix_unitaire': '2.00',
+            }, content_type='application/json', headers={'Idempotency-Key': 'cle-1'})
+        self.assertEqual(response.status_code, 201)
+        debuts = [requete['sql'] for requete in requetes if requete['sql'].startswith('BEGIN')]
+        self.assertEqual(debuts, ['BEGIN IMMEDIATE'])
+
+
+class TachesTests(TestCase):
+    def soumettre(self, type_rapport, parametres=None):
+        soumises = []
+        with mock.patch.object(taches, '_get_executeur') as pool, self.captureOnCommitCallbacks(execute=True):
+            pool.return_value.submit.side_effect = lambda fonction, pk: soumises.append(pk)
+            tache = taches.soumettre(type_rapport, parametres)
+        self.assertEqual(soumises, [tache.pk])
+        taches.executer(tache.pk)  # dans le thread du test, qui voit la transaction en cours
+        tache.refresh_from_db()
+        return tache
+
+    def test_soumise_puis_terminee(self):
+        MouvementCaisse.objects.create(date=date.today(), type_mouvement='ENTREE', montant=Decimal('10.00'), description='Test')
+        tache = self.soumettre('bilan')
+        self.assertEqual((tache.statut, tache.erreur), ('TERMINEE', ''))
+        self.assertIsNotNone(tache.date_fin)
+        with tache.fichier.open('rb') as fichier:
+            self.assertIn(b'"total_entrees"', fichier.read())
+        response = self.client.get(reverse('tacherapport-telecharger', kwargs={'pk': tache.pk}))
+        self.assertEqual(response.status_code, 200)
+        # Déjà terminée : une seconde exécution ne la reprend pas
+        taches.executer(tache.pk)
+        self.assertEqual(TacheRapport.objects.get(pk=tache.pk).date_fin, tache.date_fin)
+
+    def test_erreur_passe_en_echec(self):
+        for type_rapport, parametres in [('bilan', {'date_debut': 'xx'}), ('inconnu', {})]:
+            with self.subTest(type_rapport=type_rapport):
+                tache = self.soumettre(type_rapport, parametres)
+                self.assertEqual(tache.statut, 'ECHEC')
+                self.assertTrue(tache.erreur)
+                self.assertIsNotNone(tache.date_fin)
+
+    def test_reprise_au_demarrage(self):
+        avant = taches.DEMARRAGE - timedelta(minutes=1)
+        oubliee = TacheRapport.objects.create(type_rapport='bilan')
+        recente = TacheRapport.objects.create(type_rapport='bilan')
+        bloquee = TacheRapport.objects.create(
+            type_rapport='bilan', statut='EN_COURS', date_debut=timezone.now() - taches.duree_max() - timedelta(minutes=1)
+        )
+        en_cours = TacheRapport.objects.create(type_rapport='bilan', statut='EN_COURS', date_debut=timezone.now())
+        TacheRapport.objects.filter(pk=oubliee.pk).update(date_creation=avant)
+
+        with mock.patch.object(taches, '_get_executeur') as pool, \
+                mock.patch.object(taches.request_started, 'disconnect') as debrancher:
+            taches.reprendre()
+        pool.return_value.submit.assert_called_once_with(taches.executer, oubliee.pk)
+        debrancher.assert_called_once_with(dispatch_uid=taches.REPRISE)
+        statuts = dict(TacheRapport.objects.values_list('pk', 'statut'))
+        self.assertEqual(
+            [statuts[t.pk] for t in (oubliee, recente, bloquee, en_cours)],
+            ['EN_ATTENTE', 'EN_ATTENTE', 'ECHEC', 'EN_COURS']
+        )
+
+
+class ReplicaTests(TestCase):
+    """Primaire (base de test) et réplica (second fichier SQLite, migré à part)."""
+
+    def setUp(self):
+        dossier = tempfile.TemporaryDirectory()
+        self.addCleanup(dossier.cleanup)
+        parametres = {'ENGINE': 'palmier.backends.sqlite3', 'NAME': os.path.join(dossier.name, 'replica.sqlite3')}
+        # allow_migrate refuse l'alias du réplica : le fichier est migré sous un autre alias
+        for alias in ('migration_replica', routers.REPLICA):
+            connections.settings[alias] = connections.configure_settings({'default': {}, alias: parametres})[alias]
+            self.addCleanup(self.liberer, alias)
+        call_command('migrate', database='migration_replica', verbosity=0)
+        base = mock.patch.dict(settings.DATABASES, {routers.REPLICA: connections.settings[routers.REPLICA]})
+        base.start()
+        self.addCleanup(base.stop)
+
+        for using, nom in [(routers.REPLICA, 'Sur le réplica'), ('default', 'Sur le primaire')]:
+            Plantation.objects.using(using).create(
+                nom=nom, superficie=Decimal('1.00'), date_plantation=date(2020, 1, 1), nombre_arbres=10, localisation='Zone'
+            )
+
+    def liberer(self, alias):
+        connections[alias].close()
+        del connections[alias]
+        del connections.settings[alias]
+
+    def lue(self):
+        return list(Plantation.objects.values_list('nom', flat=True))
+
+    def ecrire(self):
+        MouvementCaisse.objects.create(date=date.today(), type_mouvement='ENTREE', montant=Decimal('1.00'), description='Test')
+
+    def test_lecture_replica_ecriture_primaire(self):
+        self.assertEqual(self.lue(), ['Sur le primaire'])
+        with routers.lecture_replica():
+            self.assertEqual(self.lue(), ['Sur le réplica'])
+            self.ecrire()
+        self.assertEqual(MouvementCaisse.objects.using('default').count(), 1)
+        self.assertEqual(MouvementCaisse.objects.using(routers.REPLICA).count(), 0)
+
+    def test_lecture_apres_ecriture_limitee_a_la_portee(self):
+        self.ecrire()  # hors portée : n'épingle rien
+        with routers.lecture_replica():
+            self.assertEqual(self.lue(), ['Sur le réplica'])
+            self.ecrire()
+            self.assertEqual(self.lue(), ['Sur le primaire'])
+        with routers.lecture_replica():
+            self.assertEqual(self.lue(), ['Sur le réplica'])
+
+    def test_requetes(self):
+        url = reverse('plantation-rentabilite')
+        self.assertEqual([p['nom'] for p in self.client.get(url).data], ['Sur le réplica'])
+        response = self.client.post(reverse('mouvementcaisse-list'), {
+            'date': date.today(), 'type_mouvement': 'ENTREE', 'montant': '1.00', 'description': 'Test'
+        })
+        self.assertEqual(response.status_code, 201)
+        self.assertIn(routers.COOKIE_ECRITURE, response.cookies)
+        # Cookie d'écriture récente : le client lit sur le primaire
+        self.assertEqual([p['nom'] for p in self.client.get(url).data], ['Sur le primaire'])
+        self.client.cookies.clear()
+        self.assertEqual([p['nom'] for p in self.client.get(url).data], ['Sur le réplica'])
+        # La requête d'écriture n'a pas laissé le thread épinglé
+        with routers.lecture_replica():
+            self.assertEqual(self.lue(), ['Sur le réplica'])
+
+
+@override_settings(SYNCHRO_TAILLE_LOT=2, SYNCHRO_MARGE=60)
+class SynchroTests(TestCase):
+    def mouvement(self, il_y_a):
+        mouvement = MouvementCaisse.objects.create(
+            date=date.today(), type_mouvement='ENTREE', montant=Decimal('1.00'), description='Test'
+        )
+        MouvementCaisse.objects.filter(pk=mouvement.pk).update(date_modification=timezone.now() - il_y_a)
+        return mouvement.pk
+
+    def page(self, jeton):
+        response = self.client.get(reverse('mouvementcaisse-list'), {'since': jeton})
+        self.assertEqual(response.status_code, 200)
+        data = response.data
+        return [ligne['id'] for ligne in data['modifies']], data['supprimes'], data['jeton'], data['complet']
+
+    def synchroniser(self, jeton='0'):
+        pages = []
+        while len(pages) < 10:
+            modifies, supprimes, jeton, complet = self.page(jeton)
+            pages.append((modifies, supprimes))
+            if complet:
+                return pages, jeton
+        self.fail('La synchronisation ne se termine pas')
+
+    def test_lots_modifications_et_suppressions(self):
+        ids = [self.mouvement(timedelta(minutes=10 - i)) for i in range(5)]
+        pages, jeton = self.synchroniser()
+        self.assertEqual(pages, [(ids[:2], []), (ids[2:4], []), (ids[4:], [])])
+        self.assertEqual(self.synchroniser(jeton)[0], [([], [])])
+
+        modifie = MouvementCaisse.objects.get(pk=ids[2])
+        modifie.montant = Decimal('2.00')
+        modifie.save()
+        nouveau = self.mouvement(timedelta(0))
+        MouvementCaisse.objects.get(pk=ids[1]).delete()
+        pages, _ = self.synchroniser(jeton)
+        self.assertEqual(pages, [([ids[2], nouveau], [ids[1]])])
+
+    def test_validation_tardive(self):
+        ancien = self.mouvement(timedelta(minutes=10))
+        recents = [self.mouvement(timedelta(seconds=30)), self.mouvement(timedelta(seconds=20))]
+        # Le lot de 2 serait coupé dans la fenêtre de marge : il est prolongé, le jeton recule à la borne
+        modifies, _, jeton, complet = self.page('0')
+        self.assertEqual((modifies, complet), ([ancien, *recents], True))
+
+        # Écriture datée avant la dernière ligne lue, validée après la lecture
+        tardive = self.mouvement(timedelta(seconds=40))
+        pages, _ = self.synchroniser(jeton)
+        self.assertEqual(sorted(sum((modifies for modifies, _ in pages), [])), sorted([tardive, *recents]))
+
+    def test_retention(self):
+        suppression = Suppression.objects.create(type_objet='mouvementcaisse', objet_id=1)
+        Suppression.objects.filter(pk=suppression.pk).update(
+            date_suppression=timezone.now() - synchro.retention() - timedelta(days=1)
+        )
+        self.assertEqual(synchro.purger(), 1)
+        expire = synchro.encoder_jeton(timezone.now() - synchro.retention() - timedelta(days=1))
+        self.assertEqual(self.client.get(reverse('mouvementcaisse-list'), {'since': expire}).status_code, 410)
+        for jeton in ['abc', '1.2.3', '999999999999999999999999.1', '253402300800000000.0', '-62135596800000001.0']:
+            with self.subTest(jeton=jeton):
+                response = self.client.get(reverse('mouvementcaisse-list'), {'since': jeton})
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('since', response.data)
+
+
+class RechercheTests(TestCase):
+    def cherche(self, nom_route, terme):
+        response = self.client.get(reverse(nom_route), {'search': terme})
+        self.assertEqual(response.status_code, 200)
+        return sorted(ligne['id'] for ligne in response.data['results'])
+
+    def test_creation_modification_suppression(self):
+        self.assertTrue(recherche.fts_disponible(connection, Plantation))
+        peupler(0, 2)
+        premiere, seconde = Plantation.objects.order_by('nom')
+        self.assertEqual(self.cherche('plantation-list', 'zone 1'), [seconde.pk])
+        self.assertEqual(self.cherche('plantation-list', 'plantation'), [premiere.pk, seconde.pk])
+
+        seconde.localisation = 'Edéa Nord'
+        seconde.save()
+        self.assertEqual(self.cherche('plantation-list', 'zone 1'), [])
+        self.assertEqual(self.cherche('plantation-list', 'edéa'), [seconde.pk])
+        # Terme court : icontains sur les lignes retenues par l'index
+        self.assertEqual(self.cherche('plantation-list', 'plantation 0'), [premiere.pk])
+
+        Plantation.objects.filter(pk=premiere.pk).delete()
+        self.assertEqual(self.cherche('plantation-list', 'plantation'), [seconde.pk])
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT rowid FROM {recherche.table_fts(Plantation)}')
+            self.assertEqual([ligne[0] for ligne in cursor.fetchall()], [seconde.pk])
+
+    def test_ventes_par_client(self):
+        peupler(0, 1)
+        vente = Vente.objects.get()
+        client = Client.obtenir('Socapalm Douala')
+        vente.client = client
+        vente.save()
+        self.assertEqual(self.cherche('vente-list', 'socapalm'), [vente.pk])
+        client.nom = 'Palmeraie du Sud'
+        client.save()
+        self.assertEqual(self.cherche('vente-list', 'socapalm'), [])
+        self.assertEqual(self.cherche('vente-list', 'palmeraie'), [vente.pk])
+
+    def test_ecritures_en_masse_puis_reindexation(self):
+        operation = Operation.objects.create(
+            plantation=creer_production().plantation, type_operation='AUTRE', date=date.today(), cout=Decimal('5.00'), description='Taille'
+        )
+        Operation.objects.filter(pk=operation.pk).update(description='Désherbage')
+        self.assertEqual(self.cherche('operation-list', 'désherbage'), [])
+        call_command('reindexer_recherche', stdout=open(os.devnull, 'w'))
+        self.assertEqual(self.cherche('operation-list', 'désherbage'), [operation.pk])
+
+    def test_tables_relues_apres_migration(self):
+        self.addCleanup(recherche.oublier_tables)  # la table supprimée revient avec le rollback du test
+        operation = Operation.objects.create(
+            plantation=creer_production().plantation, type_operation='AUTRE', date=date.today(), cout=Decimal('5.00'), description='Taille'
+        )
+        self.assertTrue(recherche.fts_disponible(connection, Operation))
+        with connection.cursor() as cursor:
+            cursor.execute(f'DROP TABLE {recherche.table_fts(Operation)}')
+        emit_post_migrate_signal(verbosity=0, interactive=False, db=connection.alias)
+        self.assertFalse(recherche.fts_disponible(connection, Operation))
+        # Sans index : icontains, et les écritures ne touchent plus la table disparue
+        self.assertEqual(self.cherche('operation-list', 'taille'), [operation.pk])
+        operation.save()
+
+
+class FluxEvenementsTests(TestCase):
+    async def test_flux_sse(self):
+        response = await self.async_client.get(reverse('flux_evenements'), {'types': 'mouvementcaisse'})
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        flux = aiter(response.streaming_content)
+        self.assertTrue((await anext(flux)).startswith(b'retry:'))
+
+        suivant = asyncio.ensure_future(anext(flux))
+        await asyncio.sleep(0)
+
+        def ecrire():
+            with self.captureOnCommitCallbacks(execute=True):
+                MouvementCaisse.objects.create(
+                    date=date.today(), type_mouvement='SORTIE', montant=Decimal('5.00'), description='Test'
+                )
+        await sync_to_async(ecrire)()
+
+        message = (await asyncio.wait_for(suivant, 1)).decode()
+        self.assertIn('event: mouvementcaisse\n', message)
+        self.assertIn('"action":"creation"', message)
+        await flux.aclose()
+
+
+class ProfilageTests(TestCase):
+    def setUp(self):
+        creer_production()
+
+    def test_rapport_reserve_au_personnel(self):
+        response = self.client.get(reverse('production-list'), {'_profile': '1'})
+        self.assertIn('results', response.json())
+
+        self.client.force_login(User.objects.create_user('admin', is_staff=True))
+        rapport = self.client.get(reverse('production-list'), {'_profile': '1'}).json()
+        self.assertEqual(rapport['requete']['statut'], 200)
+        self.assertGreater(rapport['sql']['nombre'], 0)
+        self.assertTrue(all(r['origine'] for r in rapport['sql']['requetes']))
+        self.assertTrue(rapport['fonctions'])
+
+    def test_n_plus_un_detecte(self):
+        journal = JournalSQL()
+        journal.requetes = [
+            {'sql': 'SELECT 1 WHERE id = %s', 'params': (i,), 'duree_ms': 1.0, 'origine': 'palmier/serializers.py:1 f'}
+            for i in range(5)
+        ] + [{'sql': 'SELECT 2', 'params': (), 'duree_ms': 1.0, 'origine': 'palmier/views.py:1 g'}] * 2
+        self.assertEqual([(l['sql'], l['nombre']) for l in journal.n_plus_un()], [('SELECT 1 WHERE id = %s', 5)])
+        self.assertEqual([(l['sql'], l['nombre']) for l in journal.doublons()], [('SELECT 2', 2)])
+
+
+# Requêtes SQL permises par route (nom d'URL de palmier/urls.py), mesurées avec
+# 10 lignes par table. Toute nouvelle route doit être ajoutée ici ; None : non
+# mesurée (flux SSE sans fin).
+BUDGETS_REQUETES = {
+    'api-root': 0,
+    'plantation-list': 2,
+    'plantation-detail': 1,
+    'plantation-statistiques': 6,
+    'plantation-statistiques-plantations': 6,
+    'plantation-rentabilite': 1,
+    'plantation-nearby': 2,
+    'plantation-bbox': 2,
+    'plantation-previsions': 4,
+    'plantation-rapport-annuel': 3,
+    'operation-list': 2,
+    'operation-detail': 1,
+    'operation-statistiques-mensuelles': 1,
+    'operation-pivot': 1,
+    'production-list': 2,
+    'production-detail': 1,
+    'production-statistiques-globales': 14,
+    'production-alertes-stock': 1,
+    'production-distributions': 2,
+    'vente-list': 2,
+    'vente-detail': 1,
+    'vente-statistiques-ventes': 5,
+    'vente-analyse-prix': 2,
+    'vente-distributions': 1,
+    'client-list': 2,
+    'client-detail': 1,
+    'client-ventes': 3,
+    'mouvementcaisse-list': 2,
+    'mouvementcaisse-detail': 1,
+    'mouvementcaisse-bilan': 3,
+    'tacherapport-list': 2,
+    'tacherapport-detail': 1,
+    'tacherapport-telecharger': 1,
+    'statistiques_productions': 14,
+    'flux_evenements': None,
+}
+
+PARAMETRES_ROUTES = {
+    'plantation-nearby': {'lat': 4.05, 'lon': 9.7, 'rayon': 50},
+    'plantation-bbox': {'min_lat': 3.5, 'min_lon': 9.0, 'max_lat': 4.5, 'max_lon': 10.5},
+    'plantation-rapport-annuel': {'annee': date.today().year, 'type_fichier': 'csv'},
+    'operation-pivot': {'annee': date.today().year},
+}
+
+
+def routes(motifs=urls.urlpatterns):
+    """Routes nommées de palmier/urls.py (hors admin et page React) : nom -> motif."""
+    trouvees = {}
+    for motif in motifs:
+        if isinstance(motif, URLResolver):
+            if motif.app_name != 'admin':
+                trouvees.update({nom: m for nom, m in routes(motif.url_patterns).items() if nom not in trouvees})
+        elif isinstance(motif, URLPattern) and motif.name and motif.name not in trouvees:
+            trouvees[motif.name] = motif
+    return trouvees
+
+
+def peupler(debut, fin):
+    client = Client.obtenir('Client A')
+    for i in range(debut, fin):
+        plantation = Plantation.objects.create(
+            nom=f'Plantation {i}',
+            superficie=Decimal('10.00'),
+            date_plantation=date.today() - timedelta(days=3650),
+            nombre_arbres=100,
+            localisation=f'Zone {i}',
+            latitude=4.05 + i / 1000,
+            longitude=9.7,
+        )
+        Operation.objects.create(
+            plantation=plantation, type_operation='ENTRETIEN', date=date.today(), cout=Decimal('50.00')
+        )
+        production = Production.objects.create(
+            plantation=plantation, date_recolte=date.today(), quantite=10, poids_total=Decimal('100.00'), qualite='A'
+        )
+        Vente.objects.create(
+            production=production, date_vente=date.today(), client=client,
+            quantite=Decimal('10.00'), prix_unitaire=Decimal('2.00')
+        )
+        MouvementCaisse.objects.create(
+            date=date.today(), type_mouvement='ENTREE', montant=Decimal('20.00'), description=f'Vente {i}'
+        )
+        TacheRapport.objects.create(type_rapport='statistiques_ventes')
+
+
+class RequetesParRouteTests(TestCase):
+    """Le nombre de requêtes d'une route ne doit pas croître avec le nombre de lignes (N+1)."""
+    N = 1
+
+    def compter(self, nom, motif):
+        url = reverse(nom, kwargs={'pk': self.objet(motif).pk} if 'pk' in motif.pattern.regex.groupindex else None)
+        with CaptureQueriesContext(connection) as requetes:
+            response = self.client.get(url, PARAMETRES_ROUTES.get(nom, {}))
+            if response.streaming:
+                b''.join(response.streaming_content)
+        self.assertLess(response.status_code, 500, nom)
+        return len(requetes)
+
+    def objet(self, motif):
+        return motif.callback.cls.queryset.model.objects.order_by('pk').first()
+
+    def test_routes_avec_budget(self):
+        self.assertEqual(
+            set(routes()) - set(BUDGETS_REQUETES), set(),
+            'Ajouter les nouvelles routes à BUDGETS_REQUETES'
+        )
+
+    def test_requetes_independantes_du_volume(self):
+        mesurables = {nom: motif for nom, motif in routes().items() if BUDGETS_REQUETES.get(nom) is not None}
+        peupler(0, self.N)
+        for nom, motif in mesurables.items():
+            self.compter(nom, motif)  # caches (tables de recherche, contenttypes...)
+        petit = {nom: self.compter(nom, motif) for nom, motif in mesurables.items()}
+
+        peupler(self.N, 10 * self.N)
+        for nom, motif in mesurables.items():
+            with self.subTest(route=nom):
+                nombre = self.compter(nom, motif)
+                self.assertEqual(
+                    nombre, petit[nom],
+                    f'{nom} : {petit[nom]} requêtes pour {self.N} ligne(s), {nombre} pour {10 * self.N}'
+                )
+                self.assertLessEqual(nombre, BUDGETS_REQUETES[nom], f'{nom} dépasse son budget de requêtes')
+
+
+class StatistiquesPlantationsTests(TestCase):
+    def test_identiques_au_detail(self):
+        peupler(0, 3)
+        Production.objects.create(
+            plantation=Plantation.objects.get(nom='Plantation 1'), date_recolte=date.today(),
+            quantite=5, poids_total=Decimal('40.00'), qualite='C'
+        )
+        response = self.client.get(reverse('plantation-statistiques-plantations'))
+        self.assertEqual(len(response.data), 3)
+        for ligne in response.data:
+            detail = self.client.get(reverse('plantation-statistiques', kwargs={'pk': ligne.pop('plantation')}))
+            ligne.pop('plantation_nom')
+            self.assertEqual(ligne, detail.data)
+
+    def test_filtre_ids(self):
+        peupler(0, 3)
+        ids = list(Plantation.objects.order_by('pk').values_list('pk', flat=True))
+        url = reverse('plantation-statistiques-plantations')
+        response = self.client.get(url, {'ids': f'{ids[0]},{ids[2]}'})
+        self.assertEqual(sorted(ligne['plantation'] for ligne in response.data), [ids[0], ids[2]])
+        self.assertEqual(self.client.get(url, {'ids': '1,a'}).status_code, 400)
+
+
+class RentabiliteTests(TestCase):
+    def setUp(self):
+        peupler(0, 2)  # chacune : 50 de coûts, 20 de chiffre d'affaires
+        premiere, seconde = Plantation.objects.order_by('nom')
+        Operation.objects.create(
+            plantation=premiere, type_operation='TRAITEMENT', date=date.today() - timedelta(days=700), cout=Decimal('200.00')
+        )
+        Vente.objects.create(
+            production=seconde.productions.get(), date_vente=date.today(), client=Client.obtenir('Client B'),
+            quantite=Decimal('50.00'), prix_unitaire=Decimal('2.00')
+        )
+
+    def classement(self, **params):
+        response = self.client.get(reverse('plantation-rentabilite'), params)
+        self.assertEqual(response.status_code, 200)
+        return [
+            (ligne['rang'], ligne['nom'], ligne['cout_operations'], ligne['chiffre_affaires'], ligne['marge'],
+             ligne['marge_par_hectare'], ligne['marge_par_arbre'])
+            for ligne in response.data
+        ]
+
+    def test_classement_et_marges(self):
+        self.assertEqual(self.classement(), [
+            (1, 'Plantation 1', 50, 120, 70, 7.0, 0.7),
+            (2, 'Plantation 0', 250, 20, -230, -23.0, -2.3),
+        ])
+        self.assertEqual([ligne[1] for ligne in self.classement(tri='cout_operations')], ['Plantation 1', 'Plantation 0'])
+
+    def test_filtre_dates(self):
+        debut = (date.today() - timedelta(days=365)).isoformat()
+        self.assertEqual(self.classement(date_debut=debut), [
+            (1, 'Plantation 1', 50, 120, 70, 7.0, 0.7),
+            (2, 'Plantation 0', 50, 20, -30, -3.0, -0.3),
+        ])
+        fin = (date.today() - timedelta(days=1)).isoformat()
+        self.assertEqual(self.classement(date_fin=fin), [
+            (1, 'Plantation 1', 0, 0, 0, 0.0, 0.0),
+            (2, 'Plantation 0', 200, 0, -200, -20.0, -2.0),
+        ])
+
+    def test_dates_invalides_en_400(self):
+        for params in [{'date_debut': 'xx'}, {'date_fin': '2024-02-30'}, {'tri': 'inconnu'}]:
+            with self.subTest(params=params):
+                self.assertEqual(self.client.get(reverse('plantation-rentabilite'), params).status_code, 400)
+
+
+class PivotOperationsTests(TestCase):
+    def test_comparaison_annee_precedente(self):
+        plantation = creer_production().plantation
+        for jour, type_operation, cout in [
+            (date(2023, 3, 10), 'ENTRETIEN', '40.00'),
+            (date(2024, 3, 5), 'ENTRETIEN', '50.00'),
+            (date(2024, 3, 20), 'TRAITEMENT', '30.00'),
+            (date(2024, 7, 1), 'ENTRETIEN', '25.00'),
+            (date(2025, 1, 1), 'ENTRETIEN', '999.00'),  # hors des deux années
+        ]:
+            Operation.objects.create(plantation=plantation, type_operation=type_operation, date=jour, cout=Decimal(cout))
+        response = self.client.get(reverse('operation-pivot'), {'annee': 2024})
+        self.assertEqual(response.status_code, 200)
+        mars, juillet = response.data['matrice'][2], response.data['matrice'][6]
+        self.assertEqual(mars['ENTRETIEN'], {'courant': 50, 'precedent': 40, 'delta': 10, 'variation': 25.0})
+        self.assertEqual(mars['TRAITEMENT'], {'courant': 30, 'precedent': 0, 'delta': 30, 'variation': None})
+        self.assertEqual(mars['total'], {'courant': 80, 'precedent': 40, 'delta': 40, 'variation': 100.0})
+        self.assertEqual(juillet['ENTRETIEN'], {'courant': 25, 'precedent': 0, 'delta': 25, 'variation': None})
+        self.assertEqual(sum(ligne['total']['courant'] for ligne in response.data['matrice']), 105)
+
+    def test_annee_hors_bornes_en_400(self):
+        for annee in ['1', '9999', '0', '-5', 'deux']:
+            with self.subTest(annee=annee):
+                self.assertEqual(self.client.get(reverse('operation-pivot'), {'annee': annee}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('operation-pivot'), {'annee': 2}).status_code, 200)
+
+
+class ProximiteTests(TestCase):
+    CENTRE = (4.0, 9.7)
+
+    def setUp(self):
+        lat, lon = self.CENTRE
+        for nom, latitude, longitude in [
+            ('Loin', lat + 0.05, lon),          # ~5,6 km
+            ('Proche', lat + 0.02, lon),        # ~2,2 km
+            ('Coin', lat + 0.06, lon + 0.06),   # dans la boîte de 8 km, hors du cercle (~9,4 km)
+            ('Juste dehors', lat + 0.0720, lon),  # ~8,006 km
+            ('Sans position', None, None),
+        ]:
+            Plantation.objects.create(
+                nom=nom, superficie=Decimal('1.00'), date_plantation=date(2020, 1, 1), nombre_arbres=10,
+                localisation='Zone', latitude=latitude, longitude=longitude
+            )
+
+    def proches(self, **params):
+        response = self.client.get(reverse('plantation-nearby'), {'lat': self.CENTRE[0], 'lon': self.CENTRE[1], **params})
+        self.assertEqual(response.status_code, 200)
+        return [(p['nom'], p['distance_km']) for p in response.data['plantations']]
+
+    def test_rayon_et_ordre(self):
+        proches = self.proches(rayon=8)
+        self.assertEqual([nom for nom, _ in proches], ['Proche', 'Loin'])
+        for nom, distance in proches:
+            plantation = Plantation.objects.get(nom=nom)
+            attendu = geo.distance_km(*self.CENTRE, plantation.latitude, plantation.longitude)
+            self.assertAlmostEqual(distance, attendu, places=3)
+        self.assertEqual([nom for nom, _ in self.proches(rayon=8.1)], ['Proche', 'Loin', 'Juste dehors'])
+        self.assertEqual([nom for nom, _ in self.proches(rayon=10)], ['Proche', 'Loin', 'Juste dehors', 'Coin'])
+        self.assertEqual(self.proches(rayon=0), [])
+
+    def test_parametres_invalides_en_400(self):
+        for params in [
+            {'rayon': 'nan'}, {'rayon': 'inf'}, {'rayon': '-1'},
+            {'lat': 'nan'}, {'lon': '-inf'}, {'lat': '91'}, {'lon': '180.5'},
+        ]:
+            with self.subTest(params=params):
+                response = self.client.get(
+                    reverse('plantation-nearby'), {'lat': self.CENTRE[0], 'lon': self.CENTRE[1], **params}
+                )
+                self.assertEqual(response.status_code, 400)
+        response = self.client.get(
+            reverse('plantation-bbox'), {'min_lat': 'nan', 'min_lon': 0, 'max_lat': 10, 'max_lon': 10}
+        )
+        self.assertEqual(response.status_code, 400)
+
+
+class DistributionsTests(TestCase):
+    def setUp(self):
+        hasard = random.Random(3)
+        plantations = [
+            Plantation.objects.create(
+                nom=f'Plantation {i}', superficie=Decimal('5.00'), date_plantation=date(2015, 1, 1),
+                nombre_arbres=arbres, localisation='Zone'
+            )
+            for i, arbres in enumerate([50, 120, 0])  # sans arbre : rendement indéfini, ligne écartée
+        ]
+        for _ in range(80):
+            Production.objects.create(
+                plantation=hasard.choice(plantations), date_recolte=date(2024, hasard.randint(1, 12), 1),
+                quantite=1, poids_total=Decimal(hasard.randint(100, 99999)) / 100, qualite=hasard.choice('ABC')
+            )
+
+    def reference(self, lignes, classes, bornes=None):
+        valeurs = np.array([valeur for valeur, _ in lignes])
+        bornes = np.histogram_bin_edges(valeurs, bins=classes) if bornes is None else bornes
+        return {
+            'n': len(valeurs),
+            'min': round(valeurs.min(), 4), 'max': round(valeurs.max(), 4), 'moyenne': round(valeurs.mean(), 4),
+            **{nom: round(np.percentile(valeurs, quantile * 100), 4) for nom, quantile in distributions.QUANTILES.items()},
+            'histogramme': np.histogram(valeurs, bins=bornes)[0].tolist(),
+        }, bornes
+
+    def test_identiques_a_numpy(self):
+        response = self.client.get(reverse('production-distributions'), {'par': 'qualite', 'classes': 7})
+        self.assertEqual(response.status_code, 200)
+        productions = list(Production.objects.select_related('plantation'))
+        for metrique, lignes in [
+            ('poids_total', [(float(p.poids_total), p.qualite) for p in productions]),
+            ('rendement_par_arbre', [
+                (float(p.poids_total) / p.plantation.nombre_arbres, p.qualite)
+                for p in productions if p.plantation.nombre_arbres
+            ]),
+        ]:
+            with self.subTest(metrique=metrique):
+                resultat = response.data[metrique]
+                attendu, bornes = self.reference(lignes, 7)
+                self.assertEqual({cle: resultat[cle] for cle in attendu}, attendu)
+                self.assertEqual(resultat['bornes'], np.round(bornes, 4).tolist())
+                for groupe in resultat['groupes']:
+                    attendu, _ = self.reference([l for l in lignes if l[1] == groupe['groupe']], 7, bornes)
+                    self.assertEqual({cle: groupe[cle] for cle in attendu}, attendu)
+                self.assertEqual(sorted(g['groupe'] for g in resultat['groupes']), sorted({q for _, q in lignes}))
+
+
+class RapportAnnuelTests(TestCase):
+    def test_classeur_xlsx(self):
+        peupler(0, 2)
+        Operation.objects.create(
+            plantation=Plantation.objects.get(nom='Plantation 1'), type_operation='ENTRETIEN',
+            date=date.today() - timedelta(days=366), cout=Decimal('70.00')  # année précédente, hors rapport
+        )
+        response = self.client.get(reverse('plantation-rapport-annuel'), {'annee': date.today().year})
+        self.assertEqual(response.status_code, 200)
+        classeur = load_workbook(io.BytesIO(b''.join(response.streaming_content)), read_only=True)
+        self.assertEqual(classeur.sheetnames, list(rapports.RAPPORT_ANNUEL_SECTIONS))
+        feuilles = {nom: [list(ligne) for ligne in classeur[nom].iter_rows(values_only=True)] for nom in classeur.sheetnames}
+        for section, colonnes in rapports.RAPPORT_ANNUEL_SECTIONS.items():
+            self.assertEqual(feuilles[section][0], colonnes)
+        self.assertEqual(feuilles['operations'][1:], [
+            ['Plantation 0', 'ENTRETIEN', 1, 50], ['Plantation 1', 'ENTRETIEN', 1, 50],
+        ])
+        self.assertEqual(feuilles['recoltes'][1:], [
+            ['Plantation 0', 'A', 1, 10, 100], ['Plantation 1', 'A', 1, 10, 100],
+        ])
+        self.assertEqual(feuilles['ventes'][1:], [
+            ['Plantation 0', 'Client A', 1, 10, 20], ['Plantation 1', 'Client A', 1, 10, 20],
+        ])
+        self.assertEqual(feuilles['marges'][1:], [['Plantation 0', 50, 20, -30], ['Plantation 1', 50, 20, -30]])
+
+        # Même contenu en CSV, filtré sur une plantation
+        plantation = Plantation.objects.get(nom='Plantation 0')
+        response = self.client.get(
+            reverse('plantation-rapport-annuel'),
+            {'annee': date.today().year, 'type_fichier': 'csv', 'plantation': plantation.pk}
+        )
+        lignes = list(csv.reader(io.StringIO(b''.join(response.streaming_content).decode())))
+        self.assertEqual(lignes[-1], ['marges', 'Plantation 0', '50.00', '20.00', '-30.00'])
+        self.assertNotIn('Plantation 1', {ligne[1] for ligne in lignes})
+
+    def test_annee_hors_bornes_en_400(self):
+        for annee in ['0', '1', '10000', '-3']:
+            for type_fichier in ['xlsx', 'csv']:
+                with self.subTest(annee=annee, type_fichier=type_fichier):
+                    response = self.client.get(
+                        reverse('plantation-rapport-annuel'), {'annee': annee, 'type_fichier': type_fichier}
+                    )
+                    self.assertEqual(response.status_code, 400)
+                    self.assertFalse(response.streaming)
+
+
+class AnalysePrixTests(TestCase):
+    def test_fenetres_identiques_au_calcul_python(self):
+        hasard = random.Random(7)
+        plantation = creer_production().plantation
+        productions = {
+            qualite: Production.objects.create(
+                plantation=plantation, date_recolte=date(2022, 1, 1), quantite=1, poids_total=Decimal('100000.00'),
+                qualite=qualite
+            )
+            for qualite in 'AB'
+        }
+        ventes = []
+        for _ in range(120):
+            mois = hasard.choice([m for m in range(18) if m != 6])  # un mois sans vente dans la fenêtre
+            ventes.append(Vente.objects.create(
+                production=productions[hasard.choice('AB')],
+                date_vente=date(2023 + mois // 12, mois % 12 + 1, hasard.randint(1, 28)),
+                client=Client.obtenir(hasard.choice(['Client A', 'Client B'])),
+                quantite=Decimal(hasard.randint(1, 500)) / 10, prix_unitaire=Decimal(hasard.randint(100, 400)) / 100
+            ))
+
+        response = self.client.get(reverse('vente-analyse-prix'), {'periode': 'mois'})
+        self.assertEqual(response.status_code, 200)
+        for groupe, cle in [('qualite', lambda v: v.production.qualite), ('client', lambda v: v.client.nom)]:
+            par_periode = {}
+            for vente in ventes:
+                totaux = par_periode.setdefault((cle(vente), vente.date_vente.replace(day=1)), [0.0, 0.0])
+                totaux[0] += float(vente.montant_total)
+                totaux[1] += float(vente.quantite)
+            attendu = []
+            for valeur in sorted({valeur for valeur, _ in par_periode}):
+                periodes = sorted((periode, *totaux) for (v, periode), totaux in par_periode.items() if v == valeur)
+                for i, (periode, chiffre, quantite) in enumerate(periodes):
+                    ligne = {groupe: valeur, 'periode': periode, 'quantite_vendue': round(quantite, 2),
+                             'chiffre_affaires': round(chiffre, 2), 'prix_moyen': round(chiffre / quantite, 4)}
+                    for n in rapports.ANALYSE_PRIX_FENETRES:
+                        fenetre = periodes[max(0, i - n + 1):i + 1]
+                        ligne[f'moyenne_{n}'] = round(sum(p[1] for p in fenetre) / sum(p[2] for p in fenetre), 4)
+                    attendu.append(ligne)
+            with self.subTest(groupe=groupe):
+                self.assertEqual(response.data[groupe], attendu)
+
+
+class ComptageEstimeTests(TestCase):
+    def compter(self, queryset):
+        with CaptureQueriesContext(connection) as requetes:
+            nombre = ComptageEstimePaginator(queryset, 10).count
+        return nombre, [requete['sql'] for requete in requetes.captured_queries]
+
+    def test_count_exact_sur_sqlite_et_listes_filtrees(self):
+        peupler(0, 3)
+        nombre, requetes = self.compter(Plantation.objects.all())
+        self.assertEqual(nombre, 3)
+        self.assertIn('COUNT(*)', requetes[0])
+
+        with mock.patch.object(connection, 'vendor', 'postgresql'):
+            nombre, requetes = self.compter(Plantation.objects.filter(nom='Plantation 1'))
+        self.assertEqual(nombre, 1)
+        self.assertEqual(len(requetes), 1)
+        self.assertIn('COUNT(*)', requetes[0])
+
+    def test_estimation_postgresql_sans_filtre(self):
+        with mock.patch.object(connection, 'vendor', 'postgresql'), \
+                mock.patch.object(connection, 'cursor') as curseur:
+            curseur.return_value.__enter__.return_value.fetchone.return_value = (1234,)
+            self.assertEqual(ComptageEstimePaginator(Plantation.objects.all(), 10).count, 1234)
+        requete, parametres = curseur.return_value.__enter__.return_value.execute.call_args.args
+        self.assertIn('pg_class', requete)
+        self.assertEqual(parametres, [Plantation._meta.db_table])
+
+
+class StressVentesTests(TestCase):
+    def test_sans_survente(self):
+        sortie = io.StringIO()
+        creation = serializers.VenteSerializer.create
+        with mock.patch.object(serializers.VenteSerializer, 'create', autospec=True, side_effect=creation) as espion:
+            call_command('stress_ventes', threads=2, ventes=5, postgres=None, stdout=sortie)
+        self.assertEqual(sortie.getvalue().count('    0 incohérence(s)'), len(stress_ventes.SCENARIOS))
+        self.assertIn('Aucune survente', sortie.getvalue())
+        # Les ventes passent par l'API et son sérialiseur, sur la base du stress et non sur celle des tests
+        self.assertTrue(espion.called)
+        self.assertFalse(Vente.objects.exists())
+
+
+class ClientsTests(TestCase):
+    def vendre(self, production, client, quantite, prix='2.00', jour=None):
+        return Vente.objects.create(
+            production=production, date_vente=jour or date.today(), client=Client.obtenir(client),
+            quantite=Decimal(quantite), prix_unitaire=Decimal(prix)
+        )
+
+    def verifier_cumuls(self):
+        for client in Client.objects.all():
+            attendu = Vente.objects.filter(client=client).aggregate(
+                total=Sum('montant_total'), quantite=Sum('quantite'), nombre=Count('id'), dernier=Max('date_vente')
+            )
+            with self.subTest(client=client.nom):
+                self.assertEqual(
+                    (client.chiffre_affaires, client.quantite_totale, client.nombre_achats, client.dernier_achat),
+                    (attendu['total'] or 0, attendu['quantite'] or 0, attendu['nombre'], attendu['dernier'])
+                )
+
+    def test_cumuls_apres_chaque_ecriture(self):
+        production = creer_production()
+        hier = date.today() - timedelta(days=1)
+        premiere = self.vendre(production, 'Client A', '10.00', jour=hier)
+        seconde = self.vendre(production, '  client  a ', '5.00')
+        self.assertEqual(Client.objects.count(), 1)
+        self.verifier_cumuls()
+
+        seconde.quantite = Decimal('7.50')
+        seconde.prix_unitaire = Decimal('3.00')
+        seconde.save()
+        self.verifier_cumuls()
+
+        seconde.client = Client.obtenir('Client B')
+        seconde.save()
+        self.verifier_cumuls()
+        self.assertEqual(Client.obtenir('Client A').dernier_achat, hier)
+
+        premiere.delete()
+        self.verifier_cumuls()
+        self.assertEqual(Client.obtenir('Client A').nombre_achats, 0)
+        Vente.objects.filter(pk=seconde.pk).delete()
+        self.verifier_cumuls()
+
+    def test_top_clients_lit_les_cumuls(self):
+        production = creer_production()
+        for client, quantite in [('A', '10.00'), ('B', '30.00'), ('C', '5.00'), ('B', '1.00'), ('C', '40.00')]:
+            self.vendre(production, f'Client {client}', quantite)
+        self.vendre(production, 'Client D', '1.00').delete()  # plus aucun achat : absent du classement
+
+        reference = list(
+            Vente.objects.values('client__nom').annotate(
+                total=Sum('montant_total'), nombre=Count('id'), quantite=Sum('quantite')
+            ).order_by('-total').values_list('client__nom', 'total', 'nombre', 'quantite')
+        )
+        with CaptureQueriesContext(connection) as requetes:
+            classement = list(rapports.top_clients(Vente.objects.all()))
+        self.assertEqual(len(requetes), 1)
+        self.assertIn('"palmier_client"', requetes[0]['sql'])
+        self.assertNotIn('"palmier_vente"', requetes[0]['sql'])
+        self.assertEqual(
+            [(l['client'], l['total_achats'], l['nombre_achats'], l['quantite_totale']) for l in classement], reference
+        )
+        # Chemin filtré : somme sur les ventes retenues
+        filtre = list(rapports.top_clients(Vente.objects.filter(quantite__gte=10)))
+        self.assertEqual([l['client'] for l in filtre], ['Client C', 'Client B', 'Client A'])
+
+
+class MigrationClientsTests(TransactionTestCase):
+    """0011 : les graphies d'un même client fusionnent en une fiche, les ventes y sont rattachées."""
+    avant = [('palmier', '0010_cle_idempotence')]
+    apres = [('palmier', '0011_client')]
+
+    def setUp(self):
+        dossier = tempfile.TemporaryDirectory()
+        self.addCleanup(dossier.cleanup)
+        self.alias = 'migration_clients'
+        connections.settings[self.alias] = connections.configure_settings({'default': {}, self.alias: {
+            'ENGINE': 'palmier.backends.sqlite3', 'NAME': os.path.join(dossier.name, 'clients.sqlite3'),
+        }})[self.alias]
+        self.addCleanup(self.liberer)
+
+    def liberer(self):
+        connections[self.alias].close()
+        del connections[self.alias]
+        del connections.settings[self.alias]
+
+    def migrer(self, cible):
+        executeur = MigrationExecutor(connections[self.alias])
+        executeur.migrate(cible)
+        executeur.loader.build_graph()
+        return executeur.loader.project_state(cible).apps
+
+    def test_fusion_des_graphies(self):
+        apps = self.migrer(self.avant)
+        Plantation = apps.get_model('palmier', 'Plantation')
+        Production = apps.get_model('palmier', 'Production')
+        Vente = apps.get_model('palmier', 'Vente')
+        plantation = Plantation.objects.using(self.alias).create(
+            nom='P', superficie=Decimal('1.00'), date_plantation=date(2020, 1, 1), nombre_arbres=10, localisation='L'
+        )
+        production = Production.objects.using(self.alias).create(
+            plantation=plantation, date_recolte=date(2024, 1, 1), quantite=1, poids_total=Decimal('100.00'),
+            stock_disponible=Decimal('100.00'), qualite='A'
+        )
+        ventes = {}
+        for nom, quantite, jour in [
+            ('Socapalm', '1.00', 1), ('SOCAPALM', '2.00', 2), ('  socapalm ', '3.00', 3), ('Socapalm', '4.00', 4),
+            ('Épicerie  Mbarga', '5.00', 5), ('epicerie mbarga', '6.00', 6),
+        ]:
+            ventes[nom, jour] = Vente.objects.using(self.alias).create(
+                production=production, date_vente=date(2024, 1, jour), client=nom,
+                quantite=Decimal(quantite), prix_unitaire=Decimal('2.00'), montant_total=Decimal(quantite) * 2
+            ).pk
+
+        apps = self.migrer(self.apres)
+        Client = apps.get_model('palmier', 'Client')
+        Vente = apps.get_model('palmier', 'Vente')
+        clients = {
+            client.nom: client for client in Client.objects.using(self.alias).order_by('nom')
+        }
+        # Graphie la plus fréquente (à égalité, la plus grande) ; espaces superflus retirés
+        self.assertEqual(list(clients), ['Socapalm', 'Épicerie Mbarga'])
+        self.assertEqual(
+            [(c.chiffre_affaires, c.quantite_totale, c.nombre_achats, c.dernier_achat) for c in clients.values()],
+            [(Decimal('20.00'), Decimal('10.00'), 4, date(2024, 1, 4)), (Decimal('22.00'), Decimal('11.00'), 2, date(2024, 1, 6))]
+        )
+        rattachement = dict(Vente.objects.using(self.alias).values_list('pk', 'client__nom'))
+        self.assertEqual(
+            {nom: rattachement[pk] for (nom, _), pk in ventes.items()},
+            {'Socapalm': 'Socapalm', 'SOCAPALM': 'Socapalm', '  socapalm ': 'Socapalm',
+             'Épicerie  Mbarga': 'Épicerie Mbarga', 'epicerie mbarga': 'Épicerie Mbarga'}
+        )
+
+
+class LectureRapideTests(TestCase):
+    def test_json_identique_aux_serialiseurs(self):
+        peupler(0, 12)
+        Plantation.objects.create(
+            nom='Sans récolte', superficie=Decimal('1.50'), date_plantation=date.today(),
+            nombre_arbres=10, localisation='Zone X'
+        )
+        Production.objects.create(
+            plantation=Plantation.objects.get(nom='Plantation 3'), date_recolte=date.today(),
+            quantite=3, poids_total=Decimal('33.33'), qualite='D'
+        )
+        for nom, parametres in [
+            ('plantation-list', {}),
+            ('plantation-list', {'ordering': '-superficie', 'page': 2}),
+            ('production-list', {'qualite': 'A'}),
+            ('production-list', {'ordering': 'stock_disponible'}),
+            ('vente-list', {}),
+            ('vente-list', {'client': 'client a', 'page': 2}),
+        ]:
+            with self.subTest(route=nom, **parametres):
+                rapide = self.client.get(reverse(nom), parametres)
+                with override_settings(LECTURE_RAPIDE=False):
+                    serialiseur = self.client.get(reverse(nom), parametres)
+                self.assertEqual(rapide.status_code, 200)
+                self.assertEqual(rapide.content, serialiseur.content)
+
+
+class SeriesTests(TestCase):
+    def test_periodes_vides_completees(self):
+        for jour in (date(2024, 1, 15), date(2024, 4, 2), date(2024, 4, 30)):
+            MouvementCaisse.objects.create(date=jour, type_mouvement='ENTREE', montant=Decimal('10.00'), description='Test')
+        points = series.serie(MouvementCaisse.objects.all(), 'date', 'mois', {'total': Sum('montant'), 'nombre': Count('id')})
+        self.assertEqual([point['periode'] for point in points], [date(2024, mois, 1) for mois in (1, 2, 3, 4)])
+        self.assertEqual([point['nombre'] for point in points], [1, 0, 0, 2])
+        trimestres = series.serie(MouvementCaisse.objects.all(), 'date', 'trimestre', {'nombre': Count('id')})
+        self.assertEqual(trimestres, [{'periode': date(2024, 1, 1), 'nombre': 1}, {'periode': date(2024, 4, 1), 'nombre': 2}])
+
+    def test_lttb_garde_extremites_et_pics(self):
+        debut = date(2024, 1, 1).toordinal()
+        points = [{'periode': date.fromordinal(debut + i), 'valeur': 1000 if i == 500 else i % 7} for i in range(1000)]
+        reduits = series.lttb(points, 50, 'valeur')
+        self.assertEqual(len(reduits), 50)
+        self.assertEqual((reduits[0], reduits[-1]), (points[0], points[-1]))
+        self.assertIn(points[500], reduits)
+        self.assertEqual(reduits, sorted(reduits, key=lambda point: point['periode']))
+        self.assertEqual(series.lttb(points[:10], 50, 'valeur'), points[:10])
+
+    def test_parametres(self):
+        peupler(0, 2)
+        url = reverse('vente-statistiques-ventes')
+        response = self.client.get(url, {'granularite': 'jour', 'points_max': 3})
+        self.assertNotIn('evolution_mensuelle', response.data)
+        self.assertEqual(response.data['evolution'][0]['periode'], date.today())
+        self.assertIn('evolution_mensuelle', self.client.get(url).data)
+        for parametres in ({'granularite': 'siecle'}, {'points_max': 2}, {'points_max': 'x'}):
+            with self.subTest(**parametres):
+                self.assertEqual(self.client.get(url, parametres).status_code, 400)
+
+
+class PrevisionsTests(TestCase):
+    def historique_plat(self, nombre_mois, aujourd_hui=date(2024, 7, 15)):
+        plantation = Plantation.objects.create(
+            nom=f'Mature {nombre_mois}', superficie=Decimal('10.00'), date_plantation=date(2012, 1, 1),
+            nombre_arbres=100, localisation='Zone Test'
+        )
+        mois_courant = previsions.numero_mois(aujourd_hui)
+        for mois in range(mois_courant - nombre_mois, mois_courant):
+            Production.objects.create(
+                plantation=plantation, date_recolte=previsions.premier_jour(mois).replace(day=10),
+                quantite=10, poids_total=Decimal('100.00'), qualite='A'
+            )
+        return previsions.previsions(Plantation.objects.filter(pk=plantation.pk), 6, aujourd_hui)
+
+    def test_historique_plat_prevision_plate(self):
+        for nombre_mois in (12, 48):
+            with self.subTest(nombre_mois=nombre_mois):
+                resultat = self.historique_plat(nombre_mois)
+                for poids in resultat['plantations'][0]['poids_total']:
+                    self.assertAlmostEqual(poids, 100.0, places=1)
+
+
+class PageReactTests(TestCase):
+    def setUp(self):
+        dossier = tempfile.TemporaryDirectory()
+        self.addCleanup(dossier.cleanup)
+        self.index = os.path.join(dossier.name, 'index.html')
+        with open(self.index, 'w') as fichier:
+            fichier.write('<!doctype html><div id="root"></div>' * 50)
+        # La page React est la route attrape-tout de palmier/urls.py
+        reglages = override_settings(FRONTEND_INDEX=self.index, ROOT_URLCONF='palmier.urls')
+        reglages.enable()
+        self.addCleanup(reglages.disable)
+
+    def test_etag_et_compression(self):
+        response = self.client.get('/plantations/12', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['Cache-Control'], 'no-cache')
+        self.assertIn(b'id="root"', gzip.decompress(response.content))
+
+        response = self.client.get('/ventes', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_nouveau_build_relu(self):
+        etag = self.client.get('/').headers['ETag']
+        with open(self.index, 'w') as fichier:
+            fichier.write('<!doctype html><div id="app"></div>')
+        os.utime(self.index, ns=(0, os.stat(self.index).st_mtime_ns + 1))
+        response = self.client.get('/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, b'<!doctype html><div id="app"></div>')
+
+
+class CompressionTests(TestCase):
+    def setUp(self):
+        for i in range(5):
+            Plantation.objects.create(
+                nom=f'Plantation {i}', superficie=Decimal('10.00'), date_plantation=date(2010, 1, 1),
+                nombre_arbres=100, localisation='Zone Test ' * 20
+            )
+
+    def test_json_compresse_selon_accept_encoding(self):
+        brut = self.client.get(reverse('plantation-list'))
+        self.assertFalse(brut.has_header('Content-Encoding'))
+
+        response = self.client.get(reverse('plantation-list'), HTTP_ACCEPT_ENCODING='br;q=0, gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['Vary'].count('Accept-Encoding'), 1)
+        self.assertEqual(gzip.decompress(response.content), brut.content)
+
+    def test_petite_reponse_laissee_telle_quelle(self):
+        response = self.client.get(reverse('plantation-detail', args=[Plantation.objects.first().pk]),
+                                   HTTP_ACCEPT_ENCODING='gzip')
+        self.assertFalse(response.has_header('Content-Encoding'))
+
+    def test_export_en_flux(self):
+        parametres = {'annee': date.today().year, 'type_fichier': 'csv'}
+        brut = b''.join(self.client.get(reverse('plantation-rapport-annuel'), parametres).streaming_content)
+        response = self.client.get(reverse('plantation-rapport-annuel'), parametres, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertTrue(response.streaming)
+        self.assertEqual(gzip.decompress(b''.join(response.streaming_content)), brut)
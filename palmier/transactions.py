@@ -0,0 +1,26 @@
+from contextlib import contextmanager
+
+from django.db import transaction
+
+
+@contextmanager
+def transaction_stock(using=None):
+    """
+    Transaction pour les écritures qui modifient le stock.
+
+    Sur le backend ``palmier.backends.sqlite3``, la transaction démarre par
+    ``BEGIN IMMEDIATE``. Sur les autres bases c'est un ``atomic()`` classique,
+    le verrouillage se faisant par ``select_for_update()``.
+    """
+    connexion = transaction.get_connection(using)
+    immediate = hasattr(connexion, 'begin_immediate') and not connexion.in_atomic_block
+    if immediate:
+        connexion.begin_immediate = True
+    try:
+        with transaction.atomic(using=using):
+            if immediate:
+                connexion.begin_immediate = False
+            yield
+    finally:
+        if immediate:
+            connexion.begin_immediate = False
@@ -1,6 +1,5 @@
 from django.contrib import admin
 from django.urls import path, include, re_path
-from django.views.generic import TemplateView
 from rest_framework.routers import DefaultRouter
 from .views import (
     PlantationViewSet,
@@ -8,19 +7,26 @@ from .views import (
     ProductionViewSet,
     VenteViewSet,
     MouvementCaisseViewSet,
+    TacheRapportViewSet,
+    ClientViewSet,
     statistiques_productions
 )
+from .evenements import flux_evenements
+from .frontend import index
 
 router = DefaultRouter()
 router.register(r'plantations', PlantationViewSet)
 router.register(r'operations', OperationViewSet)
 router.register(r'productions', ProductionViewSet)
 router.register(r'ventes', VenteViewSet)
+router.register(r'clients', ClientViewSet)
 router.register(r'mouvements-caisse', MouvementCaisseViewSet)
+router.register(r'rapports', TacheRapportViewSet)
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', include(router.urls)),
     path('api/productions/statistiques/', statistiques_productions, name='statistiques_productions'),
-    re_path(r'^.*$', TemplateView.as_view(template_name='index.html')),
+    path('api/evenements/', flux_evenements, name='flux_evenements'),
+    re_path(r'^.*$', index),
 ] 
\ No newline at end of file
@@ -1,58 +1,283 @@
 from django.shortcuts import render
-from django.db.models import Sum, Avg, Count, F
-from django.db.models.functions import ExtractYear, ExtractMonth
-from rest_framework import viewsets, filters
+from django.db.models import Sum, Avg, Count, F, ExpressionWrapper, DecimalField, FloatField, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, ExtractYear, ExtractMonth
+import math
+import tempfile
+from datetime import date
+from django.utils.dateparse import parse_date
+from django.http import FileResponse, StreamingHttpResponse
+from rest_framework import viewsets, filters, mixins, status
 from rest_framework.decorators import action, api_view
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
 from django_filters import rest_framework as django_filters
-from .models import Plantation, Operation, Production, Vente, MouvementCaisse
+from .models import Plantation, Operation, Production, Vente, MouvementCaisse, TacheRapport, Client, normaliser_nom
+from .routers import sur_replica, en_lecture_replica
+from . import distributions, geo, lecture, previsions, rapports, series, taches
+from .recherche import RechercheFilter
+from .idempotence import IdempotenceMixin
+from .synchro import SynchroMixin
+from .lecture import LectureRapideMixin
 from .serializers import (
     PlantationSerializer,
     OperationSerializer,
     ProductionSerializer,
     VenteSerializer,
-    MouvementCaisseSerializer
+    MouvementCaisseSerializer,
+    TacheRapportSerializer,
+    ClientSerializer
 )
 
 # Create your views here.
 
-class PlantationViewSet(viewsets.ModelViewSet):
+def parametres_distribution(request):
+    """``(groupe, classes, annee)`` des actions ``distributions``."""
+    groupe = request.query_params.get('par') or None
+    if groupe is not None and groupe not in distributions.GROUPES:
+        raise ValidationError({'par': f"Valeurs possibles : {', '.join(distributions.GROUPES)}"})
+    try:
+        classes = int(request.query_params.get('classes', distributions.CLASSES_DEFAUT))
+        annee = request.query_params.get('annee')
+        annee = int(annee) if annee else None
+    except ValueError:
+        raise ValidationError({'detail': "Les classes et l'année doivent être des entiers"})
+    return groupe, max(1, min(classes, distributions.CLASSES_MAX)), annee
+
+def parametres_serie(request):
+    """``(granularite, points_max)`` des actions statistiques (voir palmier.series)."""
+    granularite = request.query_params.get('granularite') or None
+    if granularite is not None and granularite not in series.GRANULARITES:
+        raise ValidationError({'granularite': f"Valeurs possibles : {', '.join(series.GRANULARITES)}"})
+    points_max = request.query_params.get('points_max') or None
+    if points_max is not None:
+        try:
+            points_max = int(points_max)
+        except ValueError:
+            points_max = 0
+        if points_max < series.POINTS_MIN:
+            raise ValidationError({'points_max': f"Entier supérieur ou égal à {series.POINTS_MIN} attendu"})
+    return granularite, points_max
+
+def parametres_periode(request):
+    """``(date_debut, date_fin)`` en dates (``None`` si absentes) ; 400 si l'une n'est pas AAAA-MM-JJ."""
+    bornes = []
+    for nom in ('date_debut', 'date_fin'):
+        valeur = request.query_params.get(nom) or None
+        try:
+            borne = parse_date(valeur) if valeur else None
+        except ValueError:
+            borne = None  # format reconnu mais date impossible (2024-02-30)
+        if valeur and borne is None:
+            raise ValidationError({nom: 'Date au format AAAA-MM-JJ attendue'})
+        bornes.append(borne)
+    return tuple(bornes)
+
+def _agregat_par_plantation(model, agregat, output_field=IntegerField()):
+    """Sous-requête corrélée : ``agregat`` sur les lignes de ``model`` de la plantation."""
+    return Coalesce(
+        Subquery(
+            model.objects.filter(plantation=OuterRef('pk')).order_by().values('plantation').annotate(
+                valeur=agregat
+            ).values('valeur')
+        ),
+        Value(0),
+        output_field=output_field
+    )
+
+class PlantationViewSet(IdempotenceMixin, LectureRapideMixin, SynchroMixin, viewsets.ModelViewSet):
     queryset = Plantation.objects.all()
     serializer_class = PlantationSerializer
-    filter_backends = [filters.SearchFilter, filters.OrderingFilter]
+    lecture_rapide = lecture.PLANTATIONS
+    filter_backends = [RechercheFilter, filters.OrderingFilter]
     search_fields = ['nom', 'localisation']
     ordering_fields = ['nom', 'date_plantation', 'superficie', 'nombre_arbres']
 
+    def get_queryset(self):
+        # Compteurs lus par PlantationSerializer : calculés dans la requête de la liste
+        return super().get_queryset().annotate(
+            nombre_operations=_agregat_par_plantation(Operation, Count('pk')),
+            nombre_productions=_agregat_par_plantation(Production, Count('pk')),
+            poids_productions=_agregat_par_plantation(
+                Production, Sum('poids_total'), DecimalField(max_digits=14, decimal_places=2)
+            ),
+        )
+
     @action(detail=True, methods=['get'])
+    @sur_replica
     def statistiques(self, request, pk=None):
         plantation = self.get_object()
-        operations = Operation.objects.filter(plantation=plantation)
-        productions = Production.objects.filter(plantation=plantation)
-        ventes = Vente.objects.filter(production__plantation=plantation)
-        
-        stats = {
-            'total_cout_operations': operations.aggregate(total=Sum('cout'))['total'] or 0,
-            'total_production': productions.aggregate(total=Sum('poids_total'))['total'] or 0,
-            'nombre_operations': operations.count(),
-            'nombre_productions': productions.count(),
-            'rendement_moyen': (productions.aggregate(avg=Avg('poids_total'))['avg'] or 0) / plantation.nombre_arbres,
-            'chiffre_affaires': ventes.aggregate(total=Sum('montant_total'))['total'] or 0,
-            'qualite_productions': {
-                qualite: productions.filter(qualite=qualite).count()
-                for qualite, _ in Production.QUALITE_CHOICES
-            }
-        }
-        
-        return Response(stats)
+        stats = rapports.statistiques_plantations(Plantation.objects.filter(pk=plantation.pk))
+        return Response(stats[plantation.pk])
+
+    @action(detail=False, methods=['get'], url_path='statistiques')
+    @sur_replica
+    def statistiques_plantations(self, request):
+        """Statistiques de chaque plantation (``?ids=1,2,3``), en un nombre fixe de requêtes."""
+        queryset = self.filter_queryset(self.get_queryset())
+        if request.query_params.get('ids'):
+            try:
+                ids = [int(pk) for pk in request.query_params['ids'].split(',')]
+            except ValueError:
+                raise ValidationError({'ids': "Liste d'identifiants séparés par des virgules attendue"})
+            queryset = queryset.filter(pk__in=ids)
+        plantations = list(queryset.values_list('pk', 'nom'))
+        stats = rapports.statistiques_plantations(Plantation.objects.filter(pk__in=[pk for pk, _ in plantations]))
+        return Response([
+            {'plantation': pk, 'plantation_nom': nom, **stats[pk]}
+            for pk, nom in plantations
+        ])
+
+    @action(detail=False, methods=['get'])
+    @sur_replica
+    def rentabilite(self, request):
+        """Classement des plantations par marge : ``?date_debut=&date_fin=&tri=-marge_par_hectare``."""
+        tri = request.query_params.get('tri', '-marge')
+        if tri.lstrip('-') not in rapports.RENTABILITE_TRIS:
+            return Response(
+                {'detail': f"tri doit être l'un de : {', '.join(rapports.RENTABILITE_TRIS)} (préfixe - pour décroissant)"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        date_debut, date_fin = parametres_periode(request)
+        return Response(rapports.rentabilite_plantations(
+            self.filter_queryset(self.get_queryset()),
+            date_debut=date_debut,
+            date_fin=date_fin,
+            tri=tri
+        ))
 
-class OperationViewSet(viewsets.ModelViewSet):
-    queryset = Operation.objects.all()
+    def _reponse_zone(self, plantations, **zone):
+        production = Production.objects.filter(plantation__in=[p.pk for p in plantations]).aggregate(
+            total_production=Sum('poids_total'),
+            stock_disponible=Sum('stock_disponible'),
+            nombre_recoltes=Count('id')
+        )
+        return Response({
+            **zone,
+            'nombre_plantations': len(plantations),
+            'superficie_totale': sum(p.superficie for p in plantations),
+            'production': {cle: valeur or 0 for cle, valeur in production.items()},
+            'plantations': self.get_serializer(plantations, many=True).data,
+        })
+
+    @action(detail=False, methods=['get'])
+    @sur_replica
+    def nearby(self, request):
+        """Plantations à moins de ``rayon`` km (10 par défaut) de ``lat``/``lon``."""
+        try:
+            latitude = float(request.query_params['lat'])
+            longitude = float(request.query_params['lon'])
+            rayon = float(request.query_params.get('rayon', 10))
+        except (KeyError, ValueError):
+            return Response(
+                {'detail': "Paramètres attendus : lat, lon et éventuellement rayon (km)"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        # float() accepte nan et inf, que la boîte et les cellules geohash ne savent pas borner
+        if not (geo.coordonnees_valides(latitude, longitude) and math.isfinite(rayon) and rayon >= 0):
+            return Response(
+                {'detail': "lat entre -90 et 90, lon entre -180 et 180, rayon fini et positif attendus"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        candidates = geo.filtrer_boite(self.get_queryset(), *geo.boite_autour(latitude, longitude, rayon))
+        plantations = []
+        for plantation in candidates:
+            plantation.distance_km = geo.distance_km(latitude, longitude, plantation.latitude, plantation.longitude)
+            if plantation.distance_km <= rayon:
+                plantations.append(plantation)
+        plantations.sort(key=lambda p: p.distance_km)
+
+        response = self._reponse_zone(plantations, centre={'lat': latitude, 'lon': longitude}, rayon_km=rayon)
+        for data, plantation in zip(response.data['plantations'], plantations):
+            data['distance_km'] = round(plantation.distance_km, 3)
+        return response
+
+    @action(detail=False, methods=['get'])
+    @sur_replica
+    def bbox(self, request):
+        """Plantations dans la boîte ``?min_lat=&min_lon=&max_lat=&max_lon=``."""
+        try:
+            boite = [float(request.query_params[cle]) for cle in ('min_lat', 'min_lon', 'max_lat', 'max_lon')]
+        except (KeyError, ValueError):
+            return Response(
+                {'detail': "Paramètres attendus : min_lat, min_lon, max_lat, max_lon"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if not (geo.coordonnees_valides(*boite[:2]) and geo.coordonnees_valides(*boite[2:])):
+            return Response(
+                {'detail': "Latitudes entre -90 et 90 et longitudes entre -180 et 180 attendues"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        plantations = sorted(geo.filtrer_boite(self.get_queryset(), *boite), key=lambda p: p.nom)
+        return self._reponse_zone(plantations, boite=dict(zip(('min_lat', 'min_lon', 'max_lat', 'max_lon'), boite)))
+
+    @action(detail=False, methods=['get'])
+    @sur_replica
+    def previsions(self, request):
+        """Récoltes prévues mois par mois : ``?horizon=6&plantation=1&plantation=2``."""
+        try:
+            horizon = int(request.query_params.get('horizon', 6))
+            ids = [int(pk) for pk in request.query_params.getlist('plantation')]
+        except ValueError:
+            return Response(
+                {'detail': "L'horizon et les plantations doivent être des entiers"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        queryset = self.filter_queryset(self.get_queryset())
+        if ids:
+            queryset = queryset.filter(pk__in=ids)
+        return Response(previsions.previsions(queryset, horizon))
+
+    @action(detail=False, methods=['get'])
+    @sur_replica
+    def rapport_annuel(self, request):
+        """Rapport annuel par plantation : ``?annee=2024&plantation=1&type_fichier=xlsx|csv``."""
+        try:
+            annee = int(request.query_params.get('annee', date.today().year))
+            plantations = [int(pk) for pk in request.query_params.getlist('plantation')]
+        except ValueError:
+            return Response(
+                {'detail': "L'année et les plantations doivent être des entiers"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        # Vérifiée avant tout envoi : en CSV, l'erreur surviendrait au milieu de la réponse en flux
+        if not rapports.PIVOT_ANNEE_MIN <= annee <= rapports.PIVOT_ANNEE_MAX:
+            return Response(
+                {'detail': f"L'année doit être comprise entre {rapports.PIVOT_ANNEE_MIN} et {rapports.PIVOT_ANNEE_MAX}"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        type_fichier = request.query_params.get('type_fichier', 'xlsx')
+        nom_fichier = f'rapport_annuel_{annee}.{type_fichier}'
+
+        if type_fichier == 'csv':
+            response = StreamingHttpResponse(
+                en_lecture_replica(rapports.rapport_annuel_csv(annee, plantations)),
+                content_type='text/csv; charset=utf-8'
+            )
+            response['Content-Disposition'] = f'attachment; filename="{nom_fichier}"'
+            return response
+        if type_fichier != 'xlsx':
+            return Response(
+                {'detail': "type_fichier doit valoir 'xlsx' ou 'csv'"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        # Un .xlsx est une archive zip, complète seulement à la fin : le classeur est assemblé
+        # sur disque (pas en mémoire) avant l'envoi. Pour un envoi au fil de l'eau : type_fichier=csv
+        fichier = tempfile.TemporaryFile()
+        rapports.rapport_annuel_xlsx(fichier, annee, plantations)
+        fichier.seek(0)
+        return FileResponse(fichier, as_attachment=True, filename=nom_fichier)
+
+class OperationViewSet(IdempotenceMixin, SynchroMixin, viewsets.ModelViewSet):
+    queryset = Operation.objects.select_related('plantation')
     serializer_class = OperationSerializer
-    filter_backends = [django_filters.DjangoFilterBackend, filters.OrderingFilter]
+    filter_backends = [django_filters.DjangoFilterBackend, RechercheFilter, filters.OrderingFilter]
     filterset_fields = ['plantation', 'type_operation']
+    search_fields = ['description']
     ordering_fields = ['date', 'cout']
 
     @action(detail=False, methods=['get'])
+    @sur_replica
     def statistiques_mensuelles(self, request):
         annee = request.query_params.get('annee', None)
         queryset = self.get_queryset()
@@ -70,15 +295,35 @@ class OperationViewSet(viewsets.ModelViewSet):
         
         return Response(stats)
 
-class ProductionViewSet(viewsets.ModelViewSet):
-    queryset = Production.objects.all()
+    @action(detail=False, methods=['get'])
+    @sur_replica
+    def pivot(self, request):
+        """Coûts mois × type d'opération avec comparaison à l'année précédente."""
+        try:
+            annee = int(request.query_params.get('annee', date.today().year))
+        except ValueError:
+            return Response({'detail': "L'année doit être un entier"}, status=status.HTTP_400_BAD_REQUEST)
+        if not rapports.PIVOT_ANNEE_MIN <= annee <= rapports.PIVOT_ANNEE_MAX:
+            return Response(
+                {'detail': f"L'année doit être comprise entre {rapports.PIVOT_ANNEE_MIN} et {rapports.PIVOT_ANNEE_MAX}"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        queryset = self.filter_queryset(self.get_queryset())
+        par_plantation = request.query_params.get('par_plantation') in ('1', 'true')
+        return Response(rapports.pivot_operations(queryset, annee, par_plantation))
+
+class ProductionViewSet(IdempotenceMixin, LectureRapideMixin, SynchroMixin, viewsets.ModelViewSet):
+    queryset = Production.objects.select_related('plantation')
     serializer_class = ProductionSerializer
+    lecture_rapide = lecture.PRODUCTIONS
     filter_backends = [django_filters.DjangoFilterBackend, filters.OrderingFilter]
     filterset_fields = ['plantation', 'qualite']
     ordering_fields = ['date_recolte', 'poids_total', 'stock_disponible']
 
     @action(detail=False, methods=['get'], url_path='statistiques')
+    @sur_replica
     def statistiques_globales(self, request):
+        granularite, points_max = parametres_serie(request)
         queryset = self.get_queryset()
         stats = {
             'total_poids': queryset.aggregate(total=Sum('poids_total'))['total'] or 0,
@@ -105,13 +350,24 @@ class ProductionViewSet(viewsets.ModelViewSet):
                 stock_disponible__lt=F('poids_total') * 0.2  # Moins de 20% de stock
             ).values('plantation__nom', 'date_recolte', 'stock_disponible', 'poids_total')
         }
+        if granularite or points_max:
+            del stats['evolution_mensuelle']
+            stats['evolution'] = series.evolution(queryset, 'date_recolte', {
+                'total_production': Sum('poids_total'),
+                'stock_disponible': Sum('stock_disponible'),
+                'nombre_recoltes': Count('id'),
+            }, granularite, points_max)
         return Response(stats)
 
     @action(detail=False, methods=['get'])
+    @sur_replica
     def alertes_stock(self, request):
         seuil = float(request.query_params.get('seuil', 20))  # Seuil en pourcentage
         alertes = self.get_queryset().annotate(
-            pourcentage_stock=F('stock_disponible') * 100.0 / F('poids_total')
+            pourcentage_stock=ExpressionWrapper(
+                F('stock_disponible') * 100.0 / F('poids_total'),
+                output_field=FloatField()
+            )
         ).filter(
             pourcentage_stock__lt=seuil,
             stock_disponible__gt=0  # Exclure les stocks épuisés
@@ -126,84 +382,166 @@ class ProductionViewSet(viewsets.ModelViewSet):
         )
         return Response(alertes)
 
-class VenteViewSet(viewsets.ModelViewSet):
-    queryset = Vente.objects.all()
+    @action(detail=False, methods=['get'])
+    @sur_replica
+    def distributions(self, request):
+        """Percentiles et histogrammes du rendement par arbre et du poids des récoltes (``?par=qualite``)."""
+        groupe, classes, annee = parametres_distribution(request)
+        queryset = self.filter_queryset(self.get_queryset())
+        if annee:
+            queryset = queryset.filter(date_recolte__year=annee)
+        return Response(distributions.distributions(
+            queryset,
+            {
+                'rendement_par_arbre': distributions.rendement_par_arbre(),
+                'poids_total': distributions.en_flottant('poids_total'),
+            },
+            groupe, classes,
+            champ_plantation='plantation_id', champ_qualite='qualite', champ_date='date_recolte'
+        ))
+
+class VenteFilter(django_filters.FilterSet):
+    # ?client=<nom>, à l'orthographe près, comme avant la fiche Client
+    client = django_filters.CharFilter(method='filtrer_client')
+
+    class Meta:
+        model = Vente
+        fields = ['production__plantation', 'client']
+
+    def filtrer_client(self, queryset, name, value):
+        return queryset.filter(client__nom_normalise=normaliser_nom(value))
+
+class VenteViewSet(IdempotenceMixin, LectureRapideMixin, SynchroMixin, viewsets.ModelViewSet):
+    queryset = Vente.objects.select_related('client', 'production__plantation')
     serializer_class = VenteSerializer
-    filter_backends = [django_filters.DjangoFilterBackend, filters.OrderingFilter]
-    filterset_fields = ['production__plantation', 'client']
+    lecture_rapide = lecture.VENTES
+    filter_backends = [django_filters.DjangoFilterBackend, RechercheFilter, filters.OrderingFilter]
+    filterset_class = VenteFilter
+    search_fields = ['client__nom']
     ordering_fields = ['date_vente', 'montant_total']
 
     @action(detail=False, methods=['get'])
+    @sur_replica
     def statistiques_ventes(self, request):
-        stats = {
-            'chiffre_affaires_total': self.get_queryset().aggregate(
-                total=Sum('montant_total')
-            )['total'] or 0,
-            'prix_moyen_kg': self.get_queryset().aggregate(
-                prix_moyen=Sum('montant_total') / Sum('quantite')
-            )['prix_moyen'] or 0,
-            'evolution_mensuelle': self.get_queryset().annotate(
-                mois=ExtractMonth('date_vente'),
-                annee=ExtractYear('date_vente')
-            ).values('annee', 'mois').annotate(
-                chiffre_affaires=Sum('montant_total'),
-                quantite_vendue=Sum('quantite')
-            ).order_by('annee', 'mois'),
-            'top_clients': self.get_queryset().values('client').annotate(
-                total_achats=Sum('montant_total'),
-                nombre_achats=Count('id'),
-                quantite_totale=Sum('quantite')
-            ).order_by('-total_achats')[:5],
-            'repartition_stock': Production.objects.annotate(
-                pourcentage_stock=F('stock_disponible') * 100.0 / F('poids_total')
-            ).values('plantation__nom').annotate(
-                stock_total=Sum('stock_disponible'),
-                production_totale=Sum('poids_total'),
-                pourcentage_moyen=Avg('pourcentage_stock')
-            )
-        }
-        return Response(stats)
+        granularite, points_max = parametres_serie(request)
+        return Response(rapports.statistiques_ventes(self.get_queryset(), granularite, points_max))
+
+    @action(detail=False, methods=['get'])
+    @sur_replica
+    def analyse_prix(self, request):
+        """Prix moyen et moyennes glissantes 3/12 périodes : ``?periode=semaine|mois&par=qualite|client``."""
+        periode = request.query_params.get('periode', 'mois')
+        if periode not in rapports.ANALYSE_PRIX_PERIODES:
+            raise ValidationError({'periode': f"Valeurs possibles : {', '.join(rapports.ANALYSE_PRIX_PERIODES)}"})
+        groupe = request.query_params.get('par') or None
+        if groupe is not None and groupe not in rapports.ANALYSE_PRIX_GROUPES:
+            raise ValidationError({'par': f"Valeurs possibles : {', '.join(rapports.ANALYSE_PRIX_GROUPES)}"})
+        date_debut, date_fin = parametres_periode(request)
+        queryset = self.filter_queryset(self.get_queryset())
+        if date_debut:
+            queryset = queryset.filter(date_vente__gte=date_debut)
+        if date_fin:
+            queryset = queryset.filter(date_vente__lte=date_fin)
+        return Response(rapports.analyse_prix(
+            queryset, periode, [groupe] if groupe else rapports.ANALYSE_PRIX_GROUPES
+        ))
+
+    @action(detail=False, methods=['get'])
+    @sur_replica
+    def distributions(self, request):
+        """Percentiles et histogramme du prix unitaire (``?par=plantation|qualite|mois``)."""
+        groupe, classes, annee = parametres_distribution(request)
+        queryset = self.filter_queryset(self.get_queryset())
+        if annee:
+            queryset = queryset.filter(date_vente__year=annee)
+        return Response(distributions.distributions(
+            queryset,
+            {'prix_unitaire': distributions.en_flottant('prix_unitaire')},
+            groupe, classes,
+            champ_plantation='production__plantation_id',
+            champ_qualite='production__qualite',
+            champ_date='date_vente'
+        ))
 
-class MouvementCaisseViewSet(viewsets.ModelViewSet):
+class MouvementCaisseViewSet(IdempotenceMixin, SynchroMixin, viewsets.ModelViewSet):
     queryset = MouvementCaisse.objects.all()
     serializer_class = MouvementCaisseSerializer
-    filter_backends = [django_filters.DjangoFilterBackend, filters.OrderingFilter]
+    filter_backends = [django_filters.DjangoFilterBackend, RechercheFilter, filters.OrderingFilter]
     filterset_fields = ['type_mouvement']
+    search_fields = ['description']
     ordering_fields = ['date', 'montant']
 
     @action(detail=False, methods=['get'])
+    @sur_replica
     def bilan(self, request):
-        queryset = self.get_queryset()
-        date_debut = request.query_params.get('date_debut', None)
-        date_fin = request.query_params.get('date_fin', None)
+        granularite, points_max = parametres_serie(request)
+        date_debut, date_fin = parametres_periode(request)
+        stats = rapports.bilan_caisse(
+            self.get_queryset(),
+            date_debut=date_debut,
+            date_fin=date_fin,
+            granularite=granularite,
+            points_max=points_max
+        )
+        return Response(stats)
 
-        if date_debut:
-            queryset = queryset.filter(date__gte=date_debut)
-        if date_fin:
-            queryset = queryset.filter(date__lte=date_fin)
+class ClientViewSet(viewsets.ReadOnlyModelViewSet):
+    """Clients et cumuls d'achats ; les fiches sont créées à la saisie des ventes."""
+    queryset = Client.objects.all()
+    serializer_class = ClientSerializer
+    filter_backends = [RechercheFilter, filters.OrderingFilter]
+    search_fields = ['nom']
+    ordering_fields = ['nom', 'chiffre_affaires', 'quantite_totale', 'nombre_achats', 'dernier_achat']
 
-        entrees = queryset.filter(type_mouvement='ENTREE')
-        sorties = queryset.filter(type_mouvement='SORTIE')
-        
-        total_entrees = entrees.aggregate(total=Sum('montant'))['total'] or 0
-        total_sorties = sorties.aggregate(total=Sum('montant'))['total'] or 0
-        
-        stats = {
-            'total_entrees': total_entrees,
-            'total_sorties': total_sorties,
-            'solde': total_entrees - total_sorties,
-            'evolution_mensuelle': queryset.annotate(
-                mois=ExtractMonth('date'),
-                annee=ExtractYear('date')
-            ).values('annee', 'mois', 'type_mouvement').annotate(
-                total=Sum('montant'),
-                nombre=Count('id')
-            ).order_by('annee', 'mois', 'type_mouvement')
-        }
-        
-        return Response(stats)
+    @action(detail=True, methods=['get'])
+    def ventes(self, request, pk=None):
+        """Historique des achats du client, du plus récent au plus ancien."""
+        client = self.get_object()
+        ventes = Vente.objects.filter(client=client).select_related(
+            'client', 'production__plantation'
+        ).order_by('-date_vente', '-id')
+        page = self.paginate_queryset(ventes)
+        if page is not None:
+            serializer = VenteSerializer(page, many=True, context=self.get_serializer_context())
+            return self.get_paginated_response(serializer.data)
+        return Response(VenteSerializer(ventes, many=True, context=self.get_serializer_context()).data)
+
+class TacheRapportViewSet(mixins.CreateModelMixin,
+                         mixins.RetrieveModelMixin,
+                         mixins.ListModelMixin,
+                         viewsets.GenericViewSet):
+    """
+    Rapports lourds exécutés en arrière-plan : POST pour soumettre,
+    GET pour suivre le statut, puis ``telecharger`` pour récupérer le fichier.
+    """
+    queryset = TacheRapport.objects.all()
+    serializer_class = TacheRapportSerializer
+    filter_backends = [django_filters.DjangoFilterBackend]
+    filterset_fields = ['type_rapport', 'statut']
+
+    def create(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        tache = taches.soumettre(
+            serializer.validated_data['type_rapport'],
+            serializer.validated_data.get('parametres')
+        )
+        data = self.get_serializer(tache).data
+        headers = {'Location': request.build_absolute_uri(f'{tache.pk}/')}
+        return Response(data, status=status.HTTP_202_ACCEPTED, headers=headers)
+
+    @action(detail=True, methods=['get'])
+    def telecharger(self, request, pk=None):
+        tache = self.get_object()
+        if tache.statut != 'TERMINEE':
+            return Response(
+                {'detail': f"Le rapport n'est pas disponible (statut : {tache.get_statut_display()})"},
+                status=status.HTTP_409_CONFLICT
+            )
+        return FileResponse(tache.fichier.open('rb'), as_attachment=True, filename=tache.fichier.name.split('/')[-1])
 
 @api_view(['GET'])
+@sur_replica
 def statistiques_productions(request):
     total_poids = Production.objects.aggregate(total=Sum('poids_total'))['total'] or 0
     total_regimes = Production.objects.aggregate(total=Sum('quantite'))['total'] or 0